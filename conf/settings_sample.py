@@ -11,6 +11,22 @@ LOGGING_LEVEL = logging.INFO
 # CPU Cores for parallel computation (workflow multi-folder view)
 NCSIZE = cpu_count()
 
+# Memory budget (in bytes) for Max/Min/Mean, SynchMax and Arrival/Duration computations (workflow multi-folder view)
+# The nodes are processed by chunks if the estimated memory exceeds the budget, None to process all nodes at once
+MEMORY_BUDGET = None
+
+# Memory cap (in bytes) of the mesh triangles and spatial indexes kept by every process (workflow multi-folder view)
+# The meshes shared by several files are built only once per process, the least recently used are evicted first
+MESH_CACHE_SIZE = 512 * 1024 ** 2
+
+# Memory budget (in bytes) shared by the simultaneous tasks of the workflow multi-folder view
+# A task waits while its estimated peak memory does not fit in the remaining budget, None for no limit
+WORKERS_MEMORY_BUDGET = None
+
+# Directory of the workflow result cache, where the output file of every task is recorded with a hash of its inputs
+# An unchanged task reuses its recorded output on the next run, None to disable the cache
+RESULT_CACHE_DIR = None
+
 # ~> SERAFIN
 
 # Serafin extensions for file name filtering (default extension is the first)
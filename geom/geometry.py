@@ -95,6 +95,31 @@ class Polyline:
     def bounds(self):
         return self._polyline.bounds
 
+    def contains_points(self, x, y):
+        """!
+        @brief (Used in polygon-mesh overlay) Vectorized point-in-polygon test by ray casting
+        @param x <numpy.1D-array>: The x coordinates of the points
+        @param y <numpy.1D-array>: The y coordinates of the points
+        @return <numpy.1D-array>: True for the points inside the polygon (the result is arbitrary on the boundary)
+        """
+        coords = np.array(self.coords())[:, :2]
+        inside = np.zeros(x.shape, dtype=bool)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for (x1, y1), (x2, y2) in zip(coords[:-1], coords[1:]):
+                crosses = (y1 > y) != (y2 > y)
+                x_intersection = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+                inside ^= np.logical_and(crosses, x < x_intersection)
+        return inside
+
+    def segment_bounds(self):
+        """!
+        @brief Return the bounding boxes of all segments
+        @return <[tuple]>: The list of (left, bottom, right, top) of every segment
+        """
+        coords = np.array(self.coords())[:, :2]
+        lower, upper = np.minimum(coords[:-1], coords[1:]), np.maximum(coords[:-1], coords[1:])
+        return [(x_min, y_min, x_max, y_max) for (x_min, y_min), (x_max, y_max) in zip(lower, upper)]
+
     def length(self):
         return self._polyline.length
 
@@ -105,6 +130,8 @@ class Polyline:
         @return <bool, shapely.geometry.Polygon or shapely.geometry.Multipolygon>: The intersection with the triangle
         """
         inter = self._polyline.intersection(triangle)
+        if inter.is_empty:
+            return False, None
         if inter.geom_type == 'Polygon' or inter.geom_type == 'MultiPolygon':
             return True, inter
         elif inter.geom_type == 'GeometryCollection':
@@ -123,6 +150,8 @@ class Polyline:
         @return <bool, shapely.geometry.Polygon or shapely.geometry.Multipolygon>: The difference between triangle and polygon
         """
         diff = triangle.difference(polygon.polyline())
+        if diff.is_empty:
+            return False, None
         if diff.geom_type == 'Polygon' or diff.geom_type == 'MultiPolygon':
             return True, diff
         elif diff.geom_type == 'GeometryCollection':
@@ -4,6 +4,7 @@ from PyQt5.QtWidgets import *
 import struct
 import sys
 
+from conf.settings import NCSIZE
 from geom import Shapefile
 from gui.util import OutputProgressDialog, OutputThread, TelToolWidget, test_open
 from slf.datatypes import SerafinData
@@ -13,10 +14,11 @@ from workflow.util import MultiLoadSerafinDialog, MultiSaveDialog, process_outpu
 
 
 class WriteVariableThread(OutputThread):
-    def __init__(self, pool, selected_expressions, selected_names, output_names, overwrite):
+    def __init__(self, pool, selected_expressions, selected_names, output_names, overwrite, ncsize=NCSIZE):
         super().__init__()
         self.pool = pool
         self.inv_nb_files = 1 / pool.nb_pools
+        self.ncsize = ncsize
 
         self.selected_expressions = selected_expressions
         self.augmented_path = self.pool.build_augmented_path(self.selected_expressions)
@@ -44,7 +46,23 @@ class WriteVariableThread(OutputThread):
                     self.tick.emit(100 * i * self.inv_nb_files * inv_nb_frames)
                     QApplication.processEvents()
 
+    def run_parallel(self):
+        jobs = self.pool.parallel_jobs(self.selected_expressions, self.selected_names,
+                                       self.output_names, self.overwrite)
+        def is_canceled():
+            # the thread runs in the GUI thread: the events (Cancel button) are processed while the workers run
+            QApplication.processEvents()
+            return self.canceled
+
+        # on cancel, the remaining workers are terminated and their unfinished outputs are removed
+        for i, _ in enumerate(self.pool.evaluate_in_parallel(jobs, self.ncsize, is_canceled)):
+            self.tick.emit(100 * (i+1) / len(jobs))
+            QApplication.processEvents()
+
     def run(self):
+        if self.ncsize > 1 and self.pool.nb_pools > 1:
+            self.run_parallel()
+            return
         for (input_name, input_header, output_header, pool), \
                 output_name in zip(self.pool.evaluate_iterator(self.selected_names), self.output_names):
             if not self.overwrite:
@@ -468,13 +468,10 @@ class ErrorEvolutionTab(QWidget):
             input_stream.time = self.input.ref_data.time
             ref_values = input_stream.read_var_in_frame(ref_time, selected_variable)
 
-        mad = []
         with Serafin.Read(self.input.test_data.filename, self.input.test_data.language) as input_stream:
             input_stream.header = self.input.test_data.header
             input_stream.time = self.input.test_data.time
-            for i in range(len(self.input.test_data.time)):
-                values = input_stream.read_var_in_frame(i, selected_variable) - ref_values
-                mad.append(self.input.ref_mesh.mean_absolute_deviation(values))
+            _, mad, _, _ = self.input.ref_mesh.error_evolution(input_stream, selected_variable, ref_values)
 
         self.plotViewer.plot(self.input.test_data.time, mad)
 
@@ -624,7 +621,7 @@ class ErrorDistributionTab(QWidget):
         self.plotViewer.canvas.draw()
 
     def updateStats(self, ref_time, test_time):
-        ewsd = np.array(list(self.ewsd.values()))
+        ewsd = self.ewsd[self.input.ref_mesh.inside]
         quantile25, median, quantile75 = np.percentile(ewsd, [25, 50, 75])
         self.resultBox.appendPlainText(self.template.format(ref_time+1, test_time+1,
                                                             np.mean(ewsd), np.var(ewsd, ddof=1),
@@ -632,9 +629,9 @@ class ErrorDistributionTab(QWidget):
                                                             quantile75, np.max(ewsd)))
 
     def updateHistogram(self):
-        ewsd = list(self.ewsd.values())
+        ewsd = self.ewsd[self.input.ref_mesh.inside]
         if self.xlim is not None:
-            ewsd = list(filter(lambda x: self.xlim[0] <= x <= self.xlim[1], ewsd))
+            ewsd = ewsd[np.logical_and(ewsd >= self.xlim[0], ewsd <= self.xlim[1])]
 
         weights = np.ones_like(ewsd) / self.input.ref_mesh.nb_triangles_inside  # make frequency histogram
 
@@ -770,7 +767,6 @@ class BSSTab(QWidget):
 
     def btnEvolutionEvent(self):
         if not self.has_figure:
-            all_bss = []
             ref_time = int(self.timeSelection.refIndex.text()) - 1
 
             init_time = int(self.initSelection.refIndex.text()) - 1
@@ -785,18 +781,8 @@ class BSSTab(QWidget):
                 input_stream.header = self.input.test_data.header
                 input_stream.time = self.input.test_data.time
                 init_values = input_stream.read_var_in_frame(init_time, selected_variable)
-                ref_volume = self.input.ref_mesh.quadratic_volume(ref_values - init_values)
-
-                for index in range(len(self.input.test_data.time)):
-                    test_values = input_stream.read_var_in_frame(index, selected_variable)
-
-                    test_volume = self.input.ref_mesh.quadratic_volume(test_values - ref_values)
-                    if test_volume == 0 and ref_volume == 0:
-                        bss = 1
-                    else:
-                        with np.errstate(divide='ignore'):
-                            bss = 1 - test_volume / ref_volume
-                    all_bss.append(bss)
+                _, _, _, all_bss = self.input.ref_mesh.error_evolution(input_stream, selected_variable,
+                                                                       ref_values, init_values)
             self.plotViewer.plot(self.input.test_data.time, all_bss)
         self.plotViewer.show()
 
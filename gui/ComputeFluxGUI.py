@@ -17,7 +17,7 @@ class FluxCalculatorThread(OutputThread):
         super().__init__()
 
         self.calculator = FluxCalculator(flux_type, var_IDs, input_stream,
-                                         section_names, sections, time_sampling_frequency)
+                                         section_names, sections, time_sampling_frequency, cumulative=True)
         self.mesh = mesh
         self.separator = separator
         self.format_string = '{0:.%df}' % digits
@@ -42,16 +42,7 @@ class FluxCalculatorThread(OutputThread):
             if self.canceled:
                 return []
 
-            i_result = [str(self.calculator.input_stream.time[time_index])]
-            values = []
-            for var_ID in self.calculator.var_IDs:
-                values.append(self.calculator.input_stream.read_var_in_frame(time_index, var_ID))
-
-            for j in range(len(self.calculator.sections)):
-                intersections = self.calculator.intersections[j]
-                flux = self.calculator.flux_in_frame(intersections, values)
-                i_result.append(self.format_string.format(flux))
-
+            i_result = self.calculator.run_in_frame(time_index, self.format_string)
             result.append(i_result)
             self.tick.emit(30 + int(70 * (i+1) / len(self.calculator.time_indices)))
             QApplication.processEvents()
@@ -395,7 +386,7 @@ class ImageTab(FluxPlotViewer):
         self.str_datetime = list(map(lambda x: x.strftime('%Y/%m/%d\n%H:%M'), self.datetime))
         self.str_datetime_bis = list(map(lambda x: x.strftime('%d/%m/%y\n%H:%M'), self.datetime))
 
-        self.columns = headers[1:]
+        self.columns = FluxCalculator.section_columns(headers)
         self.column_labels = {x: x for x in self.columns}
         self.column_colors = {column: color for column, color in zip(self.columns, cycle(self.defaultColors))}
 
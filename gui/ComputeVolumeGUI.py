@@ -40,19 +40,7 @@ class VolumeCalculatorThread(OutputThread):
         for i, time_index in enumerate(self.calculator.time_indices):
             if self.canceled:
                 return []
-            i_result = [str(self.calculator.input_stream.time[time_index])]
-            values = self.calculator.read_values_in_frame(time_index)
-
-            for j in range(len(self.calculator.polygons)):
-                if self.canceled:
-                    return []
-                weight = self.calculator.weights[j]
-                volume = self.calculator.volume_in_frame_in_polygon(weight, values, self.calculator.polygons[j])
-                if self.calculator.volume_type == VolumeCalculator.POSITIVE:
-                    for v in volume:
-                        i_result.append(self.format_string.format(v))
-                else:
-                    i_result.append(self.format_string.format(volume))
+            i_result = self.calculator.run_in_frame(time_index, self.format_string)
             result.append(i_result)
 
             self.tick.emit(30 + int(70 * (i+1) / len(self.calculator.time_indices)))
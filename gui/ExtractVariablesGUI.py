@@ -9,7 +9,7 @@ from gui.util import DoubleSliderBox, FrictionLawMessage, QPlainTextEditLogger,
     SettlingVelocityMessage, TableWidgetDragRows, TelToolWidget, test_open, TimeRangeSlider, \
     OutputProgressDialog, OutputThread, VariableTable
 from slf import Serafin
-from slf.variables import get_available_variables, do_calculations_in_frame, get_necessary_equations, \
+from slf.variables import CalculationPlan, get_available_variables, get_necessary_equations, \
                           get_US_equation, new_variables_from_US
 
 
@@ -26,12 +26,12 @@ class ExtractVariablesThread(OutputThread):
         self.nb_frames = len(time_indices)
 
     def run(self):
+        plan = CalculationPlan(self.necessary_equations, self.input_stream.header, self.output_header.var_IDs,
+                               self.output_header.np_float_type, self.output_header.is_2d, self.us_equation)
         for i, time_index in enumerate(self.time_indices):
             if self.canceled:
                 return
-            values = do_calculations_in_frame(self.necessary_equations, self.input_stream, time_index,
-                                              self.output_header.var_IDs, self.output_header.np_float_type,
-                                              is_2d=self.output_header.is_2d, us_equation=self.us_equation)
+            values = plan.run_in_frame(self.input_stream, time_index)
 
             self.output_stream.write_entire_frame(self.output_header, self.input_stream.time[time_index], values)
             self.tick.emit(5 + int(95 * (i+1) / self.nb_frames))
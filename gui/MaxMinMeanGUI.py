@@ -2,9 +2,9 @@ import datetime
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 import logging
-import numpy as np
 import sys
 
+from conf.settings import NCSIZE
 from gui.util import VariableTable, QPlainTextEditLogger, save_dialog, \
     OutputProgressDialog, TimeRangeSlider, SerafinInputTab, TelToolWidget, OutputThread, ConditionDialog
 import slf.misc as operations
@@ -13,91 +13,56 @@ from slf import Serafin
 
 class MaxMinMeanThread(OutputThread):
     def __init__(self, max_min_type, input_stream, selected_scalars, selected_vectors,
-                 time_indices, additional_equations):
+                 time_indices, additional_equations, ncsize=NCSIZE):
         super().__init__()
-        self.has_scalar, self.has_vector = False, False
+        specs = []
         if selected_scalars:
-            self.has_scalar = True
-            self.scalar_calculator = operations.ScalarMaxMinMeanCalculator(max_min_type, input_stream,
-                                                                           selected_scalars, time_indices)
+            specs.append((operations.ScalarMaxMinMeanCalculator,
+                          {'max_min_type': max_min_type, 'selected_scalars': selected_scalars,
+                           'additional_equations': additional_equations}))
         if selected_vectors:
-            self.has_vector = True
-            self.vector_calculator = operations.VectorMaxMinMeanCalculator(max_min_type, input_stream,
-                                                                           selected_vectors, time_indices,
-                                                                           additional_equations)
-        self.time_indices = time_indices
-        self.nb_frames = len(time_indices)
+            specs.append((operations.VectorMaxMinMeanCalculator,
+                          {'max_min_type': max_min_type, 'selected_vectors': selected_vectors,
+                           'additional_equations': additional_equations}))
+        self.reduction = operations.TimeRangeReduction(input_stream, specs, time_indices, ncsize)
 
     def run(self):
-        for i, time_index in enumerate(self.time_indices):
+        for i, _ in enumerate(self.reduction.run()):
             if self.canceled:
                 return []
-            if self.has_scalar:
-                self.scalar_calculator.max_min_mean_in_frame(time_index)
-            if self.has_vector:
-                self.vector_calculator.max_min_mean_in_frame(time_index)
-
-            self.tick.emit(int(95 * (i+1) / self.nb_frames))
+            self.tick.emit(int(95 * (i+1) / self.reduction.nb_ranges))
             QApplication.processEvents()
-
-        if self.has_scalar and not self.has_vector:
-            values = self.scalar_calculator.finishing_up()
-        elif not self.has_scalar and self.has_vector:
-            values = self.vector_calculator.finishing_up()
-        else:
-            values = np.vstack((self.scalar_calculator.finishing_up(), self.vector_calculator.finishing_up()))
-        return values
+        return self.reduction.finishing_up()
 
 
 class ArrivalDurationThread(OutputThread):
-    def __init__(self, input_stream, conditions, time_indices):
+    def __init__(self, input_stream, conditions, time_indices, ncsize=NCSIZE):
         super().__init__()
-        self.input_stream = input_stream
-        self.time_indices = time_indices
-        self.conditions = conditions
-        self.nb_conditions = len(self.conditions)
-        self.nb_frames = len(time_indices)
-        self.calculators = []
-
-        for i, condition in enumerate(self.conditions):
-            self.calculators.append(operations.ArrivalDurationCalculator(self.input_stream, self.time_indices,
-                                                                         condition))
+        specs = [(operations.MultiArrivalDurationCalculator, {'conditions': conditions})]
+        self.reduction = operations.TimeRangeReduction(input_stream, specs, time_indices, ncsize)
 
     def run(self):
-        for i, index in enumerate(self.time_indices[1:]):
+        for i, _ in enumerate(self.reduction.run()):
             if self.canceled:
                 return []
-
-            for calculator in self.calculators:
-                calculator.arrival_duration_in_frame(index)
-
-            self.tick.emit(int(95 * (i+1) / self.nb_frames))
+            self.tick.emit(int(95 * (i+1) / self.reduction.nb_ranges))
             QApplication.processEvents()
-
-        values = np.empty((2*self.nb_conditions, self.input_stream.header.nb_nodes))
-        for i, calculator in enumerate(self.calculators):
-            values[2*i, :] = calculator.arrival
-            values[2*i+1, :] = calculator.duration
-        return values
+        return self.reduction.finishing_up()
 
 
 class SynchMaxThread(OutputThread):
-    def __init__(self, input_stream, selected_vars, time_indices, var):
+    def __init__(self, input_stream, selected_vars, time_indices, var, ncsize=NCSIZE):
         super().__init__()
-        self.time_indices = time_indices
-        self.nb_frames = len(time_indices)
-        self.calculator = operations.SynchMaxCalculator(input_stream, selected_vars, time_indices, var)
+        specs = [(operations.SynchMaxCalculator, {'selected_vars': selected_vars, 'ref_var': var})]
+        self.reduction = operations.TimeRangeReduction(input_stream, specs, time_indices, ncsize)
 
     def run(self):
-        for i, time_index in enumerate(self.time_indices[1:]):
+        for i, _ in enumerate(self.reduction.run()):
             if self.canceled:
                 return []
-            self.calculator.synch_max_in_frame(time_index)
-
-            self.tick.emit(int(95 * (i+1) / self.nb_frames))
+            self.tick.emit(int(95 * (i+1) / self.reduction.nb_ranges))
             QApplication.processEvents()
-
-        return self.calculator.finishing_up()
+        return self.reduction.finishing_up()
 
 
 class TimeSelection(QWidget):
@@ -1725,7 +1725,7 @@ class ColorMapCanvas(MapCanvas):
         self.axes = self.fig.add_subplot(111)
 
         if limits is None:
-            maxval = max(np.abs(list(values.values())))
+            maxval = np.max(np.abs(values))
             xmin, xmax = -maxval, maxval
         else:
             xmin, xmax = limits
@@ -1742,16 +1742,8 @@ class ColorMapCanvas(MapCanvas):
             self.axes.set_xlim(minx - 0.05 * w, maxx + 0.05 * w)
             self.axes.set_ylim(miny - 0.05 * h, maxy + 0.05 * h)
 
-            # the color value for each triangles inside the polygon
-            colors = []
-            for i, j, k in mesh.triangles:
-                if (i, j, k) in values:
-                    colors.append(values[i, j, k])
-                else:
-                    colors.append(0)
-            colors = np.array(colors)
-        else:
-            colors = np.array([values[i, j, k] for i, j, k in mesh.triangles])
+        # the color value for each triangle (zero outside the polygon)
+        colors = values
 
         self.axes.tripcolor(mesh.x, mesh.y, mesh.ikle, facecolors=colors,
                             cmap='coolwarm', vmin=xmin, vmax=xmax,
@@ -2,17 +2,61 @@
 Read/Write Serafin files and manipulate associated data
 """
 
+from collections import OrderedDict
+from contextlib import contextmanager
 import copy
+import hashlib
 import logging
 import numpy as np
 import os
 import struct
+import threading
 
 module_logger = logging.getLogger(__name__)
 
 
 VARIABLES_2D, VARIABLES_3D = {'fr': {}, 'en': {}}, {'fr': {}, 'en': {}}
 
+# directory where the mesh arrays of the pickled headers are shared between processes (None to pickle them by value)
+MESH_CACHE_DIR = None
+MAX_ATTACHED_MESHES = 8  # number of cached meshes kept mapped in a process (the least recently used are released)
+_attached_meshes = OrderedDict()
+_local_mesh_cache = threading.local()
+
+
+def set_mesh_cache(directory):
+    """!
+    @brief Share the mesh arrays of the pickled headers through a directory instead of copying them in every message
+    @param directory <str>: the cache directory, or None to pickle the mesh arrays by value
+
+    This is a process-wide setting, meant for the worker processes owning no data outside of their tasks.
+    """
+    global MESH_CACHE_DIR
+    MESH_CACHE_DIR = directory
+    _attached_meshes.clear()
+
+
+@contextmanager
+def shared_meshes(directory):
+    """!
+    @brief Share the mesh arrays of the headers pickled in the current thread, only inside the with statement
+    @param directory <str>: the cache directory
+    """
+    previous = getattr(_local_mesh_cache, 'directory', None)
+    _local_mesh_cache.directory = directory
+    try:
+        yield
+    finally:
+        _local_mesh_cache.directory = previous
+
+
+def mesh_cache_dir():
+    """!
+    @return <str>: the directory where the pickled mesh arrays are shared in the current thread (or None)
+    """
+    directory = getattr(_local_mesh_cache, 'directory', None)
+    return MESH_CACHE_DIR if directory is None else directory
+
 
 def build_variables_table():
     base_folder = os.path.dirname(os.path.realpath(__file__))
@@ -212,6 +256,114 @@ class SerafinHeader:
     def copy(self):
         return copy.deepcopy(self)
 
+    def mesh_fingerprint(self):
+        """!
+        @brief Identify the 2D mesh by its content, to share the objects built on identical meshes
+        @return <str>: the hexadecimal digest of the 2D coordinates and connectivity table
+        """
+        arrays = (self.x, self.y, self.ikle_2d)
+        fingerprint = self.__dict__.get('_fingerprint')
+        if fingerprint is not None and all(a is b for a, b in zip(fingerprint[1], arrays)):
+            return fingerprint[0]
+        digest = hashlib.blake2b(digest_size=16)
+        for array in (self.x[:self.nb_nodes_2d], self.y[:self.nb_nodes_2d], self.ikle_2d):
+            array = np.ascontiguousarray(array)
+            digest.update(('%s%s' % (array.dtype.str, array.shape)).encode())
+            digest.update(array.data)
+        self._fingerprint = (digest.hexdigest(), arrays)
+        return digest.hexdigest()
+
+    def _mesh_array_names(self):
+        if self.is_2d:
+            return 'ikle', 'ipobo', 'x', 'y'
+        return 'ikle', 'ipobo', 'x', 'y', 'ikle_2d'
+
+    def _share_mesh(self):
+        """!
+        @brief Save the mesh arrays once in the cache directory, under a fingerprint of their content
+        @return <str>: the common path prefix of the cached arrays
+        """
+        cache_dir = mesh_cache_dir()
+        names = self._mesh_array_names()
+        arrays = tuple(getattr(self, name) for name in names)
+        shared = self.__dict__.get('_shared_mesh')
+        if shared is not None and os.path.dirname(shared[0]) == cache_dir \
+                and all(a is b for a, b in zip(shared[1], arrays)):
+            return shared[0]
+
+        fingerprint = hashlib.blake2b(digest_size=16)
+        for array in arrays:
+            array = np.ascontiguousarray(array)
+            fingerprint.update(('%s%s' % (array.dtype.str, array.shape)).encode())
+            fingerprint.update(array.data)
+        prefix = os.path.join(cache_dir, fingerprint.hexdigest())
+        for name, array in zip(names, arrays):
+            path = '%s_%s.npy' % (prefix, name)
+            if not os.path.exists(path):
+                temp_path = '%s.%d' % (path, os.getpid())
+                with open(temp_path, 'wb') as f:
+                    np.save(f, array)
+                os.replace(temp_path, path)
+        self._shared_mesh = (prefix, arrays)
+        return prefix
+
+    def _attach_mesh(self, prefix):
+        """!
+        @brief Map the cached mesh arrays (read-only, once per process)
+        @param prefix <str>: the common path prefix of the cached arrays
+
+        A process which does not share its meshes (the results returned to the GUI) loads its own copy of the arrays,
+        which remains valid after the cache directory is removed.
+        """
+        names = self._mesh_array_names()
+        if mesh_cache_dir() is None:
+            arrays = tuple(np.load('%s_%s.npy' % (prefix, name)) for name in names)
+        elif prefix in _attached_meshes:
+            arrays = _attached_meshes[prefix]
+            _attached_meshes.move_to_end(prefix)
+        else:
+            arrays = tuple(np.load('%s_%s.npy' % (prefix, name), mmap_mode='r') for name in names)
+            _attached_meshes[prefix] = arrays
+            while len(_attached_meshes) > MAX_ATTACHED_MESHES:
+                _attached_meshes.popitem(last=False)
+        for name, array in zip(names, arrays):
+            setattr(self, name, array)
+        if self.is_2d:
+            self.ikle_2d = self.ikle.reshape(self.nb_elements, self.nb_nodes_per_elem)
+        self._shared_mesh = (prefix, arrays)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_shared_mesh', None)
+        state.pop('_fingerprint', None)
+        if mesh_cache_dir() is not None:
+            state['mesh_prefix'] = self._share_mesh()
+            for name in self._mesh_array_names() + ('ikle_2d',):
+                state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        prefix = state.pop('mesh_prefix', None)
+        self.__dict__.update(state)
+        if prefix is not None:
+            self._attach_mesh(prefix)
+
+    def __copy__(self):
+        # a shallow copy sharing the mesh arrays, without the pickling state (which would save the mesh in the cache)
+        new_header = SerafinHeader.__new__(SerafinHeader)
+        new_header.__dict__.update(self.__dict__)
+        return new_header
+
+    def __deepcopy__(self, memo):
+        # an independent copy with its own (writable) mesh arrays, even with a mesh cache
+        new_header = SerafinHeader.__new__(SerafinHeader)
+        memo[id(self)] = new_header
+        state = self.__dict__.copy()
+        state.pop('_shared_mesh', None)
+        state.pop('_fingerprint', None)
+        new_header.__dict__.update(copy.deepcopy(state, memo))
+        return new_header
+
     def is_double_precision(self):
         return self.float_type == 'd'
 
@@ -273,8 +425,13 @@ class Read(Serafin):
         self.header = None
         self.time = []
         self.file_size = os.path.getsize(self.filename)
+        self.memmap = None  # opened on demand for partial reads
         module_logger.info('Reading the input file: "%s" of size %d bytes' % (filename, self.file_size))
 
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.memmap = None
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
     def read_header(self):
         """!
         @brief Read the file header and check the file consistency
@@ -323,6 +480,73 @@ class Read(Serafin):
         return np.array(struct.unpack(nb_values, self.file.read(self.header.float_size * self.header.nb_nodes)),
                         dtype=self.header.np_float_type)
 
+    def read_var_in_frame_slice(self, time_index, var_ID, start, end):
+        """!
+        @brief Read a single variable on a range of nodes in a frame, through a memory map of the file
+        @param time_index <float>: 0-based index of simulation time from the target frame
+        @param var_ID <str>: variable ID
+        @param start <int>: index of the first node
+        @param end <int>: index after the last node
+        @return <numpy 1D-array>: values of the variables, of length end - start
+        """
+        if self.memmap is None:
+            self.memmap = np.memmap(self.filename, dtype=np.uint8, mode='r')
+        pos_var = self._get_var_index(var_ID)
+        position = self.header.header_size + time_index * self.header.frame_size + 8 + self.header.float_size \
+            + pos_var * (8 + self.header.float_size * self.header.nb_nodes) + 4 + start * self.header.float_size
+        values = self.memmap[position:position + (end - start) * self.header.float_size]
+        return values.view('>%s' % self.header.float_type).astype(self.header.np_float_type)
+
+
+class NodeChunk:
+    """!
+    @brief A Serafin input stream restricted to a range of nodes, for computations which do not fit in memory
+    """
+    def __init__(self, input_stream, start, end):
+        """!
+        @param input_stream <slf.Serafin.Read>: the input stream (with header and time already read)
+        @param start <int>: index of the first node
+        @param end <int>: index after the last node
+        """
+        self.input_stream = input_stream
+        self.start = start
+        self.end = end
+        self.time = input_stream.time
+        self.header = copy.copy(input_stream.header)
+        self.header.nb_nodes = end - start
+        self.header.x = input_stream.header.x[start:end]
+        self.header.y = input_stream.header.y[start:end]
+
+    def read_var_in_frame(self, time_index, var_ID):
+        return self.input_stream.read_var_in_frame_slice(time_index, var_ID, self.start, self.end)
+
+
+class SharedFrameReader:
+    """!
+    @brief A Serafin input stream shared by several consumers looping over the same frames
+
+    Every variable is read only once per frame, the values are returned read-only to all consumers.
+    """
+    def __init__(self, input_stream):
+        """!
+        @param input_stream <slf.Serafin.Read>: the input stream (with header and time already read)
+        """
+        self.input_stream = input_stream
+        self.header = input_stream.header
+        self.time = input_stream.time
+        self.time_index = None
+        self.values = {}
+
+    def read_var_in_frame(self, time_index, var_ID):
+        if time_index != self.time_index:
+            self.time_index = time_index
+            self.values = {}
+        if var_ID not in self.values:
+            values = self.input_stream.read_var_in_frame(time_index, var_ID)
+            values.setflags(write=False)
+            self.values[var_ID] = values
+        return self.values[var_ID]
+
 
 class Write(Serafin):
     """!
@@ -405,6 +629,18 @@ class Write(Serafin):
         self.file.write(struct.pack(nb_val, *header.y))
         self.file.write(struct.pack('>i', 4 * header.nb_nodes))
 
+    def reserve_frames(self, header, nb_frames):
+        """!
+        @brief Extend the file after the written header to the size of all frames, to be written later by FrameWrite
+        @param header <slf.Serafin.SerafinHeader>: the output header
+        @param nb_frames <int>: the number of frames
+        @return <int, int>: the header size and the (constant) frame size in bytes
+        """
+        header_size = self.file.tell()
+        frame_size = 8 + header.float_size + header.nb_var * (8 + header.nb_nodes * header.float_size)
+        self.file.truncate(header_size + nb_frames * frame_size)
+        return header_size, frame_size
+
     def write_entire_frame(self, header, time_to_write, values):
         """!
         @brief write all variables/nodes values
@@ -421,3 +657,24 @@ class Write(Serafin):
             self.file.write(struct.pack(nb_values, *values[i, :]))
             self.file.write(struct.pack('>i', header.float_size * header.nb_nodes))
 
+
+
+class FrameWrite(Write):
+    """!
+    @brief Serafin output stream writing consecutive frames from a given position of a file with reserved frames
+
+    Since the frames have a constant size, several streams can write disjoint ranges of frames of the same file.
+    """
+    def __init__(self, filename, language, header_size, frame_size, first_frame):
+        """!
+        @param header_size <int>: the header size in bytes (as returned by Write.reserve_frames)
+        @param frame_size <int>: the frame size in bytes (as returned by Write.reserve_frames)
+        @param first_frame <int>: the position of the first frame to write in the output file
+        """
+        Serafin.__init__(self, filename, 'r+b', language)
+        self.position = header_size + first_frame * frame_size
+
+    def __enter__(self):
+        Serafin.__enter__(self)
+        self.file.seek(self.position)
+        return self
@@ -2,12 +2,18 @@
 Comparison between two Serafin files with identical meshes
 """
 
+import logging
+from multiprocessing import Pool, shared_memory
 import numpy as np
 
+from slf import Serafin
 from slf.interpolation import Interpolator
 from slf.volume import TruncatedTriangularPrisms
 
 
+module_logger = logging.getLogger(__name__)
+
+
 class ReferenceMesh(TruncatedTriangularPrisms):
     """!
     @brief Wrapper for computing error measures when comparing a test mesh to a reference mesh
@@ -17,61 +23,53 @@ class ReferenceMesh(TruncatedTriangularPrisms):
     """
     def __init__(self, input_header, construct_index):
         super().__init__(input_header, construct_index)
-        self.area = {}
         self.point_weight = []
+        self.element_weight = []
+        self.inside = []
         self.inverse_total_area = 1
 
         self.nb_triangles_inside = 0
         self.inside_polygon = False
         self.polygon = None
-        self.triangle_polygon_intersection = {}
+        self._element_indices = None
 
     def add_polygon(self, polygon):
         """!
-        @brief Initialize the weight on all points of the mesh depending on the comparison region
+        @brief Initialize the weight on all points and elements of the mesh depending on the comparison region
         @param polygon <geom.geometry.Polygon>: A polygon defining the comparison region or None if it is the whole mesh
+
+        The weight of an element is the integral of its three linear shape functions over the comparison region,
+        i.e. area/3 for every node of an interior triangle and area * barycentric coordinates of the centroid
+        for a boundary triangle-polygon intersection. The point weights are the sums of the element weights.
         """
-        self.area = {}
-        self.point_weight = np.zeros((self.nb_points,), dtype=np.float64)
+        self.element_weight = np.zeros((self.nb_triangles, 3), dtype=np.float64)
 
         if polygon is None:  # entire mesh
             self.inside_polygon = False
-            self.triangle_polygon_intersection = {}
-            self.nb_triangles_inside = self.nb_triangles
-            total_area = 0
-            for (i, j, k), t in self.triangles.items():
-                area = t.area
-                self.area[i, j, k] = area
-                total_area += area
-                self.point_weight[[i, j, k]] += area
+            self.inside = np.ones((self.nb_triangles,), dtype=bool)
+            self.element_weight[:] = self.triangle_areas(self.ikle)[:, np.newaxis] / 3.0
         else:
             self.inside_polygon = True
             self.polygon = polygon
-            self.nb_triangles_inside = 0
-
-            potential_elements = self.get_intersecting_elements(polygon.bounds())
-            self.point_weight = np.zeros((self.nb_points,), dtype=np.float64)
-            self.triangle_polygon_intersection = {}
-            total_area = 0
-            for i, j, k in potential_elements:
-                t = self.triangles[i, j, k]
-                if polygon.contains(t):
-                    self.nb_triangles_inside += 1
-                    area = t.area
-                    total_area += area
-                    self.point_weight[[i, j, k]] += area
-                    self.area[i, j, k] = area
-                else:
-                    is_intersected, intersection = polygon.polygon_intersection(t)
-                    if is_intersected:
-                        self.nb_triangles_inside += 1
-                        area = intersection.area
-                        total_area += area
-                        centroid = intersection.centroid
-                        interpolator = Interpolator(t).get_interpolator_at(centroid.x, centroid.y)
-                        self.triangle_polygon_intersection[i, j, k] = (area, interpolator)
-        self.point_weight /= 3.0
-        self.inverse_total_area = 1 / total_area
+            self.inside = np.zeros((self.nb_triangles,), dtype=bool)
+            if self._element_indices is None:
+                self._element_indices = {(i, j, k): index for index, (i, j, k) in enumerate(self.ikle)}
+
+            interior, boundary = self.polygon_overlay(polygon)
+            interior_indices = [self._element_indices[t] for t in interior]
+            self.inside[interior_indices] = True
+            self.element_weight[interior_indices] = self.triangle_areas(interior)[:, np.newaxis] / 3.0
+            for (i, j, k), intersection in boundary:
+                index = self._element_indices[i, j, k]
+                centroid = intersection.centroid
+                interpolator = Interpolator(self.triangles[i, j, k]).get_interpolator_at(centroid.x, centroid.y)
+                self.inside[index] = True
+                self.element_weight[index] = intersection.area * interpolator
+
+        self.nb_triangles_inside = int(self.inside.sum())
+        self.point_weight = np.zeros((self.nb_points,), dtype=np.float64)
+        np.add.at(self.point_weight, self.ikle, self.element_weight)
+        self.inverse_total_area = 1 / self.element_weight.sum()
 
     def mean_signed_deviation(self, values):
         """!
@@ -79,12 +77,7 @@ class ReferenceMesh(TruncatedTriangularPrisms):
         @param values <numpy.1D-array>: The difference between the test mesh and the reference mesh
         @return <float>: The value of the mean signed deviation
         """
-        if not self.inside_polygon:
-            return self.point_weight.dot(values) * self.inverse_total_area
-        else:
-            volume_boundary = TruncatedTriangularPrisms.boundary_volume_in_polygon(self.triangle_polygon_intersection,
-                                                                                   values)
-            return (volume_boundary + self.point_weight.dot(values)) * self.inverse_total_area
+        return self.point_weight.dot(values) * self.inverse_total_area
 
     def mean_absolute_deviation(self, values):
         """!
@@ -92,13 +85,7 @@ class ReferenceMesh(TruncatedTriangularPrisms):
         @param values <numpy.1D-array>: The difference between the test mesh and the reference mesh
         @return <float>: The value of the mean absolute deviation
         """
-        if not self.inside_polygon:
-            return self.point_weight.dot(np.abs(values)) * self.inverse_total_area
-        else:
-            abs_values = np.abs(values)
-            volume_boundary = TruncatedTriangularPrisms.boundary_volume_in_polygon(self.triangle_polygon_intersection,
-                                                                                   abs_values)
-            return (volume_boundary + self.point_weight.dot(abs_values)) * self.inverse_total_area
+        return self.point_weight.dot(np.abs(values)) * self.inverse_total_area
 
     def root_mean_square_deviation(self, values):
         """!
@@ -106,30 +93,16 @@ class ReferenceMesh(TruncatedTriangularPrisms):
         @param values <numpy.1D-array>: The difference between the test mesh and the reference mesh
         @return <float>: The value of the root mean square deviation
         """
-        if not self.inside_polygon:
-            return np.sqrt(self.point_weight.dot(np.square(values)) * self.inverse_total_area)
-        else:
-            squared_values = np.square(values)
-            volume_boundary = TruncatedTriangularPrisms.boundary_volume_in_polygon(self.triangle_polygon_intersection,
-                                                                                   squared_values)
-            return np.sqrt((volume_boundary + self.point_weight.dot(squared_values)) * self.inverse_total_area)
+        return np.sqrt(self.point_weight.dot(np.square(values)) * self.inverse_total_area)
 
     def element_wise_signed_deviation(self, values):
         """!
         @brief Compute the element wise signed deviation (signed deviation distribution) between two meshes
         @param values <numpy.1D-array>: The difference between the test mesh and the reference mesh
-        @return <dict>: The value of the signed deviation for every triangles in the comparison area
+        @return <numpy.1D-array>: The value of the signed deviation for every triangle (zero outside the comparison area)
         """
-        ewsd = {}
-        for i, j, k in self.area:
-            ewsd[i, j, k] = sum(values[[i, j, k]]) * self.area[i, j, k] / 3.0 * self.nb_triangles_inside \
-                            * self.inverse_total_area
-        if self.inside_polygon:
-            for i, j, k in self.triangle_polygon_intersection:
-                area, interpolator = self.triangle_polygon_intersection[i, j, k]
-                ewsd[i, j, k] = interpolator.dot(values[[i, j, k]]) * area * self.nb_triangles_inside \
-                                * self.inverse_total_area
-        return ewsd
+        return np.einsum('ij,ij->i', values[self.ikle], self.element_weight) \
+            * self.nb_triangles_inside * self.inverse_total_area
 
     def quadratic_volume(self, values):
         """!
@@ -137,11 +110,196 @@ class ReferenceMesh(TruncatedTriangularPrisms):
         @param values <numpy.1D-array>: The difference between the test mesh and the reference mesh
         @return <float>: The value of the quadratic volume
         """
-        if not self.inside_polygon:
-            return self.point_weight.dot(np.square(values))
-        else:
-            squared_values = np.square(values)
-            volume_boundary = TruncatedTriangularPrisms.boundary_volume_in_polygon(self.triangle_polygon_intersection,
-                                                                                   squared_values)
-            return self.point_weight.dot(squared_values) + volume_boundary
+        return self.point_weight.dot(np.square(values))
+
+    def error_evolution(self, input_stream, var_ID, ref_values, init_values=None, time_indices=None,
+                        block_size=64):
+        """!
+        @brief Compute the MSD, MAD, RMSD (and BSS) between every test frame and the reference in a single pass
+        @param input_stream <slf.Serafin.Read>: The test file
+        @param var_ID <str>: The variable to compare
+        @param ref_values <numpy.1D-array>: The reference values
+        @param init_values <numpy.1D-array>: The initial state for the BSS, or None to skip the BSS
+        @param time_indices <[int]>: The test frames (all by default)
+        @param block_size <int>: The number of frames processed together
+        @return <numpy.1D-array, numpy.1D-array, numpy.1D-array, numpy.1D-array>: The MSD, MAD, RMSD and BSS series (BSS is None if init_values is None)
+        """
+        if time_indices is None:
+            time_indices = range(len(input_stream.time))
+        time_indices = list(time_indices)
+
+        # the three measures are weighted sums of the difference, its absolute value and its square
+        sums = np.empty((3, len(time_indices)), dtype=np.float64)
+        for start in range(0, len(time_indices), block_size):
+            block = time_indices[start:start+block_size]
+            values = np.array([input_stream.read_var_in_frame(index, var_ID) for index in block]) - ref_values
+            sums[0, start:start+len(block)] = values.dot(self.point_weight)
+            sums[1, start:start+len(block)] = np.abs(values).dot(self.point_weight)
+            sums[2, start:start+len(block)] = np.square(values).dot(self.point_weight)
+
+        msd = sums[0] * self.inverse_total_area
+        mad = sums[1] * self.inverse_total_area
+        rmsd = np.sqrt(sums[2] * self.inverse_total_area)
+        if init_values is None:
+            return msd, mad, rmsd, None
+
+        test_volume = sums[2]
+        ref_volume = self.quadratic_volume(ref_values - init_values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bss = 1 - test_volume / ref_volume
+        bss[np.logical_and(test_volume == 0, ref_volume == 0)] = 1
+        return msd, mad, rmsd, bss
+
+
+# reference operators attached (from shared memory) once in every worker process of BatchComparison
+_shared_operators = {}
+
+
+def _attach_shared_operators(weight_name, weight_shape, ref_name, ref_shape):
+    """!
+    @brief (Worker initializer) Attach the shared point weights and reference values
+    """
+    weight_memory = shared_memory.SharedMemory(name=weight_name)
+    ref_memory = shared_memory.SharedMemory(name=ref_name)
+    _shared_operators['memory'] = (weight_memory, ref_memory)
+    _shared_operators['weight'] = np.ndarray(weight_shape, dtype=np.float64, buffer=weight_memory.buf)
+    _shared_operators['ref'] = np.ndarray(ref_shape, dtype=np.float64, buffer=ref_memory.buf)
+
+
+def _compare_run(job):
+    """!
+    @brief (Worker task) Compare all frames of a single test file to the shared reference
+    @param job <tuple>: run index, file name, language, variable ID, inverse areas of the regions, index of the initial frame (or None), block size
+    @return <tuple>: The run index, the time values and the metrics array of shape (number of frames, number of regions, 4), or the run index, None and an error message
+    """
+    run_index, filename, language, var_ID, inverse_areas, init_index, block_size = job
+    weight, ref_values = _shared_operators['weight'], _shared_operators['ref']
+    try:
+        with Serafin.Read(filename, language) as input_stream:
+            input_stream.read_header()
+            if input_stream.header.nb_nodes != len(ref_values):
+                return run_index, None, 'the mesh is different from the reference mesh'
+            if var_ID not in input_stream.header.var_IDs:
+                return run_index, None, 'variable %s not found' % var_ID
+            input_stream.get_time()
+            nb_frames = len(input_stream.time)
+            if init_index is not None and not 0 <= init_index < nb_frames:
+                return run_index, None, 'initial frame index %d out of range' % init_index
+
+            metrics = np.full((nb_frames, weight.shape[0], 4), np.nan, dtype=np.float64)
+            for start in range(0, nb_frames, block_size):
+                indices = slice(start, min(start + block_size, nb_frames))
+                values = np.array([input_stream.read_var_in_frame(index, var_ID)
+                                   for index in range(indices.start, indices.stop)]) - ref_values
+                metrics[indices, :, 0] = values.dot(weight.T)
+                metrics[indices, :, 1] = np.abs(values).dot(weight.T)
+                metrics[indices, :, 2] = np.square(values).dot(weight.T)
+
+            if init_index is not None:
+                ref_volume = weight.dot(np.square(ref_values - input_stream.read_var_in_frame(init_index, var_ID)))
+                test_volume = metrics[:, :, 2]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    metrics[:, :, 3] = 1 - test_volume / ref_volume
+                metrics[:, :, 3][np.logical_and(test_volume == 0, ref_volume == 0)] = 1
+            metrics[:, :, 0] *= inverse_areas
+            metrics[:, :, 1] *= inverse_areas
+            metrics[:, :, 2] = np.sqrt(metrics[:, :, 2] * inverse_areas)
+            return run_index, input_stream.time, metrics
+    except (OSError, Serafin.SerafinValidationError) as e:
+        return run_index, None, str(e)
+
+
+class BatchComparison:
+    """!
+    Compare many test files to a single reference frame on an identical mesh, in parallel
+
+    The point weights of every comparison region (the whole mesh and/or polygons) are computed once,
+    and shared with the worker processes through shared memory together with the reference values.
+    The result is a consolidated table with one row per run, frame and region.
+    """
+    METRICS = ['MSD', 'MAD', 'RMSD', 'BSS']
+
+    def __init__(self, ref_header, ref_values, var_ID, polygons, polynames, whole_mesh=True, init_index=None):
+        """!
+        @param ref_header <slf.Serafin.SerafinHeader>: The header of the reference file
+        @param ref_values <numpy.1D-array>: The reference values
+        @param var_ID <str>: The variable to compare
+        @param polygons <[geom.geometry.Polyline]>: The comparison polygons
+        @param polynames <[str]>: The names of the polygons
+        @param whole_mesh <bool>: Add the whole mesh as the first comparison region
+        @param init_index <int>: The index of the initial state (in the test files) for the BSS, or None to skip the BSS
+        """
+        self.ref_header = ref_header
+        self.ref_values = np.asarray(ref_values, dtype=np.float64)
+        self.var_ID = var_ID
+        self.polygons = ([None] if whole_mesh else []) + list(polygons)
+        self.region_names = (['Mesh'] if whole_mesh else []) + list(polynames)
+        self.init_index = init_index
+
+        self.weight = None
+        self.inverse_areas = None
+
+    def construct_weights(self):
+        """!
+        @brief Compute the point weights of every comparison region on the reference mesh
+        """
+        mesh = ReferenceMesh(self.ref_header, True)
+        weights, inverse_areas = [], []
+        for polygon in self.polygons:
+            mesh.add_polygon(polygon)
+            weights.append(mesh.point_weight)
+            inverse_areas.append(mesh.inverse_total_area)
+        self.weight = np.array(weights, dtype=np.float64)
+        self.inverse_areas = np.array(inverse_areas, dtype=np.float64)
+
+    def run(self, filenames, language, nb_processes, block_size=64):
+        """!
+        @brief Compare every test file to the reference
+        @param filenames <[str]>: The test files
+        @param language <str>: The language of the test files
+        @param nb_processes <int>: The number of worker processes
+        @param block_size <int>: The number of frames processed together
+        @return <[tuple]>: The list of (file name, time values, metrics array) for every successful run
+        """
+        weight_memory = shared_memory.SharedMemory(create=True, size=max(1, self.weight.nbytes))
+        ref_memory = shared_memory.SharedMemory(create=True, size=max(1, self.ref_values.nbytes))
+        try:
+            np.ndarray(self.weight.shape, dtype=np.float64, buffer=weight_memory.buf)[:] = self.weight
+            np.ndarray(self.ref_values.shape, dtype=np.float64, buffer=ref_memory.buf)[:] = self.ref_values
+
+            jobs = [(i, filename, language, self.var_ID, self.inverse_areas, self.init_index, block_size)
+                    for i, filename in enumerate(filenames)]
+            results = [None] * len(filenames)
+            with Pool(nb_processes, initializer=_attach_shared_operators,
+                      initargs=(weight_memory.name, self.weight.shape, ref_memory.name,
+                                self.ref_values.shape)) as pool:
+                for run_index, time, metrics in pool.imap_unordered(_compare_run, jobs):
+                    if time is None:
+                        module_logger.error('Comparison failed for %s: %s' % (filenames[run_index], metrics))
+                    else:
+                        module_logger.info('Finished comparing %s' % filenames[run_index])
+                        results[run_index] = (filenames[run_index], time, metrics)
+        finally:
+            weight_memory.close()
+            weight_memory.unlink()
+            ref_memory.close()
+            ref_memory.unlink()
+        return [result for result in results if result is not None]
+
+    def get_csv_header(self):
+        nb_metrics = 4 if self.init_index is not None else 3
+        return ['run', 'time', 'region'] + BatchComparison.METRICS[:nb_metrics]
+
+    def write_csv(self, result, output_stream, separator, format_string='{0:.6f}'):
+        nb_metrics = 4 if self.init_index is not None else 3
+        output_stream.write(separator.join(self.get_csv_header()))
+        output_stream.write('\n')
+
+        for filename, time, metrics in result:
+            for time_value, frame_metrics in zip(time, metrics):
+                for region_name, region_metrics in zip(self.region_names, frame_metrics):
+                    output_stream.write(separator.join([filename, str(time_value), region_name]
+                                                       + [format_string.format(v)
+                                                          for v in region_metrics[:nb_metrics]]))
+                    output_stream.write('\n')
 
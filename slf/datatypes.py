@@ -30,6 +30,13 @@ class SerafinData:
         self.operator = None
         self.metadata = {}
 
+    def __getstate__(self):
+        # the spatial index and the triangles are rebuilt where needed, they are never sent to another process
+        state = self.__dict__.copy()
+        state['index'] = None
+        state['triangles'] = {}
+        return state
+
     def read(self):
         with Serafin.Read(self.filename, self.language) as input_stream:
             input_stream.read_header()
@@ -24,17 +24,19 @@ class SimpleCondition(ComplexCondition):
         self.polygonal = expression.polygonal
         self.mask_id = expression.mask_id
 
+        self.threshold = threshold
+        # numpy comparison functions (unlike lambdas) let the pool be sent to worker processes
         if comparator == '>':
-            self._evaluate = lambda value: value > threshold
+            self._evaluate = np.greater
         elif comparator == '<':
-            self._evaluate = lambda value: value < threshold
+            self._evaluate = np.less
         elif comparator == '>=':
-            self._evaluate = lambda value: value >= threshold
+            self._evaluate = np.greater_equal
         else:
-            self._evaluate = lambda value: value <= threshold
+            self._evaluate = np.less_equal
 
     def evaluate(self, current_values):
-        return self._evaluate(current_values[self.expression.code()])
+        return self._evaluate(current_values[self.expression.code()], self.threshold)
 
 
 class AndOrCondition(ComplexCondition):
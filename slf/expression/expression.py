@@ -1,6 +1,6 @@
 import numpy as np
 
-from slf.misc import tighten_expression, OPERATORS, OPERATIONS
+from slf.misc import tighten_expression, CompiledExpression
 
 
 class ComplexExpression:
@@ -50,27 +50,13 @@ class SimpleExpression(ComplexExpression):
         super().__init__(index)
         self.expression = postfix
         self.tight_expression = tighten_expression(literal_expression)
+        self.compiled = CompiledExpression(postfix)
 
     def __repr__(self):
         return self.tight_expression
 
     def evaluate(self, values, mask=None):
-        stack = []
-        for symbol in self.expression:
-            if symbol in OPERATORS:
-                if symbol in ('sqrt', 'sin', 'cos', 'atan'):
-                    operand = stack.pop()
-                    stack.append(OPERATIONS[symbol](operand))
-                else:
-                    first_operand = stack.pop()
-                    second_operand = stack.pop()
-                    stack.append(OPERATIONS[symbol](first_operand, second_operand))
-            else:
-                if symbol[0] == '[':
-                    stack.append(values[symbol[1:-1]])
-                else:
-                    stack.append(float(symbol))
-        return stack.pop()
+        return self.compiled.evaluate(values)
 
 
 class ConditionalExpression(ComplexExpression):
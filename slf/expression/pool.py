@@ -1,13 +1,64 @@
+from multiprocessing import Pool
 import numpy as np
+import os
 from shapely.geometry import Point
+from shapely.prepared import prep
 
+from slf import Serafin
 from slf.misc import to_infix, infix_to_postfix, is_valid_postfix, is_valid_expression
 from slf.expression.expression import ConditionalExpression, MaskedExpression, MaxMinExpression, PolygonalMask, \
     SimpleExpression
 from slf.expression.condition import SimpleCondition, AndOrCondition
 
 
+def polygon_index(x, y, polygons):
+    """!
+    @brief Find the polygon containing every point (the last one if the polygons overlap)
+    @param x <numpy.1D-array>: The x coordinates of the points
+    @param y <numpy.1D-array>: The y coordinates of the points
+    @param polygons <[geom.geometry.Polyline]>: The list of polygons
+    @return <numpy.1D-array>: 0 for the points outside all polygons, i+1 for the points inside the i-th polygon
+
+    Only the points in the bounding box of a polygon are tested with the (prepared) polygon geometry.
+    As with shapely contains, the points on the polygon boundary are outside.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    index = np.zeros(x.shape, dtype=int)
+    order = np.argsort(x, kind='stable')  # the points sorted along x to find quickly those in a bounding box
+    sorted_x = x[order]
+    for i, poly in enumerate(polygons):
+        x_min, y_min, x_max, y_max = poly.bounds()
+        candidates = order[np.searchsorted(sorted_x, x_min, side='left'):np.searchsorted(sorted_x, x_max, side='right')]
+        candidates = candidates[np.logical_and(y[candidates] >= y_min, y[candidates] <= y_max)]
+        prepared_polygon = prep(poly.polyline())
+        is_inside = [prepared_polygon.contains(Point(xi, yi)) for xi, yi in zip(x[candidates], y[candidates])]
+        index[candidates[np.array(is_inside, dtype=bool)]] = i+1
+    return index
+
+
+def write_pool_output(job):
+    """!
+    @brief (Used in parallel calculator runs) Evaluate the selected expressions on one input file and write the output
+    @param job <tuple>: The job index, the input file name and header, the output file name and header,
+                        the expression pool of the input file, the augmented path and the selected expressions
+    @return <int>: The job index
+    """
+    index, input_name, input_header, output_name, output_header, pool, augmented_path, selected_expressions = job
+    with Serafin.Read(input_name, input_header.language) as input_stream:
+        input_stream.header = input_header
+        input_stream.get_time()
+
+        with Serafin.Write(output_name, input_header.language) as output_stream:
+            output_stream.write_header(output_header)
+            for time_value, value_array in pool.evaluate_expressions(augmented_path, input_stream,
+                                                                     selected_expressions):
+                output_stream.write_entire_frame(output_header, time_value, value_array)
+    return index
+
+
 class ComplexExpressionPool:
+    MAX_CACHE_SIZE = 2**30  # maximum memory (in bytes) for the time-invariant values evaluated once per file
+
     def __init__(self, variables, names, x, y):
         self.nb_expressions = 0
         self.expressions = {}
@@ -22,10 +73,7 @@ class ComplexExpressionPool:
         self.var_names = ['X coordinate', 'Y coordinate'] + names
         self.id_pool = self.vars[:]
         self.dependency_graph = {var: set() for var in self.vars}  # a DAG
-
-    def points(self):
-        for i, (x, y) in enumerate(zip(self.x, self.y)):
-            yield i, Point(x, y)
+        self.cache_size = 0
 
     def add_simple_expression(self, literal_expression):
         infix = to_infix(literal_expression)
@@ -170,19 +218,22 @@ class ComplexExpressionPool:
             return 1
         return 0
 
-    def add_polygonal_mask(self, polygons, attribute_index):
+    def add_polygonal_mask(self, polygons, attribute_index, mask=None):
+        """!
+        @brief Add a polygonal mask with the values of a polygon attribute
+        @param polygons <[geom.geometry.Polyline]>: The list of polygons
+        @param attribute_index <int>: The index of the attribute giving the values inside the polygons
+        @param mask <numpy.1D-array>: The polygon containing every node (see polygon_index), computed if None
+        """
         self.nb_masks += 1
         new_id = 'POLY%d' % self.nb_masks
         self.id_pool.append(new_id)
         self.dependency_graph[new_id] = set()
-        mask = np.zeros_like(self.x)
-        for index, poly in enumerate(polygons):
-            for i, point in self.points():
-                if poly.contains(point):
-                    mask[i] = index+1
-        masked_values = np.zeros_like(self.x)
-        for index, poly in enumerate(polygons):
-            masked_values[mask == index+1] = poly.attributes()[attribute_index]
+        if mask is None:
+            mask = polygon_index(self.x, self.y, polygons)
+        attributes = np.array([0] + [poly.attributes()[attribute_index] for poly in polygons],
+                              dtype=np.asarray(self.x).dtype)
+        masked_values = attributes[mask]
         self.masks[self.nb_masks] = PolygonalMask(self.nb_masks, mask > 0, masked_values)
 
     def get_expression(self, str_expression):
@@ -300,8 +351,9 @@ class ComplexExpressionPool:
         nb_row = len(selected_expressions)
         nb_col = input_stream.header.nb_nodes
 
+        steps = self.compile_path(augmented_path)
         for time_index, time_value in enumerate(input_stream.time):
-            values = self._evaluate_expressions(input_stream, time_index, augmented_path)
+            values = self._evaluate_steps(input_stream, time_index, steps)
 
             # build nd-array in the selected order
             value_array = np.empty((nb_row, nb_col))
@@ -326,23 +378,68 @@ class ComplexExpressionPool:
             index = int(node_code[1:])
             return None, self.expressions[index]
 
-    def _evaluate_expressions(self, input_stream, time_index, path):
-        # evaluate each node on the augmented path
-        values = {node: None for node in path}
+    def compile_path(self, path):
+        """!
+        @brief Resolve once how every node on the augmented path is obtained
+        The nodes which do not depend on any variable (coordinates, polygonal masks and their descendants)
+        are evaluated here once for all frames, within the limit of MAX_CACHE_SIZE bytes.
+        Once the limit is reached, the remaining nodes are evaluated in every frame.
+        @param path <[str]>: the augmented path
+        @return <[tuple]>: the evaluation steps (node code, variable ID to read, fixed values, node object, mask)
+        """
+        steps = []
+        invariant_values = {}
+        self.cache_size = 0
         for node in path:
-            node_values, node_object = self.decode(input_stream, time_index, node)
-            if node_values is None:
-                if node_object.masked:
-                    node_values = node_object.evaluate(values, self.masks[node_object.mask_id].mask)
-                else:
-                    node_values = node_object.evaluate(values)
-                if type(node_values) == float:  # single constant expression
-                    node_values = np.ones_like(self.x) * node_values
+            var_ID, node_values, node_object, mask = None, None, None, None
+            if node in self.vars[2:]:
+                var_ID = node
+            else:
+                node_values, node_object = self.decode(None, None, node)
+                if node_object is not None and node_object.masked:
+                    mask = self.masks[node_object.mask_id].mask
+
+                if node_values is not None:  # coordinates and polygonal masks are stored in the pool
+                    invariant_values[node] = node_values
+                elif self.cache_size + self.x.nbytes <= self.MAX_CACHE_SIZE \
+                        and all(parent in invariant_values for parent in self.dependency_graph[node]):
+                    node_values = self._evaluate_node(invariant_values, node_object, mask)
+                    nbytes = np.asarray(node_values).nbytes
+                    if self.cache_size + nbytes <= self.MAX_CACHE_SIZE:
+                        self.cache_size += nbytes
+                        invariant_values[node] = node_values
+                    else:  # released at once, with the evaluation of its descendants
+                        node_values = None
+            steps.append((node, var_ID, node_values, node_object, mask))
+        return steps
+
+    def _evaluate_node(self, values, node_object, mask):
+        if mask is not None:
+            node_values = node_object.evaluate(values, mask)
+        else:
+            node_values = node_object.evaluate(values)
+        if type(node_values) == float:  # single constant expression
+            node_values = np.ones_like(self.x) * node_values
+        return node_values
+
+    def _evaluate_steps(self, input_stream, time_index, steps):
+        # evaluate each node on the augmented path
+        values = {}
+        for node, var_ID, node_values, node_object, mask in steps:
+            if var_ID is not None:
+                node_values = input_stream.read_var_in_frame(time_index, var_ID)
+            elif node_values is None:
+                node_values = self._evaluate_node(values, node_object, mask)
             values[node] = node_values
         return values
 
+    def _evaluate_expressions(self, input_stream, time_index, path):
+        return self._evaluate_steps(input_stream, time_index, self.compile_path(path))
+
 
 class ComplexExpressionMultiPool:
+    POLL_INTERVAL = 0.2  # delay (in seconds) between two checks of the cancellation in parallel runs
+
     def __init__(self):
         self.input_data = []
         self.nb_pools = 0
@@ -372,8 +469,16 @@ class ComplexExpressionMultiPool:
         self.representative = self.pools[0]
 
     def add_polygonal_mask(self, polygons, attribute_index):
+        # the mask is computed only once for the pools sharing the same mesh
+        masks = []
         for pool in self.pools:
-            pool.add_polygonal_mask(polygons, attribute_index)
+            for x, y, mask in masks:
+                if np.array_equal(x, pool.x) and np.array_equal(y, pool.y):
+                    break
+            else:
+                mask = polygon_index(pool.x, pool.y, polygons)
+                masks.append((pool.x, pool.y, mask))
+            pool.add_polygonal_mask(polygons, attribute_index, mask)
 
     def add_simple_expression(self, literal_expression):
         success_code = self.representative.add_simple_expression(literal_expression)
@@ -485,4 +590,50 @@ class ComplexExpressionMultiPool:
         for data, output_header, pool in zip(self.input_data, self.output_headers(selected_names), self.pools):
             yield data.filename, data.header, output_header, pool
 
+    def parallel_jobs(self, selected_expressions, selected_names, output_names, overwrite):
+        augmented_path = self.build_augmented_path(selected_expressions)
+        jobs = []
+        for index, ((input_name, input_header, output_header, pool), output_name) in \
+                enumerate(zip(self.evaluate_iterator(selected_names), output_names)):
+            if not overwrite and os.path.exists(output_name):
+                continue
+            jobs.append((index, input_name, input_header, output_name, output_header, pool,
+                         augmented_path, selected_expressions))
+        return jobs
+
+    def evaluate_in_parallel(self, jobs, nb_processes, is_canceled=None):
+        """!
+        @brief Evaluate the expressions and write the output files with a pool of worker processes
+        @param jobs <[tuple]>: The jobs given by parallel_jobs
+        @param nb_processes <int>: The number of worker processes
+        @param is_canceled <function>: Return True to stop the evaluation (polled while the jobs are running)
+        @return <generator>: The index of every input file, as soon as its output is written
+
+        When the evaluation stops before the end (cancellation, error or generator closed),
+        the workers are terminated and the partially written outputs of the unfinished jobs are removed.
+        """
+        if not jobs:
+            return
+        with Pool(max(1, min(nb_processes, len(jobs)))) as process_pool:
+            pending = {job[0]: (job[3], process_pool.apply_async(write_pool_output, (job,))) for job in jobs}
+            try:
+                while pending:
+                    if is_canceled is not None and is_canceled():
+                        return
+                    finished = [index for index, (_, result) in pending.items() if result.ready()]
+                    if not finished:
+                        next(iter(pending.values()))[1].wait(ComplexExpressionMultiPool.POLL_INTERVAL)
+                        continue
+                    for index in finished:
+                        pending[index][1].get()  # raise the error of a failed job
+                        del pending[index]
+                        yield index
+            finally:
+                if pending:
+                    process_pool.terminate()
+                    process_pool.join()
+                    for output_name, _ in pending.values():
+                        if os.path.exists(output_name):
+                            os.remove(output_name)
+
 
@@ -192,11 +192,16 @@ class TriangularVectorField(Mesh2D):
 class FluxCalculator:
     """!
     Compute flux across sections (integral along lines) from a Serafin input stream
+
+    The time integrals of the flux (net, positive and negative transported volumes or masses) are optionally
+    accumulated in double precision while streaming the frames, with the trapezoidal rule on the actual frame times.
     """
 
     LINE_INTEGRAL, DOUBLE_LINE_INTEGRAL, LINE_FLUX, AREA_FLUX, MASS_FLUX = 0, 1, 2, 3, 4
+    CUMULATIVE_SUFFIXES = (' CUMULATIVE', ' CUMULATIVE POSITIVE', ' CUMULATIVE NEGATIVE')
 
-    def __init__(self, flux_type, var_IDs, input_stream, section_names, sections, time_sampling_frequency):
+    def __init__(self, flux_type, var_IDs, input_stream, section_names, sections, time_sampling_frequency,
+                 cumulative=False):
         self.flux_type = flux_type
         self.input_stream = input_stream
         self.section_names = section_names
@@ -209,6 +214,14 @@ class FluxCalculator:
         self.mesh = None
         self.intersections = []
 
+        self.cumulative = cumulative
+        self.cumulative_net = None
+        self.cumulative_positive = None
+        self.cumulative_negative = None
+        self.previous_time = None
+        self.previous_flux = None
+        self.reset_integrals()
+
     def construct_triangles(self):
         self.mesh = TriangularVectorField(self.input_stream.header, True)
 
@@ -236,29 +249,122 @@ class FluxCalculator:
         else:
             return TriangularVectorField.mass_flux(intersections, values[0], values[1], values[2], values[3])
 
+    def read_values_in_frame(self, time_index):
+        """!
+        Read the values of the scalar/vector fields in a single frame
+        """
+        values = []
+        for var_ID in self.var_IDs:
+            values.append(self.input_stream.read_var_in_frame(time_index, var_ID))
+        return values
+
+    def reset_integrals(self):
+        """!
+        @brief Restart the time integrals of the flux from zero, before the first frame
+        """
+        self.cumulative_net = np.zeros((len(self.sections),), dtype=np.float64)
+        self.cumulative_positive = np.zeros((len(self.sections),), dtype=np.float64)
+        self.cumulative_negative = np.zeros((len(self.sections),), dtype=np.float64)
+        self.previous_time = None
+        self.previous_flux = None
+
+    @staticmethod
+    def positive_trapezoid(first_flux, second_flux, delta_time):
+        """!
+        @brief Return the time integral of the positive part of a flux varying linearly between two frames
+        @param first_flux <numpy.1D-array>: The flux values (one per section) at the first frame
+        @param second_flux <numpy.1D-array>: The flux values (one per section) at the second frame
+        @param delta_time <float>: The time step between the two frames
+        @return <numpy.1D-array>: The integral of the positive part of the flux
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # the sign change happens inside the time step: only the positive triangle is integrated
+            crossing = 0.5 * delta_time * np.square(np.maximum(first_flux, second_flux)) \
+                       / np.abs(second_flux - first_flux)
+        return np.where(np.logical_and(first_flux >= 0, second_flux >= 0),
+                        0.5 * delta_time * (first_flux + second_flux),
+                        np.where(np.logical_and(first_flux <= 0, second_flux <= 0), 0, crossing))
+
+    def accumulate_in_frame(self, time_value, flux_values):
+        """!
+        @brief Update the running time integrals of the flux with the values of a new frame
+        @param time_value <float>: The time of the new frame
+        @param flux_values <list>: The flux values (one per section) in the new frame
+        """
+        flux_values = np.array(flux_values, dtype=np.float64)
+        if self.previous_time is not None:
+            delta_time = time_value - self.previous_time
+            net = 0.5 * delta_time * (self.previous_flux + flux_values)
+            positive = FluxCalculator.positive_trapezoid(self.previous_flux, flux_values, delta_time)
+            self.cumulative_net += net
+            self.cumulative_positive += positive
+            self.cumulative_negative += net - positive
+        self.previous_time = time_value
+        self.previous_flux = flux_values
+
+    def fluxes_in_frame(self, time_index):
+        """!
+        @brief Compute the flux across all sections in a single frame
+        @param time_index <int>: The index of the frame
+        @return <list>: The flux values (one per section)
+        """
+        values = self.read_values_in_frame(time_index)
+        return [self.flux_in_frame(intersections, values) for intersections in self.intersections]
+
+    def run_in_frame(self, time_index, format_string):
+        """!
+        @brief Compute the flux across all sections (and update their time integrals) in a single frame
+        @param time_index <int>: The index of the frame
+        @param format_string <str>: The output format of the values
+        @return <[str]>: The row of the output table for this frame
+        """
+        return self.row_in_frame(self.input_stream.time[time_index], self.fluxes_in_frame(time_index), format_string)
+
+    def row_in_frame(self, time_value, fluxes, format_string):
+        """!
+        @brief Build the output row of a frame from its flux values (and update their time integrals)
+        @param time_value <float>: The time of the frame, following the previous frame
+        @param fluxes <list>: The flux values (one per section) in the frame
+        @param format_string <str>: The output format of the values
+        @return <[str]>: The row of the output table for this frame
+        """
+        i_result = [str(time_value)] + [format_string.format(flux) for flux in fluxes]
+        if self.cumulative:
+            self.accumulate_in_frame(time_value, fluxes)
+            for j in range(len(self.sections)):
+                i_result.append(format_string.format(self.cumulative_net[j]))
+                i_result.append(format_string.format(self.cumulative_positive[j]))
+                i_result.append(format_string.format(self.cumulative_negative[j]))
+        return i_result
+
     def run(self, format_string='{0:.6f}'):
         """!
         Separate the major part of the computation, allowing a GUI override
         """
+        self.reset_integrals()
         result = []
         for time_index in self.time_indices:
-            i_result = [str(self.input_stream.time[time_index])]
-            values = []
-            for var_ID in self.var_IDs:
-                values.append(self.input_stream.read_var_in_frame(time_index, var_ID))
-
-            for j in range(len(self.sections)):
-                intersections = self.intersections[j]
-                flux = self.flux_in_frame(intersections, values)
-                i_result.append(format_string.format(flux))
-            result.append(i_result)
+            result.append(self.run_in_frame(time_index, format_string))
         return result
 
+    def get_csv_header(self):
+        header = ['time'] + self.section_names
+        if self.cumulative:
+            for name in self.section_names:
+                header.extend(name + suffix for suffix in FluxCalculator.CUMULATIVE_SUFFIXES)
+        return header
+
+    @staticmethod
+    def section_columns(header):
+        """!
+        @brief Return the flux columns of a CSV header, without the time and the time integral columns
+        @param header <[str]>: The CSV header
+        @return <[str]>: The names of the sections
+        """
+        return [name for name in header[1:] if not name.endswith(FluxCalculator.CUMULATIVE_SUFFIXES)]
+
     def write_csv(self, result, output_stream, separator):
-        output_stream.write('time')
-        for name in self.section_names:
-            output_stream.write(separator)
-            output_stream.write(name)
+        output_stream.write(separator.join(self.get_csv_header()))
         output_stream.write('\n')
 
         for line in result:
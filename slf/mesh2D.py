@@ -5,6 +5,7 @@ Representation of the 2D mesh in a 2D Serafin file.
 import numpy as np
 from rtree.index import Index
 from shapely.geometry import Polygon
+from shapely.prepared import prep
 
 
 class Mesh2D:
@@ -46,5 +47,45 @@ class Mesh2D:
         """
         return list(self.index.intersection(bounding_box, objects='raw'))
 
+    def polygon_overlay(self, polygon):
+        """!
+        @brief Classify the triangles of the mesh against a polygon
+        @param polygon <geom.geometry.Polyline>: A polygon
+        @return <[tuple], [tuple]>: The list of triangles (i,j,k) entirely contained in the polygon, and the list of tuples ((i,j,k), intersection) for boundary triangles
+
+        The nodes are classified inside/outside the polygon with a vectorized point-in-polygon test.
+        A triangle away from the polygon boundary (found with the index from the bounding boxes of the polygon segments)
+        is then interior if its three nodes are inside, and disjoint if none of them is.
+        Only the remaining triangles are tested with the (prepared) polygon geometry.
+        """
+        potential_elements = self.get_intersecting_elements(polygon.bounds())
+        if not potential_elements:
+            return [], []
+        elements = np.array(potential_elements, dtype=np.int64)
+        nodes = np.unique(elements)
+        is_inside = np.zeros((self.nb_points,), dtype=bool)
+        is_inside[nodes] = polygon.contains_points(self.x[nodes], self.y[nodes])
+        nb_nodes_inside = is_inside[elements].sum(axis=1)
+
+        near_boundary = set()
+        for bounds in polygon.segment_bounds():
+            near_boundary.update(self.get_intersecting_elements(bounds))
 
+        prepared_polygon = prep(polygon.polyline())
+        interior, boundary = [], []
+        for (i, j, k), nb_inside in zip(potential_elements, nb_nodes_inside):
+            if (i, j, k) not in near_boundary:
+                if nb_inside == 3:
+                    interior.append((i, j, k))
+                    continue
+                elif nb_inside == 0:
+                    continue
+            t = self.triangles[i, j, k]
+            if prepared_polygon.contains(t):
+                interior.append((i, j, k))
+            else:
+                is_intersected, intersection = polygon.polygon_intersection(t)
+                if is_intersected:
+                    boundary.append(((i, j, k), intersection))
+        return interior, boundary
 
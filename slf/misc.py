@@ -3,12 +3,18 @@ Simple computation/evaluation of variable values in Serafin
 """
 
 import logging
+from multiprocessing import Pool
 import numpy as np
 import re
 import shapefile
 
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
 from slf import Serafin
-from slf.variables import do_calculation, get_available_variables, get_necessary_equations
+from slf.variables import CalculationPlan, get_available_variables, get_necessary_equations
 
 
 module_logger = logging.getLogger(__name__)
@@ -17,9 +23,13 @@ module_logger = logging.getLogger(__name__)
 OPERATORS = ['+', '-', '*', '/', '^', 'sqrt', 'sin', 'cos', 'atan']
 MAX, MIN, MEAN, ARRIVAL_DURATION, \
           PROJECT, DIFF, REV_DIFF, MAX_BETWEEN, MIN_BETWEEN, SYNCH_MAX = 0, 1, 2, 3, 4, 5, 6, 7, 8, 9
+STD, PERCENTILE, EXCEEDANCE = 10, 11, 12
 
 OPERATIONS = {'+': np.add, '-': np.subtract, '*': np.multiply, '/': np.divide, '^': np.power,
                'sqrt': np.sqrt, 'sin': np.sin, 'cos': np.cos, 'atan': np.arctan}
+_UNARY_OPERATORS = ('sqrt', 'sin', 'cos', 'atan')
+_NUMEXPR_FUNCTIONS = {'sqrt': 'sqrt', 'sin': 'sin', 'cos': 'cos', 'atan': 'arctan'}
+_NUMEXPR_OPERATORS = {'+': '+', '-': '-', '*': '*', '/': '/', '^': '**'}
 _PRECEDENCE = {'(': 1, '-': 2, '+': 2, '*': 3, '/': 3, '^': 4, 'sqrt': 5, 'sin': 5, 'cos': 5, 'atan': 5}
 
 _VECTORS = {'U': ('V', 'M'), 'V': ('U', 'M'), 'QSX': ('QSY', 'QS'), 'QSY': ('QSX', 'QS'),
@@ -188,6 +198,160 @@ def evaluate_expression(input_stream, time_index, expression):
     return stack.pop()
 
 
+class CompiledExpression:
+    """!
+    @brief A postfix expression compiled once into a reusable evaluator
+
+    The postfix expression is turned into a DAG where repeated subexpressions and variables are shared
+    and constant subexpressions are folded. The operations are evaluated by blocks of nodes in preallocated buffers
+    (reused as soon as an intermediate result is no longer needed), or delegated to numexpr if it is installed.
+    The operands are applied in the same order as in evaluate_expression.
+    """
+    BLOCK_SIZE = 65536
+
+    def __init__(self, expression, use_numexpr=True):
+        """!
+        @param expression <list>: the expression in postfix format
+        @param use_numexpr <bool>: evaluate with numexpr when it is installed
+        """
+        self.expression = expression
+        self.var_IDs = []
+        self.nodes = []  # ('var', var index), ('const', value) or (operator, operand nodes)
+        node_index = {}
+
+        stack = []
+        for symbol in expression:
+            if symbol in OPERATORS:
+                if symbol in _UNARY_OPERATORS:
+                    operands = (stack.pop(),)
+                else:
+                    first_operand = stack.pop()
+                    second_operand = stack.pop()
+                    operands = (first_operand, second_operand)
+                if all(self.nodes[i][0] == 'const' for i in operands):  # constant folding
+                    key = ('const', float(OPERATIONS[symbol](*(self.nodes[i][1] for i in operands))))
+                else:
+                    key = (symbol, operands)
+            elif symbol[0] == '[':  # variable ID
+                var_ID = symbol[1:-1]
+                if var_ID not in self.var_IDs:
+                    self.var_IDs.append(var_ID)
+                key = ('var', self.var_IDs.index(var_ID))
+            else:
+                key = ('const', float(symbol))
+            if key not in node_index:
+                node_index[key] = len(self.nodes)
+                self.nodes.append(key)
+            stack.append(node_index[key])
+        self.root = stack.pop()
+
+        self._compile_instructions()
+        self._buffers = {}
+
+        self.numexpr_expression = None
+        self.numexpr_constants = {}  # the constants are passed in the precision of the variables
+        if use_numexpr and numexpr is not None:
+            self.numexpr_expression = self._to_numexpr(self.root)
+
+    def _compile_instructions(self):
+        """!
+        @brief Order the operations and assign a buffer slot to every intermediate result
+        """
+        operations = [i for i, node in enumerate(self.nodes) if node[0] not in ('var', 'const')]
+        last_use = {}
+        for i in operations:
+            for operand in self.nodes[i][1]:
+                last_use[operand] = i
+
+        self.instructions = []
+        self.nb_slots = 0
+        slot_of = {}
+        free_slots = []
+        for i in operations:
+            symbol, operands = self.nodes[i]
+            for operand in set(operands):
+                if last_use[operand] == i and operand in slot_of:
+                    free_slots.append(slot_of[operand])
+            if i == self.root:
+                slot = -1  # written directly in the result
+            elif free_slots:
+                slot = free_slots.pop()
+            else:
+                slot = self.nb_slots
+                self.nb_slots += 1
+            slot_of[i] = slot
+            self.instructions.append((OPERATIONS[symbol], operands, i, slot))
+
+    def _to_numexpr(self, index):
+        node = self.nodes[index]
+        if node[0] == 'var':
+            return 'v%d' % node[1]
+        elif node[0] == 'const':
+            name = 'c%d' % index
+            self.numexpr_constants[name] = node[1]
+            return name
+        symbol, operands = node
+        operands = [self._to_numexpr(operand) for operand in operands]
+        if symbol in _UNARY_OPERATORS:
+            return '%s(%s)' % (_NUMEXPR_FUNCTIONS[symbol], operands[0])
+        return '(%s %s %s)' % (operands[0], _NUMEXPR_OPERATORS[symbol], operands[1])
+
+    def is_constant(self):
+        return self.nodes[self.root][0] == 'const'
+
+    def _get_buffers(self, dtype, block_size):
+        buffers = self._buffers.get(dtype)
+        if buffers is None or buffers.shape[1] < block_size:
+            buffers = np.empty((self.nb_slots, block_size), dtype=dtype)
+            self._buffers[dtype] = buffers
+        return buffers
+
+    def evaluate(self, values):
+        """!
+        @brief Evaluate the expression
+        @param values <dict>: the values of the variables referenced in the expression
+        @return <numpy.1D-array or float>: the value of the expression (a float if the expression is constant)
+        """
+        root = self.nodes[self.root]
+        if root[0] == 'const':
+            return root[1]
+        elif root[0] == 'var':
+            return values[self.var_IDs[root[1]]]
+
+        inputs = [values[var_ID] for var_ID in self.var_IDs]
+        dtype = np.result_type(*inputs, 1.0)
+        if self.numexpr_expression is not None:
+            local_dict = {name: dtype.type(value) for name, value in self.numexpr_constants.items()}
+            local_dict.update(('v%d' % i, var_values) for i, var_values in enumerate(inputs))
+            return numexpr.evaluate(self.numexpr_expression, local_dict=local_dict)
+
+        nb_nodes = len(inputs[0])
+        result = np.empty((nb_nodes,), dtype=dtype)
+        block_size = max(1, min(nb_nodes, self.BLOCK_SIZE))
+        buffers = self._get_buffers(dtype, block_size)
+
+        registers = [node[1] if node[0] == 'const' else None for node in self.nodes]
+        loads = [(i, node[1]) for i, node in enumerate(self.nodes) if node[0] == 'var']
+        for start in range(0, nb_nodes, block_size):
+            end = min(start + block_size, nb_nodes)
+            for i, var_index in loads:
+                registers[i] = inputs[var_index][start:end]
+            for operation, operands, i, slot in self.instructions:
+                out = result[start:end] if slot < 0 else buffers[slot, :end-start]
+                registers[i] = operation(*(registers[operand] for operand in operands), out=out)
+        return result
+
+    def evaluate_in_frame(self, input_stream, time_index):
+        """!
+        @brief Evaluate the expression on the input stream for a single frame, reading each variable once
+        @param input_stream <slf.Serafin.Read>: the input Serafin
+        @param time_index <int>: the index of the frame
+        @return <numpy.1D-array or float>: the value of the expression
+        """
+        return self.evaluate({var_ID: input_stream.read_var_in_frame(time_index, var_ID)
+                              for var_ID in self.var_IDs})
+
+
 def detect_vector_couples(variables, available_variables):
     coupled, non_coupled, mothers, angles = [], [], [], []
     for var in variables:
@@ -437,10 +601,157 @@ def slf_to_vtk_3d(slf_name, slf_header, vtk_name, scalars, vectors, variable_nam
                 output_stream.write('\n')
 
 
+def reduction_float_type(header, is_sum=False):
+    """!
+    @brief Precision policy of the reductions: the extrema, comparisons and selections are exact in the file precision,
+           only the accumulated values (sums, durations) are kept in double precision
+    @param header <slf.Serafin.SerafinHeader>: the input header
+    @param is_sum <bool>: True if the values are accumulated over the frames
+    @return <numpy.dtype>: the float type of the accumulators
+    """
+    return np.float64 if is_sum else header.np_float_type
+
+
+def run_by_node_chunks(input_stream, create_calculators, nb_arrays, memory_budget=None):
+    """!
+    @brief Run reduction calculators over all frames, one chunk of nodes at a time to respect a memory budget
+    @param input_stream <slf.Serafin.Read>: the input Serafin (with header and time already read)
+    @param create_calculators <function>: create the list of calculators on a given input stream (or node chunk)
+    @param nb_arrays <int>: the (estimated) number of float64 node arrays held in memory by the calculators
+    @param memory_budget <int>: the memory budget in bytes (None to process all nodes at once)
+    @return <numpy.2D-array>: the stacked results of all calculators, in order
+    """
+    nb_nodes = input_stream.header.nb_nodes
+    chunk_size = nb_nodes if memory_budget is None else max(1, int(memory_budget // (8 * nb_arrays)))
+    if chunk_size >= nb_nodes:
+        calculators = create_calculators(input_stream)
+        for calculator in calculators:
+            calculator.run()
+        return np.vstack([calculator.finishing_up() for calculator in calculators])
+
+    module_logger.info('Processing %d nodes by chunks of %d nodes' % (nb_nodes, chunk_size))
+    values = None
+    for start in range(0, nb_nodes, chunk_size):
+        end = min(start + chunk_size, nb_nodes)
+        calculators = create_calculators(Serafin.NodeChunk(input_stream, start, end))
+        for calculator in calculators:
+            calculator.run()
+        chunk_values = np.vstack([calculator.finishing_up() for calculator in calculators])
+        if values is None:
+            values = np.empty((chunk_values.shape[0], nb_nodes))
+        values[:, start:end] = chunk_values
+    return values
+
+
+def reduce_time_range(job):
+    """!
+    @brief (Used in parallel reductions) Run the calculators on one range of frames with a dedicated reader
+    @param job <tuple>: The range index, the input file name, header and time, and the calculator specifications
+    @return <tuple>: The range index and the calculators (without their input stream)
+    """
+    index, filename, header, time, specs = job
+    with Serafin.Read(filename, header.language) as input_stream:
+        input_stream.header = header
+        input_stream.time = time
+        calculators = [calculator_class(input_stream=input_stream, time_indices=time_indices, **kwargs)
+                       for calculator_class, kwargs, time_indices in specs]
+        for calculator in calculators:
+            calculator.run()
+            calculator.input_stream = None
+    return index, calculators
+
+
+class TimeRangeReduction:
+    """!
+    @brief Run reduction calculators over contiguous ranges of frames, in parallel, and merge the partial results
+    """
+    RANGES_PER_PROCESS = 4
+
+    def __init__(self, input_stream, calculator_specs, time_indices, nb_processes=1, nb_ranges=None):
+        """!
+        @param input_stream <slf.Serafin.Read>: the input Serafin (with header and time already read)
+        @param calculator_specs <[(type, dict)]>: the calculator classes and their arguments \
+               (other than the input stream and the time indices)
+        @param time_indices <[int]>: the selected time indices
+        @param nb_processes <int>: the number of processes
+        @param nb_ranges <int>: the maximum number of ranges (by default, RANGES_PER_PROCESS per process)
+        """
+        self.input_stream = input_stream
+        self.calculator_specs = calculator_specs
+        self.nb_processes = nb_processes
+        self.calculators = []
+
+        # ranges with an arrival/duration calculator overlap on one frame, and have at least two frames
+        nb_frames = len(time_indices)
+        overlapping = any(calculator_class.OVERLAPPING_RANGES for calculator_class, _ in calculator_specs)
+        if nb_ranges is None:
+            nb_ranges = self.RANGES_PER_PROCESS * nb_processes
+        nb_ranges = max(1, min(nb_ranges, nb_frames // 2 if overlapping else nb_frames))
+        if not all(hasattr(calculator_class, 'merge') for calculator_class, _ in calculator_specs):
+            nb_ranges = 1  # the partial results cannot be merged
+        bounds = np.linspace(0, nb_frames, nb_ranges+1).astype(int)
+        self.jobs = []
+        for index in range(nb_ranges):
+            specs = []
+            for calculator_class, kwargs in calculator_specs:
+                end = bounds[index+1] + 1 if calculator_class.OVERLAPPING_RANGES else bounds[index+1]
+                specs.append((calculator_class, kwargs, list(time_indices[bounds[index]:end])))
+            self.jobs.append((index, input_stream.filename, input_stream.header, input_stream.time, specs))
+
+    @property
+    def nb_ranges(self):
+        return len(self.jobs)
+
+    @staticmethod
+    def merge(partials):
+        """!
+        @brief Merge the partial results of the ranges
+        @param partials <[[calculator]]>: the calculators run on every range, in order of frames
+        @return <[calculator]>: the calculators of the first range, merged with the following ones
+        """
+        merged = partials[0]
+        for calculators in partials[1:]:
+            for calculator, other in zip(merged, calculators):
+                calculator.merge(other)
+        return merged
+
+    def run(self):
+        """!
+        @brief Run the reduction (as a generator yielding after each finished range)
+        """
+        partials = [None] * self.nb_ranges
+        if self.nb_processes <= 1 or self.nb_ranges == 1:
+            for index, _, _, _, specs in self.jobs:
+                calculators = [calculator_class(input_stream=self.input_stream, time_indices=time_indices,
+                                                **kwargs) for calculator_class, kwargs, time_indices in specs]
+                for calculator in calculators:
+                    calculator.run()
+                partials[index] = calculators
+                yield
+        else:
+            with Pool(min(self.nb_processes, self.nb_ranges)) as pool:
+                for index, calculators in pool.imap_unordered(reduce_time_range, self.jobs):
+                    partials[index] = calculators
+                    yield
+        self.calculators = self.merge(partials)
+
+    def finishing_up(self):
+        """!
+        @brief Run the reduction (if not yet done) and return the results
+        @return <numpy.2D-array>: the stacked results of all calculators, in order
+        """
+        if not self.calculators:
+            for _ in self.run():
+                pass
+        return np.vstack([calculator.finishing_up() for calculator in self.calculators])
+
+
 class ScalarMaxMinMeanCalculator:
     """!
     Compute max/min/mean of 2D scalar variables from a Serafin input stream
     """
+    OVERLAPPING_RANGES = False
+
     def __init__(self, max_min_type, input_stream, selected_scalars, time_indices, additional_equations=None):
         self.maxmin = max_min_type
         self.input_stream = input_stream
@@ -451,47 +762,43 @@ class ScalarMaxMinMeanCalculator:
         self.nb_nodes = input_stream.header.nb_nodes
         self.additional_equations = additional_equations
 
+        float_type = reduction_float_type(input_stream.header, self.maxmin == MEAN)
         if self.maxmin == MAX:
-            self.current_values = np.ones((self.nb_var, self.nb_nodes)) * (-float('Inf'))
+            self.current_values = np.full((self.nb_var, self.nb_nodes), -float('Inf'), dtype=float_type)
         elif self.maxmin == MIN:
-            self.current_values = np.ones((self.nb_var, self.nb_nodes)) * float('Inf')
+            self.current_values = np.full((self.nb_var, self.nb_nodes), float('Inf'), dtype=float_type)
         else:
-            self.current_values = np.zeros((self.nb_var, self.nb_nodes))
-
-    def additional_computation_in_frame(self, time_index):
-        computed_values = {}
-        for equation in self.additional_equations:
-            input_var_IDs = list(map(lambda x: x.ID(), equation.input))
-
-            # read (if needed) input variables values
-            for input_var_ID in input_var_IDs:
-                if input_var_ID not in computed_values:
-                    computed_values[input_var_ID] = self.input_stream.read_var_in_frame(time_index, input_var_ID)
-            # compute additional variables
-            output_values = do_calculation(equation, [computed_values[var_ID] for var_ID in input_var_IDs])
-            computed_values[equation.output.ID()] = output_values
-        return computed_values
+            self.current_values = np.zeros((self.nb_var, self.nb_nodes), dtype=float_type)
 
-    def max_min_mean_in_frame(self, time_index):
-        if self.additional_equations is not None:
-            computed_values = self.additional_computation_in_frame(time_index)
-        else:
-            computed_values = {}
+        self.plan = CalculationPlan(additional_equations if additional_equations is not None else [],
+                                    input_stream.header, [var for var, _, _ in selected_scalars],
+                                    input_stream.header.np_float_type, input_stream.header.is_2d, None)
 
-        values = np.empty((self.nb_var, self.nb_nodes))
-        for i, (var, name, unit) in enumerate(self.selected_scalars):
-            if var not in computed_values:
-                computed_values[var] = self.input_stream.read_var_in_frame(time_index, var)
-            values[i, :] = computed_values[var]
+    def max_min_mean_in_frame(self, time_index):
+        values = self.plan.run_in_frame(self.input_stream, time_index)
 
         with np.errstate(invalid='ignore'):
             if self.maxmin == MAX:
-                self.current_values = np.maximum(self.current_values, values)
+                np.maximum(self.current_values, values, out=self.current_values)
             elif self.maxmin == MIN:
-                self.current_values = np.minimum(self.current_values, values)
+                np.minimum(self.current_values, values, out=self.current_values)
             else:
                 self.current_values += values
 
+    def merge(self, other):
+        """!
+        @brief Merge the partial result computed on the following frames
+        @param other <ScalarMaxMinMeanCalculator>: the calculator run on the following frames
+        """
+        with np.errstate(invalid='ignore'):
+            if self.maxmin == MAX:
+                np.maximum(self.current_values, other.current_values, out=self.current_values)
+            elif self.maxmin == MIN:
+                np.minimum(self.current_values, other.current_values, out=self.current_values)
+            else:
+                self.current_values += other.current_values
+        self.time_indices = list(self.time_indices) + list(other.time_indices)
+
     def finishing_up(self):
         if self.maxmin == MEAN:
             self.current_values /= len(self.time_indices)
@@ -506,6 +813,8 @@ class VectorMaxMinMeanCalculator:
     """!
     Compute max/min/mean of vector variables from a Serafin input stream
     """
+    OVERLAPPING_RANGES = False
+
     def __init__(self, max_min_type, input_stream, selected_vectors, time_indices, additional_equations):
         self.maxmin = max_min_type
         self.input_stream = input_stream
@@ -516,53 +825,63 @@ class VectorMaxMinMeanCalculator:
         self.nb_nodes = input_stream.header.nb_nodes
 
         self.current_values = {}
+        self.mothers = {}
+        float_type = reduction_float_type(input_stream.header, self.maxmin == MEAN)
         for var, _, _ in selected_vectors:
             mother = _VECTORS[var][1]
+            self.mothers.setdefault(mother, []).append(var)
             if self.maxmin == MAX:
-                self.current_values[var] = np.ones((self.nb_nodes,)) * (-float('Inf'))
-                self.current_values[mother] = np.ones((self.nb_nodes,)) * (-float('Inf'))
+                self.current_values[var] = np.full((self.nb_nodes,), -float('Inf'), dtype=float_type)
+                self.current_values[mother] = np.full((self.nb_nodes,), -float('Inf'), dtype=float_type)
             elif self.maxmin == MIN:
-                self.current_values[var] = np.ones((self.nb_nodes,)) * float('Inf')
-                self.current_values[mother] = np.ones((self.nb_nodes,)) * float('Inf')
+                self.current_values[var] = np.full((self.nb_nodes,), float('Inf'), dtype=float_type)
+                self.current_values[mother] = np.full((self.nb_nodes,), float('Inf'), dtype=float_type)
             else:
-                self.current_values[var] = np.zeros((self.nb_nodes,))
-
-    def additional_computation_in_frame(self, time_index):
-        computed_values = {}
-        for equation in self.additional_equations:
-            input_var_IDs = list(map(lambda x: x.ID(), equation.input))
-
-            # read (if needed) input variables values
-            for input_var_ID in input_var_IDs:
-                if input_var_ID not in computed_values:
-                    computed_values[input_var_ID] = self.input_stream.read_var_in_frame(time_index, input_var_ID)
-            # compute additional variables
-            output_values = do_calculation(equation, [computed_values[var_ID] for var_ID in input_var_IDs])
-            computed_values[equation.output.ID()] = output_values
-        return computed_values
+                self.current_values[var] = np.zeros((self.nb_nodes,), dtype=float_type)
+
+        output_IDs = []
+        for var, _, _ in selected_vectors:
+            output_IDs.append(var)
+            if self.maxmin != MEAN:
+                output_IDs.append(_VECTORS[var][1])
+        output_IDs = list(dict.fromkeys(output_IDs))
+        self.rows = {var_ID: i for i, var_ID in enumerate(output_IDs)}
+        self.plan = CalculationPlan(additional_equations if additional_equations is not None else [],
+                                    input_stream.header, output_IDs, input_stream.header.np_float_type,
+                                    input_stream.header.is_2d, None)
 
     def max_min_mean_in_frame(self, time_index):
-        computed_values = self.additional_computation_in_frame(time_index)
+        values = self.plan.run_in_frame(self.input_stream, time_index)
 
         if self.maxmin == MEAN:
             for var, _, _ in self.selected_vectors:
-                self.current_values[var] += computed_values[var]
+                self.current_values[var] += values[self.rows[var]]
             return
 
-        for var, _, _ in self.selected_vectors:
-            mother = _VECTORS[var][1]
-
-            if mother not in computed_values:
-                computed_values[mother] = self.input_stream.read_var_in_frame(time_index, mother)
-            if var not in computed_values:
-                computed_values[var] = self.input_stream.read_var_in_frame(time_index, var)
+        self._update_with({var_ID: values[row] for var_ID, row in self.rows.items()})
 
+    def _update_with(self, values):
+        # the components are taken where their magnitude is greater (or less) than the current one
+        for mother in self.mothers:
             if self.maxmin == MAX:
-                self.current_values[var] = np.where(computed_values[mother] > self.current_values[mother],
-                                                    computed_values[var], self.current_values[var])
+                flags = values[mother] > self.current_values[mother]
             else:
-                self.current_values[var] = np.where(computed_values[mother] < self.current_values[mother],
-                                                    computed_values[var], self.current_values[var])
+                flags = values[mother] < self.current_values[mother]
+            for var in self.mothers[mother]:
+                self.current_values[var] = np.where(flags, values[var], self.current_values[var])
+            self.current_values[mother] = np.where(flags, values[mother], self.current_values[mother])
+
+    def merge(self, other):
+        """!
+        @brief Merge the partial result computed on the following frames
+        @param other <VectorMaxMinMeanCalculator>: the calculator run on the following frames
+        """
+        if self.maxmin == MEAN:
+            for var, _, _ in self.selected_vectors:
+                self.current_values[var] += other.current_values[var]
+        else:
+            self._update_with(other.current_values)
+        self.time_indices = list(self.time_indices) + list(other.time_indices)
 
     def finishing_up(self):
         values = np.empty((len(self.selected_vectors), self.nb_nodes))
@@ -578,57 +897,308 @@ class VectorMaxMinMeanCalculator:
             self.max_min_mean_in_frame(time_index)
 
 
-class ArrivalDurationCalculator:
+class ScalarStdCalculator:
     """!
-    Compute arrival/duration of conditions from a Serafin input stream
+    Compute the standard deviation in time of 2D scalar variables from a Serafin input stream (Welford algorithm)
     """
-    def __init__(self, input_stream, time_indices, condition):
+    OVERLAPPING_RANGES = False
+
+    def __init__(self, input_stream, selected_scalars, time_indices, additional_equations=None):
+        self.input_stream = input_stream
+        self.selected_scalars = selected_scalars
+        self.time_indices = time_indices
+
+        self.nb_var = len(selected_scalars)
+        self.nb_nodes = input_stream.header.nb_nodes
+        self.count = 0
+        float_type = reduction_float_type(input_stream.header, True)
+        self.mean = np.zeros((self.nb_var, self.nb_nodes), dtype=float_type)
+        self.m2 = np.zeros((self.nb_var, self.nb_nodes), dtype=float_type)
+        self.delta = np.empty((self.nb_var, self.nb_nodes), dtype=float_type)
+
+        self.plan = CalculationPlan(additional_equations if additional_equations is not None else [],
+                                    input_stream.header, [var for var, _, _ in selected_scalars], float_type,
+                                    input_stream.header.is_2d, None)
+
+    def std_in_frame(self, time_index):
+        values = self.plan.run_in_frame(self.input_stream, time_index)
+        self.count += 1
+        np.subtract(values, self.mean, out=self.delta)
+        self.mean += self.delta / self.count
+        values -= self.mean
+        values *= self.delta
+        self.m2 += values
+
+    def merge(self, other):
+        """!
+        @brief Merge the partial result computed on the following frames
+        @param other <ScalarStdCalculator>: the calculator run on the following frames
+        """
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * (other.count / count)
+        self.m2 += other.m2 + np.square(delta) * (self.count * other.count / count)
+        self.count = count
+        self.time_indices = list(self.time_indices) + list(other.time_indices)
+
+    def finishing_up(self):
+        return np.sqrt(self.m2 / self.count)
+
+    def run(self):
+        for time_index in self.time_indices:
+            self.std_in_frame(time_index)
+
+
+class ScalarPercentileCalculator:
+    """!
+    Estimate a percentile in time of 2D scalar variables from a Serafin input stream
+    (P-square algorithm: five markers per node, exact up to five frames)
+    """
+    OVERLAPPING_RANGES = False
+
+    def __init__(self, input_stream, selected_scalars, time_indices, percentile, additional_equations=None):
         self.input_stream = input_stream
+        self.selected_scalars = selected_scalars
         self.time_indices = time_indices
-        self.expression = condition.expression
-        self.test_condition = condition.test_condition
+        self.percentile = percentile
+
+        self.nb_var = len(selected_scalars)
+        self.nb_nodes = input_stream.header.nb_nodes
+        self.count = 0
+
+        # marker heights and positions, the desired positions are the same for all nodes
+        p = percentile / 100
+        self.heights = np.empty((5, self.nb_var, self.nb_nodes))
+        self.positions = np.empty((5, self.nb_var, self.nb_nodes))
+        self.desired_positions = np.array([1, 1 + 2*p, 1 + 4*p, 3 + 2*p, 5])
+        self.increments = np.array([0, p/2, p, (1+p)/2, 1])
+
+        self.plan = CalculationPlan(additional_equations if additional_equations is not None else [],
+                                    input_stream.header, [var for var, _, _ in selected_scalars], np.float64,
+                                    input_stream.header.is_2d, None)
+
+    def percentile_in_frame(self, time_index):
+        values = self.plan.run_in_frame(self.input_stream, time_index)
+        self.count += 1
+        if self.count <= 5:
+            self.heights[self.count-1] = values
+            if self.count == 5:
+                self.heights.sort(axis=0)
+                self.positions[:] = np.arange(1, 6).reshape((5, 1, 1))
+            return
+
+        q, n = self.heights, self.positions
+        with np.errstate(invalid='ignore'):
+            cell = (values >= q[1]).astype(int) + (values >= q[2]) + (values >= q[3])
+            np.minimum(q[0], values, out=q[0])
+            np.maximum(q[4], values, out=q[4])
+            for i in range(1, 5):
+                n[i] += cell < i
+            self.desired_positions += self.increments
+
+            for i in range(1, 4):
+                d = self.desired_positions[i] - n[i]
+                up = np.logical_and(d >= 1, n[i+1] - n[i] > 1)
+                down = np.logical_and(d <= -1, n[i-1] - n[i] < -1)
+                move = np.logical_or(up, down)
+                if not move.any():
+                    continue
+                sign = np.where(up, 1., -1.)
+                parabolic = q[i] + sign / (n[i+1] - n[i-1]) \
+                    * ((n[i] - n[i-1] + sign) * (q[i+1] - q[i]) / (n[i+1] - n[i])
+                       + (n[i+1] - n[i] - sign) * (q[i] - q[i-1]) / (n[i] - n[i-1]))
+                linear = q[i] + sign * (np.where(up, q[i+1], q[i-1]) - q[i]) / (np.where(up, n[i+1], n[i-1]) - n[i])
+                adjusted = np.where(np.logical_and(q[i-1] < parabolic, parabolic < q[i+1]), parabolic, linear)
+                q[i] = np.where(move, adjusted, q[i])
+                n[i] += np.where(move, sign, 0)
+
+    def finishing_up(self):
+        if self.count <= 5:
+            return np.percentile(self.heights[:self.count], self.percentile, axis=0)
+        return self.heights[2].copy()
+
+    def run(self):
+        for time_index in self.time_indices:
+            self.percentile_in_frame(time_index)
+
+
+class ScalarExceedanceCalculator:
+    """!
+    Compute the duration above a threshold of 2D scalar variables from a Serafin input stream
+    (the values are linearly interpolated between frames)
+    """
+    OVERLAPPING_RANGES = True  # consecutive ranges of frames share their boundary frame
+
+    def __init__(self, input_stream, selected_scalars, time_indices, threshold, additional_equations=None):
+        self.input_stream = input_stream
+        self.selected_scalars = selected_scalars
+        self.time_indices = time_indices
+        self.threshold = threshold
+
+        self.nb_var = len(selected_scalars)
+        self.nb_nodes = input_stream.header.nb_nodes
+        self.duration = np.zeros((self.nb_var, self.nb_nodes), dtype=reduction_float_type(input_stream.header, True))
 
-        # first
-        self.previous_time = self.input_stream.time[self.time_indices[0]]
-        self.previous_value = evaluate_expression(self.input_stream, self.time_indices[0], self.expression)
-        self.previous_flag = self.test_condition(self.previous_value)
+        self.plan = CalculationPlan(additional_equations if additional_equations is not None else [],
+                                    input_stream.header, [var for var, _, _ in selected_scalars],
+                                    reduction_float_type(input_stream.header), input_stream.header.is_2d, None)
+        self.previous_time = input_stream.time[time_indices[0]]
+        self.previous_values = self.plan.run_in_frame(input_stream, time_indices[0]).copy()
 
-        self.duration = np.zeros((self.input_stream.header.nb_nodes,))
+    def exceedance_in_frame(self, time_index):
+        current_time = self.input_stream.time[time_index]
+        values = self.plan.run_in_frame(self.input_stream, time_index)
+
+        previous_above = self.previous_values > self.threshold
+        current_above = values > self.threshold
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # fraction of the time step spent above the threshold
+            fraction = np.where(previous_above,
+                                np.where(current_above, 1,
+                                         (self.previous_values - self.threshold) / (self.previous_values - values)),
+                                np.where(current_above, (values - self.threshold) / (values - self.previous_values),
+                                         0))
+        self.duration += (current_time - self.previous_time) * fraction
+
+        self.previous_time = current_time
+        self.previous_values[:] = values
+
+    def merge(self, other):
+        """!
+        @brief Merge the partial result computed on the following frames
+        @param other <ScalarExceedanceCalculator>: the calculator run from the last frame of this one
+        """
+        self.duration += other.duration
+        self.previous_time = other.previous_time
+        self.previous_values = other.previous_values
+        self.time_indices = list(self.time_indices) + list(other.time_indices[1:])
+
+    def finishing_up(self):
+        return self.duration
+
+    def run(self):
+        for time_index in self.time_indices[1:]:
+            self.exceedance_in_frame(time_index)
+
+
+class MultiArrivalDurationCalculator:
+    """!
+    Compute arrival/duration of multiple conditions from a Serafin input stream
+    (each variable is read once per frame, identical expressions are evaluated once)
+    """
+    OVERLAPPING_RANGES = True  # consecutive ranges of frames share their boundary frame
+
+    def __init__(self, input_stream, time_indices, conditions):
+        self.input_stream = input_stream
+        self.time_indices = time_indices
+        self.conditions = conditions
+        self.nb_conditions = len(conditions)
+        self.nb_nodes = input_stream.header.nb_nodes
+
+        expressions, self.expression_indices = [], []
+        for condition in conditions:
+            expression = tuple(condition.expression)
+            if expression not in expressions:
+                expressions.append(expression)
+            self.expression_indices.append(expressions.index(expression))
+        self.evaluators = [CompiledExpression(list(expression)) for expression in expressions]
+        self.var_IDs = list(dict.fromkeys(var_ID for evaluator in self.evaluators for var_ID in evaluator.var_IDs))
+
+        # one row per condition, the current and previous values are swapped after each frame
+        float_type = reduction_float_type(input_stream.header)
+        self.current_value = np.empty((self.nb_conditions, self.nb_nodes), dtype=float_type)
+        self.previous_value = np.empty((self.nb_conditions, self.nb_nodes), dtype=float_type)
+
+        # first (the times and durations are in double precision)
+        self.previous_time = np.float64(self.input_stream.time[self.time_indices[0]])
+        self.evaluate_in_frame(self.time_indices[0], self.previous_value)
+        self.previous_flag = self.test_conditions(self.previous_value)
+
+        self.duration = np.zeros((self.nb_conditions, self.nb_nodes))
         self.arrival = np.where(self.previous_flag, self.previous_time, float('Inf'))
-        self.previous_flip = np.ones((input_stream.header.nb_nodes,)) * self.previous_time
+        self.flip_arrival = np.ones((self.nb_conditions, self.nb_nodes)) * float('Inf')  # without the first frame
+        self.previous_flip = np.ones((self.nb_conditions, self.nb_nodes)) * self.previous_time
+        self.flip_forward = np.zeros((self.nb_conditions, self.nb_nodes), dtype=bool)
+
+    def evaluate_in_frame(self, index, out):
+        values = {var_ID: self.input_stream.read_var_in_frame(index, var_ID) for var_ID in self.var_IDs}
+        expression_values = [evaluator.evaluate(values) for evaluator in self.evaluators]
+        for row, expression_index in enumerate(self.expression_indices):
+            out[row] = expression_values[expression_index]
+
+    def test_conditions(self, values):
+        flags = np.empty(values.shape, dtype=bool)
+        for row, condition in enumerate(self.conditions):
+            flags[row] = condition.test_condition(values[row])
+        return flags
 
     def arrival_duration_in_frame(self, index):
-        current_time = self.input_stream.time[index]
-        current_value = evaluate_expression(self.input_stream, index, self.expression)
+        current_time = np.float64(self.input_stream.time[index])
+        current_value = self.current_value
+        self.evaluate_in_frame(index, current_value)
+        # the crossing times are in double precision: with numpy < 2, float32 values times a float64 scalar are float32
+        current_double = current_value.astype(np.float64, copy=False)
+        previous_double = self.previous_value.astype(np.float64, copy=False)
         with np.errstate(divide='ignore', invalid='ignore'):
-            t_star = (current_value * self.previous_time - self.previous_value * current_time) \
-                     / (current_value - self.previous_value)
-            new_arrival = np.minimum(self.arrival, t_star)
+            t_star = (current_double * self.previous_time - previous_double * current_time) \
+                     / (current_double - previous_double)
 
-        current_flag = self.test_condition(current_value)
+        current_flag = self.test_conditions(current_value)
         flip_forward = np.logical_and(current_flag, np.logical_not(self.previous_flag))
-        flip_backward = np.logical_and(self.previous_flag, np.logical_not(current_flag))
 
         if index == self.time_indices[-1]:  # last
-            self.duration = np.where(np.logical_and(self.previous_flag, current_flag),
-                                     self. duration + self.input_stream.time[index] - self.previous_flip,
-                                     np.where(self.previous_flag, self.duration + t_star - self.previous_flip,
-                                              self.duration))
+            ends = np.where(current_flag, current_time, t_star)
+            np.add(self.duration, ends - self.previous_flip, out=self.duration, where=self.previous_flag)
         else:
-            self.duration = np.where(flip_backward, self.duration + t_star - self.previous_flip, self.duration)
+            flip_backward = np.logical_and(self.previous_flag, np.logical_not(current_flag))
+            np.add(self.duration, t_star - self.previous_flip, out=self.duration, where=flip_backward)
 
-        self.arrival = np.where(flip_forward, new_arrival, self.arrival)
+        np.minimum(self.arrival, t_star, out=self.arrival, where=flip_forward)
+        np.minimum(self.flip_arrival, t_star, out=self.flip_arrival, where=flip_forward)
+        np.copyto(self.previous_flip, t_star, where=flip_forward)
 
-        self.previous_flip = np.where(flip_forward, t_star, self.previous_flip)
         self.previous_flag = current_flag
-        self.previous_value = current_value
         self.previous_time = current_time
+        self.flip_forward = flip_forward
+        self.current_value, self.previous_value = self.previous_value, current_value
+
+    def merge(self, other):
+        """!
+        @brief Merge the partial result computed on the following frames
+        @param other <MultiArrivalDurationCalculator>: the calculator run from the last frame of this one
+        """
+        # the conditions which become true just before the common frame are counted only from this frame by the other
+        self.duration += np.where(self.flip_forward, self.previous_time - self.previous_flip, 0) + other.duration
+        # the first frame of the other is the last one of this calculator, only the later arrivals are new
+        np.minimum(self.arrival, other.flip_arrival, out=self.arrival)
+        np.minimum(self.flip_arrival, other.flip_arrival, out=self.flip_arrival)
+
+        self.previous_flip = other.previous_flip
+        self.previous_flag = other.previous_flag
+        self.previous_value = other.previous_value
+        self.previous_time = other.previous_time
+        self.flip_forward = other.flip_forward
+        self.time_indices = list(self.time_indices) + list(other.time_indices[1:])
+
+    def finishing_up(self):
+        values = np.empty((2 * self.nb_conditions, self.nb_nodes))
+        values[0::2] = self.arrival
+        values[1::2] = self.duration
+        return values
 
     def run(self):
         for index in self.time_indices[1:]:
             self.arrival_duration_in_frame(index)
 
 
+class ArrivalDurationCalculator(MultiArrivalDurationCalculator):
+    """!
+    Compute arrival/duration of a single condition from a Serafin input stream
+    """
+    def __init__(self, input_stream, time_indices, condition):
+        super().__init__(input_stream, time_indices, [condition])
+
+
 class Condition:
     """!
     Condition to compare a variable with a threshold for arrival/duration
@@ -638,16 +1208,20 @@ class Condition:
         self.literal_expression = literal_expression
         self.comparator = comparator
         self.threshold = threshold
-        
+
+        # numpy comparison functions (unlike lambdas) let the condition be sent to worker processes
         if self.comparator == '>':
-            self.test_condition = lambda value: value > self.threshold
+            self._compare = np.greater
         elif self.comparator == '<':
-            self.test_condition = lambda value: value < self.threshold
+            self._compare = np.less
         elif self.comparator == '>=':
-            self.test_condition = lambda value: value >= self.threshold
+            self._compare = np.greater_equal
         else:
-            self.test_condition = lambda value: value <= self.threshold
-            
+            self._compare = np.less_equal
+
+    def test_condition(self, value):
+        return self._compare(value, self.threshold)
+
     def __repr__(self):
         return ' '.join(self.expression) + ' %s %s' % (self.comparator, str(self.threshold))
 
@@ -736,6 +1310,8 @@ class SynchMaxCalculator:
     """!
     Compute multiple synchronized maxima with respect to a reference variable
     """
+    OVERLAPPING_RANGES = False
+
     def __init__(self, input_stream, selected_vars, time_indices, ref_var):
         self.input_stream = input_stream
         self.selected_vars = selected_vars
@@ -746,6 +1322,7 @@ class SynchMaxCalculator:
         if ref_var not in selected_vars:
             self.read_ref = True
         self.nb_nodes = input_stream.header.nb_nodes
+        # the times are in double precision, the values are kept in the file precision
         self.current_values = {'time': np.ones((self.nb_nodes,)) * self.input_stream.time[time_indices[0]]}
 
         for var, _, _ in selected_vars:
@@ -768,6 +1345,16 @@ class SynchMaxCalculator:
         time_value = self.input_stream.time[time_index]
         self.current_values['time'] = np.where(flags, time_value, self.current_values['time'])
 
+    def merge(self, other):
+        """!
+        @brief Merge the partial result computed on the following frames
+        @param other <SynchMaxCalculator>: the calculator run on the following frames
+        """
+        flags = other.current_values[self.ref_var] > self.current_values[self.ref_var]
+        for var in self.current_values:
+            self.current_values[var] = np.where(flags, other.current_values[var], self.current_values[var])
+        self.time_indices = list(self.time_indices) + list(other.time_indices)
+
     def finishing_up(self):
         values = np.empty((len(self.selected_vars)+1, self.nb_nodes))
         values[0, :] = self.current_values['time']
@@ -129,6 +129,83 @@ def do_calculation(equation, input_values):
     return operation(input_values[0], input_values[1], input_values[2])
 
 
+def norm2_3d_in_place(out, a, b, c):
+    np.hypot(a, b, out=out)
+    np.hypot(out, c, out=out)
+
+
+def compute_TAU_in_place(out, x):
+    np.square(x, out=out)
+    out *= RHO_WATER
+
+
+def compute_CHEZY_in_place(out, w, h, m):
+    # sqrt(m^2 * g / w^2) = |m / w| * sqrt(g)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(m, w, out=out)
+    np.abs(out, out=out)
+    out *= np.sqrt(GRAVITY)
+
+
+def compute_STRICKLER_in_place(out, w, h, m):
+    # sqrt(m^2 * g / w^2 / cubic_root(h)) = |m / (w * sqrt(cbrt(|h|)))| * sqrt(g)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.abs(h, out=out)
+        np.cbrt(out, out=out)
+        np.sqrt(out, out=out)
+        out *= w
+        np.divide(m, out, out=out)
+    np.abs(out, out=out)
+    out *= np.sqrt(GRAVITY)
+
+
+def compute_MANNING_in_place(out, w, h, m):
+    # sqrt(m^2 * g * w^2 / cubic_root(h)) = |m * w / sqrt(cbrt(|h|))| * sqrt(g)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.abs(h, out=out)
+        np.cbrt(out, out=out)
+        np.sqrt(out, out=out)
+        np.divide(m, out, out=out)
+        out *= w
+    np.abs(out, out=out)
+    out *= np.sqrt(GRAVITY)
+
+
+def compute_C_in_place(out, h):
+    np.multiply(h, GRAVITY, out=out)
+    with np.errstate(invalid='ignore'):
+        np.sqrt(out, out=out)
+
+
+# operations writing their result in a preallocated array (without temporary arrays)
+IN_PLACE_OPERATIONS = {
+    PLUS: lambda out, a, b: np.add(a, b, out=out),
+    MINUS: lambda out, a, b: np.subtract(a, b, out=out),
+    TIMES: lambda out, a, b: np.multiply(a, b, out=out),
+    NORM2: lambda out, a, b: np.hypot(a, b, out=out),
+    NORM2_3D: norm2_3d_in_place,
+    COMPUTE_TAU: compute_TAU_in_place,
+    COMPUTE_CHEZY: compute_CHEZY_in_place,
+    COMPUTE_STRICKLER: compute_STRICKLER_in_place,
+    COMPUTE_MANNING: compute_MANNING_in_place,
+    COMPUTE_C: compute_C_in_place,
+    COMPUTE_F: lambda out, m, c: np.divide(m, c, out=out)
+}
+
+
+def do_calculation_in_place(equation, input_values, out):
+    """!
+    @brief Apply an equation on input values and write the result in a preallocated array
+    @param equation <Equation>: an equation object
+    @param input_values <[numpy 1D-array]>: the values of the input variables
+    @param out <numpy 1D-array>: the array receiving the values of the output variable
+    """
+    if equation.operator in IN_PLACE_OPERATIONS:
+        IN_PLACE_OPERATIONS[equation.operator](out, *input_values)
+    else:
+        out[:] = do_calculation(equation, input_values)
+
+
 def get_available_variables(computables, basic_equations):
     """!
     @brief Determine the list of new variables (2D or 3D) computable from the input variables by basic relations
@@ -7,7 +7,7 @@ import numpy as np
 from slf.variable.variables_2d import get_available_2d_variables, get_necessary_2d_equations, \
                                       get_US_equation, new_variables_from_US
 from slf.variable.variables_3d import get_available_3d_variables, get_necessary_3d_equations
-from slf.variable.variables_utils import do_calculation
+from slf.variable.variables_utils import do_calculation, do_calculation_in_place
 
 
 def get_available_variables(input_variables, is_2d):
@@ -72,3 +72,97 @@ def do_calculations_in_frame(equations, input_serafin, time_index, selected_outp
             output_values[i, :] = computed_values[var_ID]
     return output_values
 
+
+class CalculationPlan:
+    """!
+    @brief The equations needed for the selected variables, compiled once into an execution plan
+
+    The plan resolves once which variables are read from the file, in which order the equations are applied
+    and where their results are stored:
+    - a computed variable which is selected is written directly in its row of the output array,
+    - the other computed variables are written in work buffers, reused as soon as their variable is no longer needed.
+    All computations are done in place in the output float type. The output array is reused from frame to frame.
+    """
+    def __init__(self, equations, header, selected_output_IDs, output_float_type, is_2d, us_equation):
+        """!
+        @param equations <[slf.variables_utils.Equation]>: list of all equations necessary to compute selected variables
+        @param header <slf.Serafin.SerafinHeader>: the input header
+        @param selected_output_IDs <[str]>: the short names of the selected output variables
+        @param output_float_type <numpy.dtype>: float32 or float64 according to the output file type
+        @param is_2d <bool>: True if input data is 2D
+        @param us_equation <slf.variables_utils.Equation>: user-specified friction law equation (None to keep US as is)
+        """
+        self.nb_nodes = header.nb_nodes
+        self.output_values = np.empty((len(selected_output_IDs), self.nb_nodes), dtype=output_float_type)
+        output_rows = {var_ID: i for i, var_ID in enumerate(selected_output_IDs)}
+
+        # resolve the inputs and outputs of every equation
+        steps = []
+        known = set()
+        for equation in equations:
+            input_var_IDs = [var.ID() for var in equation.input]
+            reads = [var_ID for var_ID in input_var_IDs if var_ID not in known and var_ID[:5] != 'ROUSE']
+            known.update(reads)
+            if is_2d and equation.output.ID() == 'US' and us_equation is not None:
+                equation = us_equation
+            elif is_2d and equation.output.ID() == 'ROUSE':
+                # the output (stored under the ID of the first input) depends only on US
+                steps.append((reads, equation, ['US'], input_var_IDs[0]))
+                known.add(input_var_IDs[0])
+                continue
+            steps.append((reads, equation, input_var_IDs, equation.output.ID()))
+            known.add(equation.output.ID())
+
+        last_use = {}
+        for i, (_, _, input_var_IDs, _) in enumerate(steps):
+            for var_ID in input_var_IDs:
+                last_use[var_ID] = i
+
+        # assign a buffer to every computed variable
+        self.steps = []
+        self.nb_buffers = 0
+        free_buffers = []
+        buffer_of = {}
+        for i, (reads, equation, input_var_IDs, output_ID) in enumerate(steps):
+            if output_ID in output_rows:
+                out = self.output_values[output_rows[output_ID]]
+            else:
+                if free_buffers:
+                    out = free_buffers.pop()
+                else:
+                    out = np.empty((self.nb_nodes,), dtype=output_float_type)
+                    self.nb_buffers += 1
+                buffer_of[output_ID] = out
+            self.steps.append((reads, equation, input_var_IDs, output_ID, out))
+            for var_ID in set(input_var_IDs):
+                if last_use[var_ID] == i and var_ID in buffer_of and var_ID not in output_rows:
+                    free_buffers.append(buffer_of.pop(var_ID))
+
+        # the selected variables which are not computed are read directly
+        computed = set(output_ID for _, _, _, output_ID, _ in self.steps)
+        self.copies = [(i, var_ID) for i, var_ID in enumerate(selected_output_IDs) if var_ID not in computed]
+
+    def run_in_frame(self, input_serafin, time_index):
+        """!
+        @brief Return the selected variables values in a single time frame
+        @param input_serafin <Serafin.Read>: input stream for reading necessary variables
+        @param time_index <int>: the position of time frame to read
+        @return <numpy.ndarray>: the values of the selected output variables (overwritten by the next call)
+        """
+        values = {}
+        for reads, equation, input_var_IDs, output_ID, out in self.steps:
+            for var_ID in reads:
+                values[var_ID] = input_serafin.read_var_in_frame(time_index, var_ID)
+            if equation.output.ID() == 'ROUSE':
+                out[:] = equation.operator(values['US'])
+            else:
+                do_calculation_in_place(equation, [values[var_ID] for var_ID in input_var_IDs], out)
+            values[output_ID] = out
+
+        for i, var_ID in self.copies:
+            if var_ID in values:
+                self.output_values[i] = values[var_ID]
+            else:
+                self.output_values[i] = input_serafin.read_var_in_frame(time_index, var_ID)
+        return self.output_values
+
@@ -4,6 +4,7 @@ Volume calculations in polygons
 
 
 import numpy as np
+from scipy import sparse
 import shapely.geometry as geom
 
 from geom import geometry
@@ -38,13 +39,8 @@ class TruncatedTriangularPrisms(Mesh2D):
         @param polygon <geom.geometry.Polyline>: A polygon
         @return <numpy.1D-array>: The weight carried by the triangle nodes
         """
-        potential_elements = self.get_intersecting_elements(polygon.bounds())
-        weight = np.zeros((self.nb_points,), dtype=np.float64)
-        for i, j, k in potential_elements:
-            t = self.triangles[i, j, k]
-            if polygon.contains(t):
-                weight[[i, j, k]] += t.area
-        return weight / 3.0
+        interior, _ = self.polygon_overlay(polygon)
+        return self._interior_weight(interior) / 3.0
 
     def polygon_intersection(self, polygon):
         """!
@@ -52,20 +48,13 @@ class TruncatedTriangularPrisms(Mesh2D):
         @param polygon <geom.geometry.Polyline>: A polygon
         @return <numpy.1D-array, dict>: The weight carried by the triangle nodes, and the dictionary of tuple (area, centroid value) for boundary triangles
         """
-        potential_elements = self.get_intersecting_elements(polygon.bounds())
-        weight = np.zeros((self.nb_points,), dtype=np.float64)
+        interior, boundary = self.polygon_overlay(polygon)
         triangle_polygon_intersection = {}
-        for i, j, k in potential_elements:
-            t = self.triangles[i, j, k]
-            if polygon.contains(t):
-                weight[[i, j, k]] += t.area
-            else:
-                is_intersected, intersection = polygon.polygon_intersection(t)
-                if is_intersected:
-                    centroid = intersection.centroid
-                    interpolator = Interpolator(t).get_interpolator_at(centroid.x, centroid.y)
-                    triangle_polygon_intersection[i, j, k] = (intersection.area, interpolator)
-        return weight / 3.0, triangle_polygon_intersection
+        for (i, j, k), intersection in boundary:
+            centroid = intersection.centroid
+            interpolator = Interpolator(self.triangles[i, j, k]).get_interpolator_at(centroid.x, centroid.y)
+            triangle_polygon_intersection[i, j, k] = (intersection.area, interpolator)
+        return self._interior_weight(interior) / 3.0, triangle_polygon_intersection
 
     def polygon_intersection_all(self, polygon):
         """!
@@ -73,28 +62,45 @@ class TruncatedTriangularPrisms(Mesh2D):
         @param polygon <geom.geometry.Polyline>: A polygon
         @return <dict, dict>: The dictionaries of all triangles contained in polygon, and of tuples (base triangle, intersection) for boundary triangles
         """
-        potential_elements = self.get_intersecting_elements(polygon.bounds())
-        weight = np.zeros((self.nb_points,), dtype=np.float64)
+        interior, boundary = self.polygon_overlay(polygon)
+        areas = self.triangle_areas(interior)
         triangles = {}
+        for (i, j, k), area in zip(interior, areas):
+            triangles[i, j, k] = ((self.points[i], self.points[j], self.points[k]), area)
+
         triangle_polygon_net_intersection = {}
         triangle_polygon_intersection = {}
-        for i, j, k in potential_elements:
+        for (i, j, k), intersection in boundary:
             t = self.triangles[i, j, k]
-            if polygon.contains(t):
-                area = t.area
-                vertices = tuple(map(np.array, list(t.exterior.coords)[:-1]))
-                triangles[i, j, k] = (vertices, area)
-                weight[[i, j, k]] += area
-            else:
-                is_intersected, intersection = polygon.polygon_intersection(t)
-                if is_intersected:
-                    vertices = tuple(map(np.array, list(t.exterior.coords)[:-1]))
-                    area = t.area
-                    centroid = intersection.centroid
-                    interpolator = Interpolator(t).get_interpolator_at(centroid.x, centroid.y)
-                    triangle_polygon_net_intersection[i, j, k] = (intersection.area, interpolator)
-                    triangle_polygon_intersection[i, j, k] = (vertices, area, intersection)
-        return weight / 3.0, triangle_polygon_net_intersection, triangles, triangle_polygon_intersection
+            vertices = tuple(map(np.array, list(t.exterior.coords)[:-1]))
+            centroid = intersection.centroid
+            interpolator = Interpolator(t).get_interpolator_at(centroid.x, centroid.y)
+            triangle_polygon_net_intersection[i, j, k] = (intersection.area, interpolator)
+            triangle_polygon_intersection[i, j, k] = (vertices, t.area, intersection)
+        return self._interior_weight(interior, areas) / 3.0, triangle_polygon_net_intersection, \
+            triangles, triangle_polygon_intersection
+
+    def triangle_areas(self, elements):
+        """!
+        @brief Return the areas of the given triangles, without building their geometries
+        @param elements <[tuple]>: The list of triangles (i,j,k)
+        @return <numpy.1D-array>: The areas of the triangles
+        """
+        elements = np.array(elements, dtype=np.int64).reshape(-1, 3)
+        p1, p2, p3 = self.points[elements[:, 0]], self.points[elements[:, 1]], self.points[elements[:, 2]]
+        return np.abs((p2[:, 0] - p1[:, 0]) * (p3[:, 1] - p1[:, 1])
+                      - (p3[:, 0] - p1[:, 0]) * (p2[:, 1] - p1[:, 1])) / 2.0
+
+    def _interior_weight(self, interior, areas=None):
+        """!
+        @brief Return the total area of the interior triangles around every node
+        """
+        if areas is None:
+            areas = self.triangle_areas(interior)
+        weight = np.zeros((self.nb_points,), dtype=np.float64)
+        if interior:
+            np.add.at(weight, np.array(interior, dtype=np.int64), areas[:, np.newaxis])
+        return weight
 
     @staticmethod
     def boundary_volume_in_polygon(triangle_polygon_intersection, variable):
@@ -137,6 +143,26 @@ class TruncatedTriangularPrisms(Mesh2D):
             volume_negative = area * z_bottom ** 3 / 3 / (z_top - z_bottom) / (z_middle - z_bottom)
             return volume_total - volume_negative
 
+    @staticmethod
+    def superior_prism_volumes(areas, values):
+        """!
+        @brief Return the volumes in the half-space z > 0 of many prisms at once
+        @param areas <numpy.1D-array>: The areas of the base triangles
+        @param values <numpy.2D-array>: The values of the variable on the three nodes of every triangle, of shape (number of triangles, 3)
+        @return <numpy.1D-array>: The volumes of the prisms in the half-space z > 0
+        """
+        z_bottom, z_middle, z_top = np.sort(values, axis=1).T
+        # the values are summed in the node order, as in superior_prism_volume
+        volume_total = areas * (values[:, 0] + values[:, 1] + values[:, 2]) / 3.0
+
+        # the closed-form formulas are only evaluated where the triangle crosses the plane z = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            positive_tetrahedron = areas * z_top ** 3 / 3 / (z_top - z_middle) / (z_top - z_bottom)
+            negative_tetrahedron = areas * z_bottom ** 3 / 3 / (z_top - z_bottom) / (z_middle - z_bottom)
+        volumes = np.where(z_middle > 0, volume_total - negative_tetrahedron, positive_tetrahedron)
+        volumes = np.where(z_bottom >= 0, volume_total, volumes)
+        return np.where(z_top <= 0, 0.0, volumes)
+
     @staticmethod
     def superior_prism_volume_in_intersection(polygon, vertices, area, intersection, values):
         """!
@@ -204,6 +230,8 @@ class VolumeCalculator:
     NET_STRICT, NET, POSITIVE = 0, 1, 2
     INIT_VALUE = '+'  # special variable ID for the option 'Initial values of the first variable'
 
+    BLOCK_SIZE = 64  # number of frames combined in a single sparse product
+
     def __init__(self, volume_type, var_ID, second_var_ID, input_stream, polynames, polygons,
                  time_sampling_frequency):
         self.volume_type = volume_type
@@ -218,6 +246,16 @@ class VolumeCalculator:
 
         self.mesh = None
         self.weights = []
+        self.weight_matrix = None
+
+        # interior and boundary triangles of all polygons as flat arrays, for the vectorized positive volume
+        self.interior_nodes = None
+        self.interior_areas = None
+        self.interior_polygons = None
+        self.boundary_nodes = None
+        self.boundary_areas = None
+        self.boundary_polygons = None
+        self.boundary_geometries = []
 
         self.init_values = None
         if self.second_var_ID == VolumeCalculator.INIT_VALUE:
@@ -240,6 +278,136 @@ class VolumeCalculator:
         elif self.volume_type == VolumeCalculator.POSITIVE:
             for poly in self.polygons:
                 self.weights.append(self.mesh.polygon_intersection_all(poly))
+            self.construct_prism_arrays()
+        self.construct_weight_matrix()
+
+    def construct_prism_arrays(self):
+        """!
+        @brief Gather the interior and boundary triangles of every polygon into flat arrays
+        """
+        interior_nodes, interior_areas, interior_polygons = [], [], []
+        boundary_nodes, boundary_areas, boundary_polygons = [], [], []
+        for j, (_, _, triangles, triangle_polygon_intersection) in enumerate(self.weights):
+            for (a, b, c), (_, area) in triangles.items():
+                interior_nodes.append((a, b, c))
+                interior_areas.append(area)
+                interior_polygons.append(j)
+            for (a, b, c), (vertices, area, intersection) in triangle_polygon_intersection.items():
+                boundary_nodes.append((a, b, c))
+                boundary_areas.append(area)
+                boundary_polygons.append(j)
+                self.boundary_geometries.append((vertices, intersection))
+        self.interior_nodes = np.array(interior_nodes, dtype=np.int64).reshape(-1, 3)
+        self.interior_areas = np.array(interior_areas, dtype=np.float64)
+        self.interior_polygons = np.array(interior_polygons, dtype=np.int64)
+        self.boundary_nodes = np.array(boundary_nodes, dtype=np.int64).reshape(-1, 3)
+        self.boundary_areas = np.array(boundary_areas, dtype=np.float64)
+        self.boundary_polygons = np.array(boundary_polygons, dtype=np.int64)
+
+    def construct_weight_matrix(self):
+        """!
+        @brief Assemble the strict and boundary weights of all polygons into a sparse (nb_polygons, nb_nodes) matrix
+        """
+        self.weight_matrix = self.assemble_weight_matrix(self.volume_type != VolumeCalculator.NET_STRICT)
+
+    def assemble_weight_matrix(self, with_boundary):
+        """!
+        @brief Assemble the weights of all polygons into a sparse (nb_polygons, nb_nodes) matrix
+        @param with_boundary <bool>: include the weights of the boundary triangle-polygon intersections
+        @return <scipy.sparse.csr_matrix>: The weight matrix
+        """
+        rows, cols, data = [], [], []
+        for j, weight in enumerate(self.weights):
+            if self.volume_type == VolumeCalculator.NET_STRICT:
+                strict_weight, triangle_polygon_intersection = weight, {}
+            else:
+                strict_weight, triangle_polygon_intersection = weight[0], weight[1]
+            if not with_boundary:
+                triangle_polygon_intersection = {}
+            nodes = np.flatnonzero(strict_weight)
+            rows.append(np.full(len(nodes), j, dtype=np.int64))
+            cols.append(nodes)
+            data.append(strict_weight[nodes])
+            for (a, b, c), (area, interpolator) in triangle_polygon_intersection.items():
+                rows.append(np.full(3, j, dtype=np.int64))
+                cols.append(np.array([a, b, c], dtype=np.int64))
+                data.append(area * interpolator)
+        if rows:
+            rows, cols, data = np.concatenate(rows), np.concatenate(cols), np.concatenate(data)
+        # duplicate entries (nodes shared by several triangles) are summed during the conversion
+        return sparse.coo_matrix((data, (rows, cols)), shape=(len(self.polygons), self.mesh.nb_points)).tocsr()
+
+    def net_volumes_in_frames(self, values):
+        """!
+        @brief Compute the net volumes in all polygons for a block of frames with a single sparse product
+        @param values <numpy.2D-array>: The values of the variable, of shape (number of frames, number of nodes)
+        @return <numpy.2D-array>: The net volumes, of shape (number of frames, number of polygons)
+        """
+        return self.weight_matrix.dot(values.T).T
+
+    def volumes_in_frame(self, values):
+        """!
+        @brief Do the volume computation in a single frame for all polygons, depending on the volume type
+        @param values <numpy.1D-array>: the values of the variable for which the volume will be computed
+        @return <[float]>: The volumes (net, positive and negative for each polygon if the volume type is POSITIVE)
+        """
+        net_volumes = self.weight_matrix.dot(values)
+        if self.volume_type != VolumeCalculator.POSITIVE:
+            return list(net_volumes)
+        positive_volumes = self.positive_volumes_in_frame(values)
+        volumes = []
+        for volume_net, volume_positive in zip(net_volumes, positive_volumes):
+            volumes.extend([volume_net, volume_positive, volume_net - volume_positive])
+        return volumes
+
+    def positive_volumes_in_frame(self, values):
+        """!
+        @brief Compute the volumes in the half-space z > 0 in all polygons in a single frame
+        @param values <numpy.1D-array>: the values of the variable for which the volume will be computed
+        @return <numpy.1D-array>: The positive volumes in every polygon
+        """
+        interior_volumes = TruncatedTriangularPrisms.superior_prism_volumes(self.interior_areas,
+                                                                            values[self.interior_nodes])
+
+        # boundary triangles which do not cross the plane z = 0 need no clipping
+        boundary_values = values[self.boundary_nodes]
+        is_positive = boundary_values.min(axis=1) >= 0
+        is_crossing = np.logical_and(np.logical_not(is_positive), boundary_values.max(axis=1) > 0)
+        boundary_volumes = np.zeros(len(self.boundary_areas), dtype=np.float64)
+        boundary_volumes[is_positive] = (self.boundary_areas[is_positive]
+                                         * boundary_values[is_positive].sum(axis=1) / 3.0)
+        for i in np.flatnonzero(is_crossing):
+            j = self.boundary_polygons[i]
+            vertices, intersection = self.boundary_geometries[i]
+            boundary_volumes[i] = TruncatedTriangularPrisms.superior_prism_volume_in_intersection(
+                self.polygons[j], vertices, self.boundary_areas[i], intersection, boundary_values[i])
+
+        # a single pass accumulates the prisms of every polygon in the order of positive_volume_in_polygon
+        positive_volumes = np.bincount(np.concatenate([self.interior_polygons, self.boundary_polygons]),
+                                       weights=np.concatenate([interior_volumes, boundary_volumes]),
+                                       minlength=len(self.polygons))
+        return positive_volumes
+
+    @staticmethod
+    def positive_volume_in_polygon(weight, values, polygon):
+        """!
+        @brief Return the volume in the half-space z > 0 inside a single polygon
+        @param weight <tuple>: the point weights/intersections returned by polygon_intersection_all
+        @param values <numpy.1D-array>: the values of the variable for which the volume will be computed
+        @param polygon <geom.geometry.Polygon>: the polygon in which the volume will be computed
+        @return <float>: The positive volume
+        """
+        _, _, triangles, triangle_polygon_intersection = weight
+        volume_positive = 0
+        for a, b, c in triangles:
+            vertices, area = triangles[a, b, c]
+            volume_positive += TruncatedTriangularPrisms.superior_prism_volume(vertices, area, values[[a, b, c]])
+        for a, b, c in triangle_polygon_intersection:
+            vertices, area, intersection = triangle_polygon_intersection[a, b, c]
+            volume_positive += TruncatedTriangularPrisms.superior_prism_volume_in_intersection(polygon, vertices,
+                                                                                               area, intersection,
+                                                                                               values[[a, b, c]])
+        return volume_positive
 
     def volume_in_frame_in_polygon(self, weight, values, polygon):
         """!
@@ -260,16 +428,7 @@ class VolumeCalculator:
             strict_weight, triangle_polygon_net_intersection, triangles, triangle_polygon_intersection = weight
             volume_net = strict_weight.dot(values)
             volume_net += TruncatedTriangularPrisms.boundary_volume_in_polygon(triangle_polygon_net_intersection, values)
-
-            volume_positive = 0
-            for a, b, c in triangles:
-                vertices, area = triangles[a, b, c]
-                volume_positive += TruncatedTriangularPrisms.superior_prism_volume(vertices, area, values[[a, b, c]])
-            for a, b, c in triangle_polygon_intersection:
-                vertices, area, intersection = triangle_polygon_intersection[a, b, c]
-                volume_positive += TruncatedTriangularPrisms.superior_prism_volume_in_intersection(polygon, vertices,
-                                                                                                   area, intersection,
-                                                                                                   values[[a, b, c]])
+            volume_positive = VolumeCalculator.positive_volume_in_polygon(weight, values, polygon)
             return volume_net, volume_positive, volume_net - volume_positive
 
     def read_values_in_frame(self, time_index):
@@ -290,21 +449,32 @@ class VolumeCalculator:
         Separate the major part of the computation, allowing a GUI override
         """
         result = []
-        for time_index in self.time_indices:
-            i_result = [str(self.input_stream.time[time_index])]
-            values = self.read_values_in_frame(time_index)
-
-            for j in range(len(self.polygons)):
-                weight = self.weights[j]
-                volume = self.volume_in_frame_in_polygon(weight, values, self.polygons[j])
-                if self.volume_type == VolumeCalculator.POSITIVE:
-                    for v in volume:
-                        i_result.append(format_string.format(v))
-                else:
-                    i_result.append(format_string.format(volume))
-            result.append(i_result)
+        if self.volume_type == VolumeCalculator.POSITIVE:
+            for time_index in self.time_indices:
+                result.append(self.run_in_frame(time_index, format_string))
+            return result
+
+        time_indices = list(self.time_indices)
+        for start in range(0, len(time_indices), VolumeCalculator.BLOCK_SIZE):
+            block = time_indices[start:start+VolumeCalculator.BLOCK_SIZE]
+            values = np.array([self.read_values_in_frame(time_index) for time_index in block])
+            volumes = self.net_volumes_in_frames(values)
+            for time_index, frame_volumes in zip(block, volumes):
+                result.append([str(self.input_stream.time[time_index])]
+                              + [format_string.format(volume) for volume in frame_volumes])
         return result
 
+    def run_in_frame(self, time_index, format_string):
+        """!
+        @brief Compute the volumes in all polygons in a single frame
+        @param time_index <int>: The index of the frame
+        @param format_string <str>: The output format of the values
+        @return <[str]>: The row of the output table for this frame
+        """
+        values = self.read_values_in_frame(time_index)
+        return [str(self.input_stream.time[time_index])] + [format_string.format(volume)
+                                                            for volume in self.volumes_in_frame(values)]
+
     def get_csv_header(self):
         header = ['time']
         if self.volume_type == VolumeCalculator.POSITIVE:
@@ -326,7 +496,111 @@ class VolumeCalculator:
             output_stream.write('\n')
 
 
+class MultiVolumeCalculator(VolumeCalculator):
+    """!
+    Compute the volumes of several variables (volume definitions) inside the same polygons in a single pass
 
+    A volume definition is a tuple (volume type, variable ID, second variable ID) with the same meaning as the
+    arguments of VolumeCalculator. The polygon weights are computed once for all definitions,
+    and every needed variable is read only once per frame.
+    """
+    def __init__(self, definitions, input_stream, polynames, polygons, time_sampling_frequency):
+        # the weights are computed for the most demanding type (NET_STRICT < NET < POSITIVE)
+        volume_types = [volume_type for volume_type, _, _ in definitions]
+        super().__init__(max(volume_types), definitions[0][1], None, input_stream, polynames, polygons,
+                         time_sampling_frequency)
+        self.definitions = definitions
+        self.strict_weight_matrix = None
+
+        self.var_IDs = []
+        for _, var_ID, second_var_ID in definitions:
+            for ID in (var_ID, second_var_ID):
+                if ID is not None and ID != VolumeCalculator.INIT_VALUE and ID not in self.var_IDs:
+                    self.var_IDs.append(ID)
+        self.init_values = {var_ID: input_stream.read_var_in_frame(0, var_ID)
+                            for _, var_ID, second_var_ID in definitions
+                            if second_var_ID == VolumeCalculator.INIT_VALUE}
+
+    def construct_weights(self):
+        """!
+        Construct the point weights/intersections etc. for the most demanding volume type, for every polygons
+        """
+        super().construct_weights()
+        if self.volume_type != VolumeCalculator.NET_STRICT:
+            if any(volume_type == VolumeCalculator.NET_STRICT for volume_type, _, _ in self.definitions):
+                self.strict_weight_matrix = self.assemble_weight_matrix(False)
+        else:
+            self.strict_weight_matrix = self.weight_matrix
 
+    def read_values_in_frame(self, time_index):
+        """!
+        @brief Read the values of every volume definition in a single frame
+        @param time_index <int>: The index of the frame
+        @return <numpy.2D-array>: The values, of shape (number of definitions, number of nodes)
+        """
+        variables = {var_ID: self.input_stream.read_var_in_frame(time_index, var_ID) for var_ID in self.var_IDs}
+        values = np.empty((len(self.definitions), self.mesh.nb_points), dtype=np.float64)
+        for i, (_, var_ID, second_var_ID) in enumerate(self.definitions):
+            values[i] = variables[var_ID]
+            if second_var_ID == VolumeCalculator.INIT_VALUE:
+                values[i] -= self.init_values[var_ID]
+            elif second_var_ID is not None:
+                values[i] -= variables[second_var_ID]
+        return values
 
+    def volumes_in_frame(self, values):
+        """!
+        @brief Do the volume computation in a single frame for all definitions and all polygons
+        @param values <numpy.2D-array>: The values of every definition, of shape (number of definitions, number of nodes)
+        @return <[float]>: The volumes, in the order of the CSV header columns
+        """
+        net_volumes = self.weight_matrix.dot(values.T).T
+        if self.strict_weight_matrix is not None:
+            strict_volumes = self.strict_weight_matrix.dot(values.T).T
+        volumes = []
+        for i, (volume_type, _, _) in enumerate(self.definitions):
+            if volume_type == VolumeCalculator.NET_STRICT:
+                volumes.extend(strict_volumes[i])
+            elif volume_type == VolumeCalculator.NET:
+                volumes.extend(net_volumes[i])
+            else:
+                positive_volumes = self.positive_volumes_in_frame(values[i])
+                for volume_net, volume_positive in zip(net_volumes[i], positive_volumes):
+                    volumes.extend([volume_net, volume_positive, volume_net - volume_positive])
+        return volumes
+
+    def run(self, format_string='{0:.6f}'):
+        """!
+        Separate the major part of the computation, allowing a GUI override
+        """
+        return [self.run_in_frame(time_index, format_string) for time_index in self.time_indices]
+
+    @staticmethod
+    def definition_name(var_ID, second_var_ID):
+        """!
+        @brief Return the name of a volume definition used in the CSV header
+        """
+        if second_var_ID is None:
+            return var_ID
+        elif second_var_ID == VolumeCalculator.INIT_VALUE:
+            return '%s-%s(t=0)' % (var_ID, var_ID)
+        return '%s-%s' % (var_ID, second_var_ID)
+
+    def get_csv_header(self):
+        """!
+        @brief Return the CSV header
+        @return <[str]>: The column names
+
+        The columns of the first definition are named as in VolumeCalculator,
+        the columns of the other definitions are prefixed by the definition name.
+        """
+        header = ['time']
+        for i, (volume_type, var_ID, second_var_ID) in enumerate(self.definitions):
+            prefix = '' if i == 0 else MultiVolumeCalculator.definition_name(var_ID, second_var_ID) + ' '
+            for name in self.polynames:
+                header.append(prefix + name)
+                if volume_type == VolumeCalculator.POSITIVE:
+                    header.append(prefix + name + ' POSITIVE')
+                    header.append(prefix + name + ' NEGATIVE')
+        return header
 
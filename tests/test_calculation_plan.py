@@ -0,0 +1,87 @@
+"""!
+Unittest for slf.variables.CalculationPlan
+"""
+
+import numpy as np
+import os
+
+HOME = os.path.expanduser('~')
+import unittest
+
+from slf import Serafin
+from slf.variables import CalculationPlan, do_calculations_in_frame, get_necessary_equations, get_US_equation
+
+
+class TestHeader:
+    def __init__(self):
+        self.title = bytes('DUMMY SERAFIN', 'utf-8').ljust(72)
+        self.file_type = bytes('SERAFIND', 'utf-8').ljust(8)
+        self.float_type = 'd'
+        self.float_size = 8
+
+        self.nb_var = 5
+        self.nb_var_quadratic = 0
+        self.var_names = [bytes('VITESSE U', 'utf-8').ljust(16),
+                          bytes('VITESSE V', 'utf-8').ljust(16),
+                          bytes("HAUTEUR D'EAU", 'utf-8').ljust(16),
+                          bytes('FOND', 'utf-8').ljust(16),
+                          bytes('FROTTEMENT', 'utf-8').ljust(16)]
+        self.var_units = [bytes('DUMMY UNIT', 'utf-8').ljust(16)] * self.nb_var
+        self.params = [0] * 10
+
+        self.nb_elements = 3
+        self.nb_nodes = 4
+        self.nb_nodes_per_elem = 3
+
+        self.ipobo = [0] * self.nb_nodes
+
+        self.ikle = [1, 2, 4, 1, 3, 4, 2, 3, 4]
+        self.x = [3, 0, 6, 3]
+        self.y = [6, 0, 0, 2]
+
+
+class CalculationPlanTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(HOME, 'dummpy.slf')
+
+        rng = np.random.RandomState(0)
+        values = rng.uniform(0, 1, (3, 5, 4))
+        values[:, 0, 1] = -values[:, 0, 1]  # some negative values
+        values[:, 2, 2] = 0  # some dry nodes
+        values[:, 4, :] += 20  # friction coefficient
+        header = TestHeader()
+        with Serafin.Write(self.path, 'fr') as f:
+            f.write_header(header)
+            for time, vals in enumerate(values):
+                f.write_entire_frame(header, time, vals)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_same_as_frame_computation(self):
+        selections = [['U', 'H'], ['M', 'S', 'US', 'TAU'], ['F', 'Q', 'C', 'I', 'J', 'DMAX'],
+                      ['ROUSE_0.01', 'TAU', 'ROUSE_0.02', 'B', 'W']]
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            for friction_law in range(3):
+                us_equation = get_US_equation(friction_law)
+                for selected in selections:
+                    equations = get_necessary_equations(f.header.var_IDs, selected, True, us_equation)
+                    for float_type in (np.float32, np.float64):
+                        plan = CalculationPlan(equations, f.header, selected, float_type, True, us_equation)
+                        for time_index in range(len(f.time)):
+                            expected = do_calculations_in_frame(equations, f, time_index, selected,
+                                                                float_type, True, us_equation)
+                            values = plan.run_in_frame(f, time_index)
+                            self.assertEqual(values.dtype, float_type)
+                            self.assertTrue(np.allclose(values, expected, rtol=1e-6, equal_nan=True))
+
+    def test_buffer_reuse(self):
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            equations = get_necessary_equations(f.header.var_IDs, ['F'], True)
+            plan = CalculationPlan(equations, f.header, ['F'], np.float64, True, None)
+            # M and C are needed for F only, one is reused as soon as it is no longer needed
+            self.assertEqual(len(plan.steps), 3)
+            self.assertTrue(plan.nb_buffers <= 2)
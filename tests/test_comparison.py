@@ -0,0 +1,138 @@
+"""!
+Unittest for slf.comparison module
+"""
+
+import numpy as np
+import os
+
+HOME = os.path.expanduser('~')
+import unittest
+
+from geom.geometry import Polyline
+from slf import Serafin
+from slf.comparison import BatchComparison, ReferenceMesh
+
+
+class TestHeader:
+    def __init__(self):
+        self.title = bytes('DUMMY SERAFIN', 'utf-8').ljust(72)
+        self.file_type = bytes('SERAFIND', 'utf-8').ljust(8)
+        self.float_type = 'd'
+        self.float_size = 8
+
+        self.nb_var = 1
+        self.nb_var_quadratic = 0
+        self.var_names = [bytes("HAUTEUR D'EAU", 'utf-8').ljust(16)]
+        self.var_units = [bytes('M', 'utf-8').ljust(16)]
+        self.params = [0] * 10
+
+        # a 4 x 4 regular grid split into 18 triangles
+        self.nb_nodes = 16
+        self.nb_elements = 18
+        self.nb_nodes_per_elem = 3
+        self.ipobo = [0] * self.nb_nodes
+
+        self.x = [float(i % 4) for i in range(16)]
+        self.y = [float(i // 4) for i in range(16)]
+        self.ikle = []
+        for row in range(3):
+            for col in range(3):
+                first = 4 * row + col + 1
+                self.ikle.extend([first, first + 1, first + 5, first, first + 5, first + 4])
+
+
+class ComparisonTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(HOME, 'dummpy.slf')
+
+        rng = np.random.RandomState(0)
+        self.values = rng.uniform(-1, 1, (20, 1, 16))
+        header = TestHeader()
+        with Serafin.Write(self.path, 'fr') as f:
+            f.write_header(header)
+            for time, vals in enumerate(self.values):
+                f.write_entire_frame(header, time, vals)
+        self.polygon = Polyline([(0.5, 0.2), (2.7, 0.4), (2.2, 2.8), (0.3, 1.9), (0.5, 0.2)])
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_error_measures(self):
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            mesh = ReferenceMesh(f.header, True)
+
+            for polygon in (None, self.polygon):
+                mesh.add_polygon(polygon)
+                if polygon is None:
+                    self.assertAlmostEqual(1 / mesh.inverse_total_area, 9)
+                    self.assertEqual(mesh.nb_triangles_inside, 18)
+                else:
+                    self.assertAlmostEqual(1 / mesh.inverse_total_area, polygon.polyline().area)
+
+                ref_values = self.values[0, 0]
+                init_values = self.values[1, 0]
+                msd, mad, rmsd, bss = mesh.error_evolution(f, 'H', ref_values, init_values, block_size=7)
+                ref_volume = mesh.quadratic_volume(ref_values - init_values)
+                for index in range(len(f.time)):
+                    values = f.read_var_in_frame(index, 'H') - ref_values
+                    self.assertAlmostEqual(msd[index], mesh.mean_signed_deviation(values))
+                    self.assertAlmostEqual(mad[index], mesh.mean_absolute_deviation(values))
+                    self.assertAlmostEqual(rmsd[index], mesh.root_mean_square_deviation(values))
+                    self.assertAlmostEqual(bss[index], 1 - mesh.quadratic_volume(values) / ref_volume)
+                self.assertEqual(msd[0], 0)
+                self.assertEqual(bss[0], 1)
+
+    def test_element_wise_signed_deviation(self):
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            mesh = ReferenceMesh(f.header, True)
+        mesh.add_polygon(self.polygon)
+        values = self.values[2, 0]
+
+        ewsd = mesh.element_wise_signed_deviation(values)
+        self.assertEqual(ewsd.shape, (mesh.nb_triangles,))
+        self.assertTrue(np.all(ewsd[np.logical_not(mesh.inside)] == 0))
+
+        # the mean of the element wise signed deviation is the mean signed deviation
+        self.assertAlmostEqual(ewsd[mesh.inside].mean(), mesh.mean_signed_deviation(values))
+
+        # same values as the intersection-wise computation
+        for index, (i, j, k) in enumerate(mesh.ikle):
+            triangle = mesh.triangles[i, j, k]
+            if mesh.polygon.contains(triangle):
+                expected = values[[i, j, k]].mean() * triangle.area
+            else:
+                is_intersected, intersection = mesh.polygon.polygon_intersection(triangle)
+                if not is_intersected:
+                    continue
+                expected = mesh.element_weight[index].dot(values[[i, j, k]])
+                self.assertAlmostEqual(mesh.element_weight[index].sum(), intersection.area)
+            self.assertAlmostEqual(ewsd[index], expected * mesh.nb_triangles_inside * mesh.inverse_total_area)
+
+    def test_batch_comparison(self):
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            ref_values = f.read_var_in_frame(3, 'H')
+            comparison = BatchComparison(f.header, ref_values, 'H', [self.polygon], ['Polygon 1'], True, 0)
+            comparison.construct_weights()
+            result = comparison.run([self.path, os.path.join(HOME, 'missing.slf'), self.path], 'fr', 2, block_size=6)
+
+            self.assertEqual(len(result), 2)
+            mesh = ReferenceMesh(f.header, True)
+            for region, polygon in enumerate([None, self.polygon]):
+                mesh.add_polygon(polygon)
+                msd, mad, rmsd, bss = mesh.error_evolution(f, 'H', ref_values, f.read_var_in_frame(0, 'H'))
+                for filename, time, metrics in result:
+                    self.assertEqual(filename, self.path)
+                    self.assertEqual(time, f.time)
+                    self.assertTrue(np.allclose(metrics[:, region], np.stack([msd, mad, rmsd, bss], axis=1)))
+
+            # a run without the initial frame is reported as failed, without aborting the batch
+            comparison = BatchComparison(f.header, ref_values, 'H', [self.polygon], ['Polygon 1'], True, len(f.time))
+            comparison.construct_weights()
+            self.assertEqual(comparison.run([self.path], 'fr', 1), [])
+        self.assertEqual(comparison.get_csv_header(), ['run', 'time', 'region', 'MSD', 'MAD', 'RMSD', 'BSS'])
+
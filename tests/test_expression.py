@@ -0,0 +1,283 @@
+"""!
+Unittest for expression evaluation
+"""
+
+import numpy as np
+import os
+
+HOME = os.path.expanduser('~')
+import unittest
+
+from geom.geometry import Polyline
+from slf import Serafin
+from shapely.geometry import Point
+
+from slf.datatypes import SerafinData
+from slf.expression.pool import ComplexExpressionMultiPool, ComplexExpressionPool, polygon_index
+from slf.misc import CompiledExpression, evaluate_expression, infix_to_postfix, to_infix
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+class TestHeader:
+    def __init__(self):
+        self.title = bytes('DUMMY SERAFIN', 'utf-8').ljust(72)
+        self.file_type = bytes('SERAFIN', 'utf-8').ljust(8)
+        self.float_type = 'f'
+        self.float_size = 4
+
+        self.nb_var = 3
+        self.nb_var_quadratic = 0
+        self.var_names = [bytes('VITESSE U', 'utf-8').ljust(16),
+                          bytes('VITESSE V', 'utf-8').ljust(16),
+                          bytes("HAUTEUR D'EAU", 'utf-8').ljust(16)]
+        self.var_units = [bytes('DUMMY UNIT', 'utf-8').ljust(16)] * self.nb_var
+        self.params = [0] * 10
+
+        self.nb_elements = 3
+        self.nb_nodes = 4
+        self.nb_nodes_per_elem = 3
+
+        self.ipobo = [0] * self.nb_nodes
+
+        self.ikle = [1, 2, 4, 1, 3, 4, 2, 3, 4]
+        self.x = [3, 0, 6, 3]
+        self.y = [6, 0, 0, 2]
+
+
+class ExpressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(HOME, 'dummpy.slf')
+
+        rng = np.random.RandomState(0)
+        values = rng.uniform(0.1, 2, (3, 3, 4))
+        header = TestHeader()
+        with Serafin.Write(self.path, 'fr') as f:
+            f.write_header(header)
+            for time, vals in enumerate(values):
+                f.write_entire_frame(header, time, vals)
+
+        self.expressions = ['[H] - [U] / [V]', '2 ^ 3 + 1', '[H]', '([H] + 1) * sqrt([U]) - 3.5e-2',
+                            'sqrt([U] ^ 2 + [V] ^ 2) * [H] + sqrt([U] ^ 2 + [V] ^ 2)',
+                            'sin([U]) + cos([V]) / atan([H]) - (2 * 3 + 1) * [H]']
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_compiled_expression(self):
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            for literal_expression in self.expressions:
+                postfix = infix_to_postfix(to_infix(literal_expression))
+                compiled = CompiledExpression(postfix, use_numexpr=False)
+                for time_index in range(len(f.time)):
+                    expected = evaluate_expression(f, time_index, postfix)
+                    values = compiled.evaluate_in_frame(f, time_index)
+                    self.assertTrue(np.allclose(values, expected, rtol=1e-5))
+
+        # repeated subexpressions and variables are shared, constants are folded
+        compiled = CompiledExpression(infix_to_postfix(to_infix(self.expressions[4])))
+        self.assertEqual(compiled.var_IDs, ['U', 'V', 'H'])
+        self.assertEqual(len(compiled.instructions), 6)
+        self.assertTrue(CompiledExpression(infix_to_postfix(to_infix(self.expressions[1]))).is_constant())
+
+        # the blocks and the buffers are reused
+        CompiledExpression.BLOCK_SIZE = 3
+        try:
+            x = np.linspace(0, 1, 10)
+            postfix = infix_to_postfix(to_infix('([X] + 1) * ([X] - 2) / ([X] + 3)'))
+            compiled = CompiledExpression(postfix, use_numexpr=False)
+            expected = CompiledExpression(postfix, use_numexpr=False)
+            expected.BLOCK_SIZE = 10
+            self.assertTrue(np.allclose(compiled.evaluate({'X': x}), expected.evaluate({'X': x})))
+            self.assertEqual(compiled.nb_slots, 2)
+        finally:
+            CompiledExpression.BLOCK_SIZE = 65536
+
+    @unittest.skipUnless(numexpr, 'numexpr is not installed')
+    def test_numexpr_evaluation(self):
+        rng = np.random.RandomState(1)
+        values = {var_ID: rng.uniform(0.1, 2, 50) for var_ID in ('U', 'V', 'H')}
+        for literal_expression in self.expressions[0:1] + self.expressions[3:]:
+            postfix = infix_to_postfix(to_infix(literal_expression))
+            compiled = CompiledExpression(postfix)
+            self.assertIsNotNone(compiled.numexpr_expression)
+            for dtype in (np.float64, np.float32):
+                typed_values = {var_ID: var_values.astype(dtype) for var_ID, var_values in values.items()}
+                result = compiled.evaluate(typed_values)
+                expected = CompiledExpression(postfix, use_numexpr=False).evaluate(typed_values)
+                # the constants do not promote single precision variables to double precision
+                self.assertEqual(result.dtype, dtype)
+                self.assertEqual(result.dtype, expected.dtype)
+                self.assertTrue(np.allclose(result, expected, rtol=1e-5))
+
+    def test_pool(self):
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            pool = ComplexExpressionPool(f.header.var_IDs, ['U', 'V', 'H'], f.header.x, f.header.y)
+            for literal_expression in self.expressions:
+                self.assertEqual(pool.add_simple_expression(literal_expression), 0)
+            self.assertEqual(pool.add_simple_expression('[E1] * [COORDX]'), 0)
+            selected = ['E%d' % (i+1) for i in range(pool.nb_expressions)]
+            path = []
+            for expression in selected:
+                path.extend(node for node in pool.get_dependence(expression) if node not in path)
+
+            for time_index, (time_value, values) in enumerate(pool.evaluate_expressions(path, f, selected)):
+                self.assertEqual(time_value, f.time[time_index])
+                for i, literal_expression in enumerate(self.expressions):
+                    postfix = infix_to_postfix(to_infix(literal_expression))
+                    self.assertTrue(np.allclose(values[i], evaluate_expression(f, time_index, postfix), rtol=1e-5))
+                self.assertTrue(np.allclose(values[-1], values[0] * f.header.x))
+
+    def test_time_invariant_nodes(self):
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            x, y = np.array(f.header.x, dtype=np.float64), np.array(f.header.y, dtype=np.float64)
+            pool = ComplexExpressionPool(f.header.var_IDs, ['U', 'V', 'H'], x, y)
+            pool.add_polygonal_mask([Polyline([(1, 1), (5, 1), (5, 7), (1, 7), (1, 1)], [2.5])], 0)
+            pool.add_simple_expression('sqrt([COORDX] * [COORDX] + [COORDY] * [COORDY])')  # E1: distance field
+            pool.add_simple_expression('[E1] * 2 + [H]')  # E2
+            pool.add_simple_expression('[POLY1] * [COORDX]')  # E3: polygonal
+            pool.add_simple_expression('[E1] + 1')  # E4
+            pool.add_masked_expression(pool.expressions[3], pool.expressions[4])  # E5
+            selected = ['E2', 'E5']
+            path = []
+            for expression in selected:
+                path.extend(node for node in pool.get_dependence(expression) if node not in path)
+
+            steps = pool.compile_path(path)
+            fixed = [node for node, var_ID, node_values, _, _ in steps if var_ID is None and node_values is not None]
+            self.assertEqual(set(fixed), {'COORDX', 'COORDY', 'POLY1', 'E1', 'E3', 'E4', 'E5'})
+            self.assertEqual(pool.cache_size, 4 * x.nbytes)
+
+            distance = np.sqrt(x * x + y * y)
+            inside = np.array([True, False, False, True])
+            for time_index, (_, values) in enumerate(pool.evaluate_expressions(path, f, selected)):
+                h = f.read_var_in_frame(time_index, 'H')
+                self.assertTrue(np.allclose(values[0], distance * 2 + h))
+                self.assertTrue(np.allclose(values[1], np.where(inside, 2.5 * x, distance + 1)))
+
+            # the cached values are limited in memory, and the nodes over the limit are not evaluated in advance
+            pool.MAX_CACHE_SIZE = x.nbytes
+            evaluated = []
+            evaluate_node = pool._evaluate_node
+            pool._evaluate_node = lambda *args: evaluated.append(args[1]) or evaluate_node(*args)
+            steps = pool.compile_path(path)
+            del pool._evaluate_node
+            self.assertEqual(pool.cache_size, x.nbytes)
+            self.assertEqual(len(evaluated), 1)
+            for time_index, (_, values) in enumerate(pool.evaluate_expressions(path, f, selected)):
+                self.assertTrue(np.allclose(values[1], np.where(inside, 2.5 * x, distance + 1)))
+
+    def test_polygon_index(self):
+        rng = np.random.RandomState(1)
+        x, y = rng.uniform(0, 10, 2000), rng.uniform(0, 10, 2000)
+        # nodes exactly on the edges and on a vertex of the polygons are outside
+        x, y = np.append(x, [1, 6, 5, 9]), np.append(y, [3, 2, 3, 6])
+        polygons = [Polyline([(1, 1), (6, 2), (4, 7), (1, 5), (1, 1)], [1.5]),
+                    Polyline([(3, 3), (9, 3), (9, 9), (5, 6), (3, 9), (3, 3)], [-2]),
+                    Polyline([(20, 20), (21, 20), (21, 21), (20, 20)], [7])]
+        expected = np.zeros(x.shape, dtype=int)
+        for index, poly in enumerate(polygons):
+            for i, (xi, yi) in enumerate(zip(x, y)):
+                if poly.contains(Point(xi, yi)):
+                    expected[i] = index+1
+        self.assertTrue(np.array_equal(polygon_index(x, y, polygons), expected))
+        self.assertEqual(list(expected[-4:]), [0, 0, 1, 0])
+
+        pool = ComplexExpressionPool([], [], x, y)
+        pool.add_polygonal_mask(polygons, 0)
+        mask = pool.get_mask('POLY1')
+        self.assertTrue(np.array_equal(mask.mask, expected > 0))
+        self.assertTrue(np.array_equal(mask.values, np.array([0, 1.5, -2, 7])[expected]))
+
+    def test_parallel_evaluation(self):
+        input_data, output_names = [], []
+        for i in range(3):
+            data = SerafinData(str(i), self.path, 'fr')
+            data.read()
+            input_data.append(data)
+            output_names.append(os.path.join(HOME, 'dummpy_out%d.slf' % i))
+        pool = ComplexExpressionMultiPool()
+        pool.get_data(input_data)
+        pool.add_simple_expression('[H] * [COORDX] + 1')
+        pool.add_condition(pool.get_expression('E1: '), '>', 5)
+        pool.add_simple_expression('[U] + [V]')
+        pool.add_conditional_expression(pool.get_condition('C1: '), pool.get_expression('E1: '),
+                                        pool.get_expression('E2: '))
+        selected = ['E1', 'E3']
+
+        try:
+            names = ["HAUTEUR D'EAU", 'VITESSE U']  # known names to read the outputs back
+            jobs = pool.parallel_jobs(selected, names, output_names, True)
+            self.assertEqual(sorted(pool.evaluate_in_parallel(jobs, 2)), [0, 1, 2])
+
+            path = pool.build_augmented_path(selected)
+            for output_name, single_pool in zip(output_names, pool.pools):
+                with Serafin.Read(self.path, 'fr') as f, Serafin.Read(output_name, 'fr') as g:
+                    f.read_header()
+                    f.get_time()
+                    g.read_header()
+                    g.get_time()
+                    self.assertEqual(g.header.var_IDs, ['H', 'U'])
+                    for time_index, (time_value, values) in enumerate(single_pool.evaluate_expressions(path, f,
+                                                                                                       selected)):
+                        self.assertAlmostEqual(g.time[time_index], time_value)
+                        self.assertTrue(np.allclose(g.read_var_in_frame(time_index, 'H'), values[0]))
+                        self.assertTrue(np.allclose(g.read_var_in_frame(time_index, 'U'), values[1]))
+
+            # existing outputs are skipped without overwrite
+            self.assertEqual(pool.parallel_jobs(selected, names, output_names, False), [])
+
+            # a canceled run removes the outputs of its unfinished jobs, which are not skipped in the next run
+            self.assertEqual(list(pool.evaluate_in_parallel(jobs, 2, lambda: True)), [])
+            self.assertFalse(any(os.path.exists(output_name) for output_name in output_names))
+            self.assertEqual(len(pool.parallel_jobs(selected, names, output_names, False)), 3)
+        finally:
+            for output_name in output_names:
+                if os.path.exists(output_name):
+                    os.remove(output_name)
+
+    def test_parallel_cancellation(self):
+        long_path = os.path.join(HOME, 'dummpy_long.slf')
+        header = TestHeader()
+        with Serafin.Write(long_path, 'fr') as f:
+            f.write_header(header)
+            for time in range(10000):
+                f.write_entire_frame(header, time, np.ones((3, 4)))
+        input_data, output_names = [], []
+        for i in range(2):
+            data = SerafinData(str(i), long_path, 'fr')
+            data.read()
+            input_data.append(data)
+            output_names.append(os.path.join(HOME, 'dummpy_out%d.slf' % i))
+        pool = ComplexExpressionMultiPool()
+        pool.get_data(input_data)
+        pool.add_simple_expression('[H] + 1')
+
+        # cancel as soon as the workers have started writing their outputs
+        started = []
+
+        def is_canceled():
+            started.append(any(os.path.exists(output_name) for output_name in output_names))
+            return started[-1]
+
+        try:
+            jobs = pool.parallel_jobs(['E1'], ["HAUTEUR D'EAU"], output_names, True)
+            finished = list(pool.evaluate_in_parallel(jobs, 2, is_canceled))
+            self.assertTrue(started[-1])
+            self.assertLess(len(finished), 2)
+            for index, output_name in enumerate(output_names):
+                self.assertEqual(os.path.exists(output_name), index in finished)
+        finally:
+            os.remove(long_path)
+            for output_name in output_names:
+                if os.path.exists(output_name):
+                    os.remove(output_name)
@@ -0,0 +1,417 @@
+"""!
+Unittest for slf.misc module
+"""
+
+import copy
+import numpy as np
+import os
+import pickle
+import shutil
+import tempfile
+
+HOME = os.path.expanduser('~')
+import unittest
+
+import slf.misc as operations
+from slf import Serafin
+from slf.datatypes import SerafinData
+
+
+class TestHeader:
+    def __init__(self, float_type):
+        self.title = bytes('DUMMY SERAFIN', 'utf-8').ljust(72)
+        if float_type == 'd':
+            self.file_type = bytes('SERAFIND', 'utf-8').ljust(8)
+            self.float_size = 8
+        else:
+            self.file_type = bytes('SERAFIN', 'utf-8').ljust(8)
+            self.float_size = 4
+        self.float_type = float_type
+
+        self.nb_var = 3
+        self.nb_var_quadratic = 0
+        self.var_names = [bytes('VITESSE U', 'utf-8').ljust(16),
+                          bytes('VITESSE V', 'utf-8').ljust(16),
+                          bytes("HAUTEUR D'EAU", 'utf-8').ljust(16)]
+        self.var_units = [bytes('DUMMY UNIT', 'utf-8').ljust(16)] * self.nb_var
+        self.params = [0] * 10
+
+        # a 4 x 4 regular grid split into 18 triangles
+        self.nb_nodes = 16
+        self.nb_elements = 18
+        self.nb_nodes_per_elem = 3
+        self.ipobo = [0] * self.nb_nodes
+
+        self.x = [float(i % 4) for i in range(16)]
+        self.y = [float(i // 4) for i in range(16)]
+        self.ikle = []
+        for row in range(3):
+            for col in range(3):
+                first = 4 * row + col + 1
+                self.ikle.extend([first, first + 1, first + 5, first, first + 5, first + 4])
+
+
+class ReductionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(HOME, 'dummpy.slf')
+
+        rng = np.random.RandomState(0)
+        self.values = rng.uniform(-1, 1, (12, 3, 16))
+        self.values[:, 2, :] = np.abs(self.values[:, 2, :])
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def write(self, float_type):
+        header = TestHeader(float_type)
+        with Serafin.Write(self.path, 'fr') as f:
+            f.write_header(header)
+            for time, vals in enumerate(self.values):
+                f.write_entire_frame(header, time, vals)
+
+    def test_read_slice(self):
+        for float_type in ('f', 'd'):
+            self.write(float_type)
+            with Serafin.Read(self.path, 'fr') as f:
+                f.read_header()
+                f.get_time()
+                for time_index in (0, 5, 11):
+                    for var_ID in ('U', 'V', 'H'):
+                        values = f.read_var_in_frame(time_index, var_ID)
+                        for start, end in ((0, 16), (3, 7), (15, 16)):
+                            chunk_values = f.read_var_in_frame_slice(time_index, var_ID, start, end)
+                            self.assertEqual(chunk_values.dtype, values.dtype)
+                            self.assertTrue(np.array_equal(chunk_values, values[start:end]))
+            os.remove(self.path)
+        self.write('d')
+
+    def test_shared_frame_reader(self):
+        self.write('d')
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            shared = Serafin.SharedFrameReader(f)
+            for time_index in (0, 5, 11):
+                first = shared.read_var_in_frame(time_index, 'H')
+                # the values are read once per frame and cannot be modified by a consumer
+                self.assertIs(shared.read_var_in_frame(time_index, 'H'), first)
+                self.assertFalse(first.flags.writeable)
+                self.assertTrue(np.array_equal(first, f.read_var_in_frame(time_index, 'H')))
+                self.assertTrue(np.array_equal(shared.read_var_in_frame(time_index, 'U'),
+                                               f.read_var_in_frame(time_index, 'U')))
+
+    def test_frame_write(self):
+        self.write('f')
+        header = TestHeader('f')
+        sharded_path = os.path.join(HOME, 'dummpy_sharded.slf')
+        try:
+            with Serafin.Write(sharded_path, 'fr') as f:
+                f.write_header(header)
+                header_size, frame_size = f.reserve_frames(header, len(self.values))
+
+            # the frames are written in any order at their offset
+            for first_frame, last_frame in ((8, 12), (0, 3), (3, 8)):
+                with Serafin.FrameWrite(sharded_path, 'fr', header_size, frame_size, first_frame) as f:
+                    for time in range(first_frame, last_frame):
+                        f.write_entire_frame(header, time, self.values[time])
+            with open(self.path, 'rb') as f, open(sharded_path, 'rb') as g:
+                self.assertEqual(f.read(), g.read())
+        finally:
+            os.remove(sharded_path)
+
+    def test_mesh_cache(self):
+        self.write('d')
+        data = SerafinData('job', self.path, 'fr')
+        data.read()
+        data.triangles = {(0, 1, 5): None}
+        full_size = len(pickle.dumps(data))
+
+        cache_dir = tempfile.mkdtemp()
+        try:
+            # only the headers pickled inside the with statement are shared, and a process which does not share
+            # its meshes loads its own copy of the arrays
+            with Serafin.shared_meshes(cache_dir):
+                message = pickle.dumps(data)
+            self.assertTrue(len(message) < full_size)
+            self.assertEqual(len(pickle.dumps(data)), full_size)
+            copy_data = pickle.loads(message)
+            self.assertNotIsInstance(copy_data.header.x, np.memmap)
+            self.assertTrue(copy_data.header.x.flags.writeable)
+            self.assertTrue(np.array_equal(copy_data.header.ikle_2d, data.header.ikle_2d))
+            nb_files = len(os.listdir(cache_dir))
+            with Serafin.shared_meshes(cache_dir):
+                self.assertEqual(len(pickle.dumps(copy_data)), len(message))
+            self.assertEqual(len(os.listdir(cache_dir)), nb_files)
+
+            Serafin.set_mesh_cache(cache_dir)
+            message = pickle.dumps(data)
+            self.assertTrue(len(message) < full_size)
+            copy_data = pickle.loads(message)
+            self.assertEqual(copy_data.triangles, {})
+            for name in ('x', 'y', 'ikle', 'ipobo', 'ikle_2d'):
+                values = getattr(copy_data.header, name)
+                self.assertTrue(np.array_equal(values, getattr(data.header, name)))
+                self.assertFalse(values.flags.writeable)
+
+            # the mesh is saved once, and mapped once per process
+            nb_files = len(os.listdir(cache_dir))
+            other_copy = pickle.loads(pickle.dumps(copy_data))
+            self.assertEqual(len(os.listdir(cache_dir)), nb_files)
+            self.assertIs(other_copy.header.x, copy_data.header.x)
+            self.assertEqual(other_copy.header.mesh_fingerprint(), data.header.mesh_fingerprint())
+
+            # a copied header owns its mesh
+            header = copy_data.header.copy()
+            header.x[0] = -1
+            self.assertNotEqual(copy_data.header.x[0], -1)
+            self.assertNotEqual(header.mesh_fingerprint(), data.header.mesh_fingerprint())
+
+            # a shallow copy (node chunks) shares the mesh arrays without saving them in the cache
+            shutil.rmtree(cache_dir)
+            os.mkdir(cache_dir)
+            header = copy.copy(data.header)
+            self.assertIs(header.ikle, data.header.ikle)
+            self.assertTrue(header.ikle.flags.writeable)
+            self.assertEqual(os.listdir(cache_dir), [])
+
+            # only the most recently attached meshes stay mapped
+            for i in range(Serafin.MAX_ATTACHED_MESHES + 2):
+                header = data.header.copy()
+                header.x[0] = i
+                pickle.loads(pickle.dumps(header))
+            self.assertEqual(len(Serafin._attached_meshes), Serafin.MAX_ATTACHED_MESHES)
+        finally:
+            Serafin.set_mesh_cache(None)
+            shutil.rmtree(cache_dir)
+
+    def test_node_chunks(self):
+        self.write('d')
+        time_indices = list(range(1, 12))
+        scalars = [('H', 'H', 'M'), ('M', 'M', 'M/S')]
+        vectors = [('U', 'U', 'M/S'), ('V', 'V', 'M/S')]
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            _, _, equations = operations.scalars_vectors(f.header.var_IDs, scalars + vectors)
+            condition = operations.Condition(['[H]', '[U]', '+'], '[H] + [U]', '>', 0.8)
+
+            creators = []
+            for max_min_type in (operations.MAX, operations.MIN, operations.MEAN):
+                creators.append(lambda stream, max_min_type=max_min_type: [
+                    operations.ScalarMaxMinMeanCalculator(max_min_type, stream, scalars, time_indices, equations),
+                    operations.VectorMaxMinMeanCalculator(max_min_type, stream, vectors, time_indices, equations)])
+            creators.append(lambda stream: [operations.SynchMaxCalculator(stream, [('U', 'U', 'M/S')],
+                                                                          time_indices, 'H')])
+            creators.append(lambda stream: [operations.ArrivalDurationCalculator(stream, time_indices, condition)])
+
+            for create_calculators in creators:
+                expected = operations.run_by_node_chunks(f, create_calculators, 10)
+                for memory_budget in (8 * 10 * 5, 8 * 10 * 16, 8 * 10 * 100):
+                    values = operations.run_by_node_chunks(f, create_calculators, 10, memory_budget)
+                    self.assertTrue(np.allclose(values, expected))
+
+    def test_time_ranges(self):
+        self.write('d')
+        time_indices = list(range(1, 12))
+        scalars = [('H', 'H', 'M'), ('M', 'M', 'M/S')]
+        vectors = [('U', 'U', 'M/S'), ('V', 'V', 'M/S')]
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            _, _, equations = operations.scalars_vectors(f.header.var_IDs, scalars + vectors)
+            conditions = [operations.Condition(['[H]', '[U]', '+'], '[H] + [U]', '>', 0.8),
+                          operations.Condition(['[V]'], '[V]', '<=', 0)]
+
+            all_specs = []
+            for max_min_type in (operations.MAX, operations.MIN, operations.MEAN):
+                all_specs.append([(operations.ScalarMaxMinMeanCalculator,
+                                   {'max_min_type': max_min_type, 'selected_scalars': scalars,
+                                    'additional_equations': equations}),
+                                  (operations.VectorMaxMinMeanCalculator,
+                                   {'max_min_type': max_min_type, 'selected_vectors': vectors,
+                                    'additional_equations': equations})])
+            all_specs.append([(operations.SynchMaxCalculator, {'selected_vars': [('U', 'U', 'M/S')], 'ref_var': 'H'})])
+            all_specs.append([(operations.ArrivalDurationCalculator, {'condition': condition})
+                              for condition in conditions])
+
+            for specs in all_specs:
+                calculators = [calculator_class(input_stream=f, time_indices=time_indices, **kwargs)
+                               for calculator_class, kwargs in specs]
+                for calculator in calculators:
+                    calculator.run()
+                expected = np.vstack([calculator.finishing_up() for calculator in calculators])
+
+                for nb_processes in (1, 2, 4):
+                    reduction = operations.TimeRangeReduction(f, specs, time_indices, nb_processes)
+                    self.assertEqual(len(list(reduction.run())), reduction.nb_ranges)
+                    self.assertTrue(np.allclose(reduction.finishing_up(), expected))
+
+                # the ranges run separately (as shards of a workflow task) give the same merged result
+                reduction = operations.TimeRangeReduction(f, specs, time_indices, nb_ranges=3)
+                self.assertEqual(reduction.nb_ranges, 3)
+                partials = [operations.reduce_time_range(job)[1] for job in reversed(reduction.jobs)][::-1]
+                merged = operations.TimeRangeReduction.merge(partials)
+                self.assertTrue(np.allclose(np.vstack([calculator.finishing_up() for calculator in merged]),
+                                            expected))
+
+            # the vector components are taken at the maximum magnitude
+            maximum = operations.VectorMaxMinMeanCalculator(operations.MAX, f, vectors, time_indices, equations)
+            maximum.run()
+        magnitude = np.sqrt(self.values[1:, 0, :] ** 2 + self.values[1:, 1, :] ** 2)
+        frames = np.argmax(magnitude, axis=0) + 1
+        self.assertTrue(np.allclose(maximum.finishing_up(), self.values[frames, :2, np.arange(16)].T))
+
+    def test_arrival_at_range_boundary(self):
+        # the value of node n drops from 2 to 1 between frames n % 11 and n % 11 + 1: the condition flips just before
+        # every boundary frame of the ranges, at an interpolated time (zero crossing) after the boundary frame
+        self.values = np.ones((12, 3, 16))
+        for node in range(16):
+            self.values[:node % 11 + 1, 0, node] = 2
+        self.write('d')
+        condition = operations.Condition(['[U]'], '[U]', '<', 1.5)
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            time_indices = list(range(12))
+            calculator = operations.ArrivalDurationCalculator(f, time_indices, condition)
+            calculator.run()
+            expected = calculator.finishing_up()
+            self.assertTrue(np.allclose(expected[0], [node % 11 + 2 for node in range(16)]))
+
+            specs = [(operations.ArrivalDurationCalculator, {'condition': condition})]
+            for nb_processes in (1, 2, 4):
+                reduction = operations.TimeRangeReduction(f, specs, time_indices, nb_processes)
+                self.assertGreater(reduction.nb_ranges, 1)
+                self.assertTrue(np.allclose(reduction.finishing_up(), expected))
+
+    def test_statistics(self):
+        self.values = np.random.RandomState(1).uniform(-1, 1, (200, 3, 16))
+        self.write('d')
+        scalars = [('U', 'U', 'M/S'), ('H', 'H', 'M')]
+        values = self.values[:, [0, 2], :]
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            time_indices = list(range(200))
+
+            specs = [(operations.ScalarStdCalculator, {'selected_scalars': scalars})]
+            for nb_processes in (1, 3):
+                std = operations.TimeRangeReduction(f, specs, time_indices, nb_processes).finishing_up()
+                self.assertTrue(np.allclose(std, values.std(axis=0)))
+
+            for percentile in (10, 50, 90):
+                calculator = operations.ScalarPercentileCalculator(f, scalars, time_indices[:5], percentile)
+                calculator.run()
+                self.assertTrue(np.allclose(calculator.finishing_up(),
+                                            np.percentile(values[:5], percentile, axis=0)))
+                calculator = operations.ScalarPercentileCalculator(f, scalars, time_indices, percentile)
+                calculator.run()
+                self.assertTrue(np.allclose(calculator.finishing_up(), np.percentile(values, percentile, axis=0),
+                                            atol=0.1))
+
+            # the values are linearly interpolated between frames
+            threshold = 0.3
+            specs = [(operations.ScalarExceedanceCalculator, {'selected_scalars': scalars, 'threshold': threshold})]
+            fine_time = np.linspace(0, 199, 199 * 100 + 1)
+            expected = np.array([[(np.interp(fine_time, f.time, values[:, i, node]) > threshold).mean() * 199
+                                  for node in range(16)] for i in range(2)])
+            for nb_processes in (1, 3):
+                duration = operations.TimeRangeReduction(f, specs, time_indices, nb_processes).finishing_up()
+                self.assertTrue(np.allclose(duration, expected, atol=0.1))
+
+    def test_multi_arrival_duration(self):
+        self.values = np.random.RandomState(3).uniform(-1, 1, (40, 3, 16))
+        self.write('f')
+        conditions = [operations.Condition(['[H]', '[U]', '+'], '[H] + [U]', '>', 0.3),
+                      operations.Condition(['[H]'], '[H]', '>', 0.05),
+                      operations.Condition(['[H]'], '[H]', '>', 0.5),
+                      operations.Condition(['[V]'], '[V]', '<=', 0),
+                      operations.Condition(['[H]', '[U]', '+'], '[H] + [U]', '<', 0.9)]
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            time_indices = list(range(2, 40))
+
+            expected = []
+            for condition in conditions:
+                calculator = operations.ArrivalDurationCalculator(f, time_indices, condition)
+                calculator.run()
+                expected.append(calculator.finishing_up())
+            expected = np.vstack(expected)
+
+            calculator = operations.MultiArrivalDurationCalculator(f, time_indices, conditions)
+            self.assertEqual(len(calculator.evaluators), 3)
+            self.assertEqual(calculator.var_IDs, ['H', 'U', 'V'])
+            calculator.run()
+            self.assertTrue(np.allclose(calculator.finishing_up(), expected))
+
+            specs = [(operations.MultiArrivalDurationCalculator, {'conditions': conditions})]
+            for nb_processes in (2, 4):
+                reduction = operations.TimeRangeReduction(f, specs, time_indices, nb_processes)
+                self.assertTrue(np.allclose(reduction.finishing_up(), expected))
+
+    def test_arrival_time_precision(self):
+        # in a single precision file, the crossing times of large times are still interpolated in double precision
+        header = TestHeader('f')
+        with Serafin.Write(self.path, 'fr') as f:
+            f.write_header(header)
+            for time, value in ((3600000, -0.1), (3600060, 0.3), (3600120, 0.3)):
+                f.write_entire_frame(header, time, np.full((3, 16), value))
+        condition = operations.Condition(['[U]'], '[U]', '>', 0)
+        with Serafin.Read(self.path, 'fr') as f:
+            f.read_header()
+            f.get_time()
+            calculator = operations.ArrivalDurationCalculator(f, [0, 1, 2], condition)
+            calculator.run()
+            arrival, duration = calculator.finishing_up()
+
+        first, second = np.float64(np.float32(-0.1)), np.float64(np.float32(0.3))
+        expected_arrival = (second * 3600000 - first * 3600060) / (second - first)
+        self.assertTrue(np.allclose(arrival, expected_arrival, rtol=0, atol=1e-6))
+        self.assertTrue(np.allclose(duration, 3600120 - expected_arrival, rtol=0, atol=1e-6))
+
+    def test_single_precision(self):
+        self.values = np.random.RandomState(2).uniform(-1, 1, (30, 3, 16)).astype(np.float32)
+        time_indices = list(range(30))
+        scalars = [('H', 'H', 'M'), ('M', 'M', 'M/S')]
+        vectors = [('U', 'U', 'M/S'), ('V', 'V', 'M/S')]
+        condition = operations.Condition(['[H]', '[U]', '+'], '[H] + [U]', '>', 0.2)
+
+        results = {}
+        for float_type in ('d', 'f'):
+            self.write(float_type)
+            with Serafin.Read(self.path, 'fr') as f:
+                f.read_header()
+                f.get_time()
+                _, _, equations = operations.scalars_vectors(f.header.var_IDs, scalars + vectors)
+                for max_min_type in (operations.MAX, operations.MIN, operations.MEAN):
+                    calculators = [operations.ScalarMaxMinMeanCalculator(max_min_type, f, scalars, time_indices,
+                                                                         equations),
+                                   operations.VectorMaxMinMeanCalculator(max_min_type, f, vectors, time_indices,
+                                                                         equations)]
+                    for calculator in calculators:
+                        calculator.run()
+                    # the extrema are computed in the file precision, the sums in double precision
+                    expected_type = np.float64 if float_type == 'd' or max_min_type == operations.MEAN \
+                        else np.float32
+                    self.assertEqual(calculators[0].current_values.dtype, expected_type)
+                    self.assertEqual(calculators[1].current_values['U'].dtype, expected_type)
+                    results[float_type, max_min_type] = np.vstack([calculator.finishing_up()
+                                                                   for calculator in calculators])
+
+                calculator = operations.SynchMaxCalculator(f, [('U', 'U', 'M/S')], time_indices, 'H')
+                calculator.run()
+                results[float_type, operations.SYNCH_MAX] = calculator.finishing_up()
+                calculator = operations.ArrivalDurationCalculator(f, time_indices, condition)
+                calculator.run()
+                self.assertEqual(calculator.duration.dtype, np.float64)
+                results[float_type, operations.ARRIVAL_DURATION] = calculator.finishing_up()
+            os.remove(self.path)
+        self.write('d')
+
+        # the input values are exactly the same, the maximum and minimum of the input variables are identical
+        for operator in (operations.MAX, operations.MIN):
+            self.assertTrue(np.array_equal(results['f', operator][0], results['d', operator][0]))
+        for operator in (operations.MAX, operations.MIN, operations.MEAN, operations.SYNCH_MAX,
+                         operations.ARRIVAL_DURATION):
+            self.assertTrue(np.allclose(results['f', operator], results['d', operator], rtol=1e-5, atol=1e-5))
@@ -0,0 +1,54 @@
+"""!
+Unittest for the workflow result cache
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from workflow.result_cache import ResultCache, task_key
+
+
+class ResultCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.input_name = os.path.join(self.path, 'input.txt')
+        self.output_name = os.path.join(self.path, 'output.txt')
+        with open(self.input_name, 'w') as f:
+            f.write('input')
+        with open(self.output_name, 'w') as f:
+            f.write('output')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_task_key(self):
+        key = task_key('Write Serafin', ['_out', '1'], ['parent'], [self.input_name])
+        self.assertEqual(key, task_key('Write Serafin', ['_out', '1'], ['parent'], [self.input_name]))
+        self.assertNotEqual(key, task_key('Write Serafin', ['_out', '0'], ['parent'], [self.input_name]))
+        self.assertNotEqual(key, task_key('Write Serafin', ['_out', '1'], ['other parent'], [self.input_name]))
+
+        # the input files and the files named in the options are identified by their size and modification time
+        option_key = task_key('Load 2D Polygons', [self.input_name])
+        with open(self.input_name, 'a') as f:
+            f.write(' changed')
+        self.assertNotEqual(key, task_key('Write Serafin', ['_out', '1'], ['parent'], [self.input_name]))
+        self.assertNotEqual(option_key, task_key('Load 2D Polygons', [self.input_name]))
+
+    def test_records(self):
+        cache = ResultCache(os.path.join(self.path, 'cache'))
+        key = task_key('Compute Volume', ['_volume'], [], [self.input_name])
+        self.assertFalse(cache.is_valid(key, self.output_name))
+
+        cache.record(key, self.output_name)
+        self.assertTrue(cache.is_valid(key, self.output_name))
+        self.assertFalse(cache.is_valid(task_key('Compute Volume', ['_other'], [], [self.input_name]),
+                                        self.output_name))
+
+        # a record is invalidated by any change of its output file
+        with open(self.output_name, 'a') as f:
+            f.write(' changed')
+        self.assertFalse(cache.is_valid(key, self.output_name))
+        os.remove(self.output_name)
+        self.assertFalse(cache.is_valid(key, self.output_name))
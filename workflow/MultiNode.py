@@ -105,6 +105,7 @@ class MultiNode(QGraphicsItem):
         self.second_parent = False  # special properties for pre-bifurcation nodes
         self.ports = []
         self.options = tuple()
+        self.saved_options = []  # the options as saved in the project file
 
     def index(self):
         return self._index
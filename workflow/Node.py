@@ -1,8 +1,10 @@
 import math
+import os
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from shapely.geometry import Polygon
+from workflow.result_cache import task_key
 from workflow.util import ConfigureDialog
 
 
@@ -258,6 +260,39 @@ class Node(QGraphicsItem):
     def run(self):
         pass
 
+    def input_files(self):
+        return []
+
+    def cache_key(self):
+        """!
+        @brief Hash the options of the node and of all its upstream nodes, with the identity of the input files
+        @return <str>: the key of the node result
+        """
+        parent_keys = [port.mother.parentItem().cache_key() for port in self.ports
+                       if port.type == Port.INPUT and port.has_mother()]
+        return task_key(self.name(), self.save().split('|')[5:], parent_keys, self.input_files())
+
+    def _output_key(self):
+        scene = self.scene()
+        return task_key(self.name(), [scene.language, scene.csv_separator, scene.digits], [self.cache_key()])
+
+    def reuse_output(self, filename):
+        """!
+        @brief Check if the existing output file of the node can be reused instead of running the node
+        @param filename <str>: the output file
+        @return <bool>: True if the output file is reused
+        """
+        if self.overwrite or not os.path.exists(filename):
+            return False
+        if self.scene().result_cache is None:
+            return True
+        # with the result cache, an existing output file written from other inputs is never reused
+        return self.scene().result_cache.is_valid(self._output_key(), filename)
+
+    def record_output(self, filename):
+        if self.scene().result_cache is not None:
+            self.scene().result_cache.record(self._output_key(), filename)
+
     def construct_mesh(self, mesh):
         five_percent = 0.05 * mesh.nb_triangles
         nb_processed = 0
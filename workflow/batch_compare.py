@@ -0,0 +1,67 @@
+"""!
+Command line tool: compare many Serafin results to a single reference frame on an identical mesh
+"""
+
+import logging
+import sys
+
+from conf.settings import CSV_SEPARATOR, DIGITS, LANG, NCSIZE
+from geom import BlueKenue, Shapefile
+from slf import Serafin
+from slf.comparison import BatchComparison
+
+
+def read_polygons(filename):
+    if filename[-4:] == '.i2s':
+        with BlueKenue.Read(filename) as f:
+            f.read_header()
+            return list(f.get_polygons())
+    return list(Shapefile.get_polygons(filename))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Compare many runs to a single reference frame')
+    parser.add_argument('reference', help='reference Serafin file')
+    parser.add_argument('tests', nargs='+', help='test Serafin files (on the reference mesh)')
+    parser.add_argument('-o', '--output', required=True, help='output CSV file')
+    parser.add_argument('--var', required=True, help='variable ID to compare')
+    parser.add_argument('--ref-index', type=int, default=1, help='reference frame number (1-based, default 1)')
+    parser.add_argument('--init-index', type=int, default=None,
+                        help='initial frame number in the test files (1-based), to compute the BSS')
+    parser.add_argument('--polygons', help='comparison polygons (.i2s or .shp)')
+    parser.add_argument('--no-mesh', action='store_true', help='do not compare on the whole mesh')
+    parser.add_argument('--lang', default=LANG, help='language of the Serafin files (default %s)' % LANG)
+    parser.add_argument('--ncsize', type=int, default=NCSIZE, help='number of processes (default %d)' % NCSIZE)
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+
+    polygons = read_polygons(args.polygons) if args.polygons else []
+    polynames = ['Polygon %d' % (i+1) for i in range(len(polygons))]
+    if args.no_mesh and not polygons:
+        sys.exit('Nothing to compare: give some polygons or remove --no-mesh.')
+
+    with Serafin.Read(args.reference, args.lang) as input_stream:
+        input_stream.read_header()
+        input_stream.get_time()
+        if not input_stream.header.is_2d:
+            sys.exit('The reference file is not 2D.')
+        if args.var not in input_stream.header.var_IDs:
+            sys.exit('Variable %s not found in the reference file.' % args.var)
+        if not 1 <= args.ref_index <= len(input_stream.time):
+            sys.exit('Reference frame number %d out of range.' % args.ref_index)
+        ref_header = input_stream.header
+        ref_values = input_stream.read_var_in_frame(args.ref_index - 1, args.var)
+
+    init_index = None if args.init_index is None else args.init_index - 1
+    comparison = BatchComparison(ref_header, ref_values, args.var, polygons, polynames,
+                                 not args.no_mesh, init_index)
+    comparison.construct_weights()
+    result = comparison.run(args.tests, args.lang, args.ncsize)
+
+    with open(args.output, 'w') as output_stream:
+        comparison.write_csv(result, output_stream, CSV_SEPARATOR, '{0:.%df}' % DIGITS)
+    logging.info('%d/%d runs compared, output saved to %s' % (len(result), len(args.tests), args.output))
@@ -2,12 +2,13 @@ import logging
 import sys
 from time import time
 
-from conf.settings import CSV_SEPARATOR, LANG, DIGITS, SCENE_SIZE
+from conf.settings import CSV_SEPARATOR, LANG, DIGITS, RESULT_CACHE_DIR, SCENE_SIZE
 from workflow.Node import Port, Box, Link
 from workflow.nodes_io import *
 from workflow.nodes_op import *
 from workflow.nodes_calc import *
 from workflow.nodes_vis import *
+from workflow.result_cache import ResultCache
 from workflow.util import logger
 
 
@@ -24,6 +25,8 @@ NODES = {'Input/Output': {'Load Serafin 2D': LoadSerafin2DNode, 'Load Serafin 3D
                               'Convert to Single Precision': ConvertToSinglePrecisionNode,
                               'Add Transformation': AddTransformationNode},
          'Operators': {'Max': ComputeMaxNode, 'Min': ComputeMinNode, 'Mean': ComputeMeanNode, 'SynchMax': SynchMaxNode,
+                       'Std': ComputeStdNode, 'Percentile': ComputePercentileNode,
+                       'Time Above Threshold': ComputeExceedanceNode,
                        'Project B on A': ProjectMeshNode, 'A Minus B': MinusNode, 'B Minus A': ReverseMinusNode,
                        'Max(A,B)': MaxBetweenNode, 'Min(A,B)': MinBetweenNode},
          'Calculations': {'Compute Arrival Duration': ArrivalDurationNode,
@@ -83,6 +86,7 @@ class MonoScene(QGraphicsScene):
         self.language = LANG
         self.csv_separator = CSV_SEPARATOR
         self.digits = DIGITS
+        self.result_cache = None if RESULT_CACHE_DIR is None else ResultCache(RESULT_CACHE_DIR)
 
         self._init_with_default_node()
 
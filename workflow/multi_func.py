@@ -1,59 +1,84 @@
+import atexit
 import os
+import pickle
+import shutil
 import struct
+import sys
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
 from datetime import datetime
-from multiprocessing import Process, Queue
 import numpy as np
 from shapely.geometry import Polygon
 
+from conf.settings import MEMORY_BUDGET, MESH_CACHE_SIZE
 from geom import BlueKenue, Shapefile
 from slf.datatypes import SerafinData, PolylineData, PointData, CSVData
 from slf.flux import TriangularVectorField, FluxCalculator
 from slf.interpolation import MeshInterpolator
 import slf.misc as operations
 from slf import Serafin
-from slf.variables import do_calculations_in_frame, get_available_variables, \
+from slf.variables import CalculationPlan, get_available_variables, \
                           get_necessary_equations, new_variables_from_US
-from slf.volume import TruncatedTriangularPrisms, VolumeCalculator
+from slf.volume import MultiVolumeCalculator, TruncatedTriangularPrisms, VolumeCalculator
 from workflow.util import process_output_options, process_geom_output_options, process_vtk_output_options
 
 
 class Workers:
+    """!
+    @brief The persistent pool of worker processes of the multi-folder workflow
+
+    The processes are started once and kept warm across the runs (with their imported modules and mesh caches).
+    The mesh arrays of the Serafin headers are shared through a temporary directory,
+    so that the tasks and the results only carry lightweight data handles.
+    Only the task arguments and the worker processes use the directory: the results keep their own copy of the mesh
+    in the GUI process, which does not depend on the directory removed at shutdown.
+    """
     def __init__(self, ncsize):
         self.nb_processes = ncsize
-        self.started = False
-        self.stopped = False
-        self.task_queue = Queue()
-        self.done_queue = Queue()
-
-        self.processes = []
-        for i in range(self.nb_processes):
-            self.processes.append(Process(target=worker, args=(self.task_queue, self.done_queue)))
-
-    def add_tasks(self, tasks):
-        for task in tasks:
-            self.task_queue.put(task)
+        self.executor = None
+        self.mesh_cache = None
 
     def start(self):
-        for p in self.processes:
-            p.start()
-        self.started = True
-
-    def stop(self):
+        if self.executor is not None:
+            return
+        self.mesh_cache = tempfile.mkdtemp(prefix='workflow_mesh_')
+        self.executor = ProcessPoolExecutor(self.nb_processes, initializer=init_worker, initargs=(self.mesh_cache,))
         for i in range(self.nb_processes):
-            self.task_queue.put('STOP')
-        self.stopped = True
+            self.executor.submit(os.getpid)  # spawn the processes before the first run
+        atexit.register(self.shutdown)
+
+    def submit(self, func, args):
+        """!
+        @brief Send a task to the pool (restarted if a worker process died)
+        @return <concurrent.futures.Future>: the future result of the task, with the peak memory of the worker
+        """
+        try:
+            return self.executor.submit(run_task, func, self.pickle_args(args))
+        except BrokenProcessPool:
+            self.shutdown()
+            self.start()
+            return self.executor.submit(run_task, func, self.pickle_args(args))
 
-    def add_task(self, task):
-        self.task_queue.put(task)
+    def pickle_args(self, args):
+        # the executor pickles in a background thread: the arguments are pickled here, sharing their meshes
+        with Serafin.shared_meshes(self.mesh_cache):
+            return pickle.dumps(args, pickle.HIGHEST_PROTOCOL)
 
-    def get_result(self):
-        return self.done_queue.get()
+    def shutdown(self):
+        if self.executor is None:
+            return
+        self.executor.shutdown()
+        self.executor = None
+        atexit.unregister(self.shutdown)
+        shutil.rmtree(self.mesh_cache, ignore_errors=True)
+        self.mesh_cache = None
 
 
-def worker(input_queue, output_queue):
-    for func, args in iter(input_queue.get, 'STOP'):
-        result = func(*args)
-        output_queue.put(result)
+def init_worker(mesh_cache):
+    Serafin.set_mesh_cache(mesh_cache)
 
 
 def success_message(node_name, job_id, info='', second_job_id=''):
@@ -335,6 +360,43 @@ def compute_mean(node_id, fid, data, options):
     return True, node_id, fid, new_data, success_message('Mean', data.job_id)
 
 
+def compute_std(node_id, fid, data, options):
+    if not data.header.is_2d:
+        return False, node_id, fid, None, fail_message('the input file is not 2d', 'Std', data.job_id)
+    if len(data.selected_time_indices) == 1:
+        return False, node_id, fid, None, fail_message('the input file has only one frame', 'Std', data.job_id)
+
+    new_data = data.copy()
+    new_data.operator = operations.STD
+    return True, node_id, fid, new_data, success_message('Std', data.job_id)
+
+
+def compute_percentile(node_id, fid, data, options):
+    if not data.header.is_2d:
+        return False, node_id, fid, None, fail_message('the input file is not 2d', 'Percentile', data.job_id)
+    if len(data.selected_time_indices) == 1:
+        return False, node_id, fid, None, fail_message('the input file has only one frame', 'Percentile', data.job_id)
+
+    new_data = data.copy()
+    new_data.operator = operations.PERCENTILE
+    new_data.metadata = {'percentile': options[0]}
+    return True, node_id, fid, new_data, success_message('Percentile', data.job_id)
+
+
+def compute_exceedance(node_id, fid, data, options):
+    if not data.header.is_2d:
+        return False, node_id, fid, None, fail_message('the input file is not 2d', 'Time Above Threshold',
+                                                       data.job_id)
+    if len(data.selected_time_indices) == 1:
+        return False, node_id, fid, None, fail_message('the input file has only one frame', 'Time Above Threshold',
+                                                       data.job_id)
+
+    new_data = data.copy()
+    new_data.operator = operations.EXCEEDANCE
+    new_data.metadata = {'threshold': options[0]}
+    return True, node_id, fid, new_data, success_message('Time Above Threshold', data.job_id)
+
+
 def synch_max(node_id, fid, data, options):
     if not data.header.is_2d:
         return False, node_id, fid, None, fail_message('the input file is not 2d', 'SynchMax', data.job_id)
@@ -386,7 +448,11 @@ def convert_to_single(node_id, fid, data, options):
     return True, node_id, fid, new_data, success_message('Convert to Single Precision', data.job_id)
 
 
-def write_slf(node_id, fid, data, options):
+def prepare_slf_output(node_id, fid, data, options):
+    """!
+    @brief Process the output options of the node Write Serafin
+    @return <tuple, str>: the node result if the node is already done (otherwise None) and the output file name
+    """
     suffix, in_source_folder, dir_path, double_name, overwrite = options
 
     filename = process_output_options(data.filename, data.job_id, os.path.splitext(data.filename)[1],
@@ -397,11 +463,12 @@ def write_slf(node_id, fid, data, options):
                 with open(filename, 'r') as f:
                     pass
             except PermissionError:
-                return False, node_id, fid, None, fail_message('access denied when reloading existing file',
-                                                               'Write Serafin', data.job_id)
+                return (False, node_id, fid, None, fail_message('access denied when reloading existing file',
+                                                                'Write Serafin', data.job_id)), filename
             new_data = SerafinData(data.job_id, filename, data.language)
             new_data.read()
-            return True, node_id, fid, new_data, success_message('Write Serafin', data.job_id, 'reload existing file')
+            return (True, node_id, fid, new_data,
+                    success_message('Write Serafin', data.job_id, 'reload existing file')), filename
 
     try:
         with open(filename, 'w') as f:
@@ -411,19 +478,11 @@ def write_slf(node_id, fid, data, options):
             os.remove(filename)
         except PermissionError:
             pass
-        return False, node_id, fid, None, fail_message('access denied', 'Write Serafin', data.job_id)
+        return (False, node_id, fid, None, fail_message('access denied', 'Write Serafin', data.job_id)), filename
+    return None, filename
 
-    if data.operator is None:
-        success, message = write_simple_slf(data, filename)
-    elif data.operator in (operations.MAX, operations.MIN, operations.MEAN):
-        success, message = write_max_min_mean(data, filename)
-    elif data.operator == operations.ARRIVAL_DURATION:
-        success, message = write_arrival_duration(data, filename)
-    elif data.operator == operations.SYNCH_MAX:
-        success, message = write_synch_max(data, filename)
-    else:
-        success, message = write_project_mesh(data, filename)
 
+def finish_slf_output(node_id, fid, data, filename, success, message):
     new_data = None
     if success:
         new_data = SerafinData(data.job_id, filename, data.language)
@@ -437,134 +496,533 @@ def write_slf(node_id, fid, data, options):
     return success, node_id, fid, new_data, message
 
 
-def write_simple_slf(input_data, filename):
-    output_header = input_data.default_output_header()
-    with Serafin.Read(input_data.filename, input_data.language) as input_stream:
-        input_stream.header = input_data.header
-        input_stream.time = input_data.time
-
-        with Serafin.Write(filename, input_data.language) as output_stream:
-            output_stream.write_header(output_header)
-            for i, time_index in enumerate(input_data.selected_time_indices):
-                values = do_calculations_in_frame(input_data.equations, input_stream, time_index,
-                                                  input_data.selected_vars, output_header.np_float_type,
-                                                  is_2d=output_header.is_2d, us_equation=input_data.us_equation)
-                output_stream.write_entire_frame(output_header, input_data.time[time_index], values)
-    return True, success_message('Write Serafin', input_data.job_id)
+def discard_output(filename):
+    """!
+    @brief Remove the output file of a failed task, so that it is never reloaded as an existing file
+    """
+    try:
+        os.remove(filename)
+    except (FileNotFoundError, PermissionError):
+        pass
 
 
-def write_max_min_mean(input_data, filename):
-    selected = [(var, input_data.selected_vars_names[var][0],
-                      input_data.selected_vars_names[var][1]) for var in input_data.selected_vars]
-    scalars, vectors, additional_equations = operations.scalars_vectors(input_data.header.var_IDs,
-                                                                        selected,
-                                                                        input_data.us_equation)
-    output_header = input_data.header.copy()
-    output_header.nb_var = len(scalars) + len(vectors)
-    output_header.var_IDs, output_header.var_names, output_header.var_units = [], [], []
-    for var_ID, var_name, var_unit in scalars + vectors:
-        output_header.var_IDs.append(var_ID)
-        output_header.var_names.append(var_name)
-        output_header.var_units.append(var_unit)
-    if input_data.to_single:
-        output_header.to_single_precision()
+def prepare_simple_slf(node_id, fid, data, options):
+    """!
+    @brief Process the options of the node Write Serafin for an input without temporal operator
+    @return <tuple or FrameConsumer>: the node result if the node is already done, otherwise the Serafin writer
+    """
+    result, filename = prepare_slf_output(node_id, fid, data, options)
+    if result is not None:
+        return result
+    return SimpleSerafinWriter(node_id, fid, data, filename)
 
-    with Serafin.Read(input_data.filename, input_data.language) as input_stream:
-        input_stream.header = input_data.header
-        input_stream.time = input_data.time
-        has_scalar, has_vector = False, False
-        scalar_calculator, vector_calculator = None, None
-        if scalars:
-            has_scalar = True
-            scalar_calculator = operations.ScalarMaxMinMeanCalculator(input_data.operator, input_stream,
-                                                                      scalars, input_data.selected_time_indices,
-                                                                      additional_equations)
-        if vectors:
-            has_vector = True
-            vector_calculator = operations.VectorMaxMinMeanCalculator(input_data.operator, input_stream,
-                                                                      vectors, input_data.selected_time_indices,
-                                                                      additional_equations)
-        if has_scalar:
-            scalar_calculator.run()
-        if has_vector:
-            vector_calculator.run()
-
-        if has_scalar and not has_vector:
-            values = scalar_calculator.finishing_up()
-        elif not has_scalar and has_vector:
-            values = vector_calculator.finishing_up()
-        else:
-            values = np.vstack((scalar_calculator.finishing_up(), vector_calculator.finishing_up()))
 
-        with Serafin.Write(filename, input_data.language) as resout:
-            resout.write_header(output_header)
-            resout.write_entire_frame(output_header, input_data.time[0], values)
+# the temporal operators reducing all selected frames to a single output frame
+REDUCTION_OPERATORS = (operations.MAX, operations.MIN, operations.MEAN, operations.SYNCH_MAX,
+                       operations.ARRIVAL_DURATION, operations.STD, operations.PERCENTILE, operations.EXCEEDANCE)
 
-    return True, success_message('Write Serafin', input_data.job_id)
 
+def write_slf(node_id, fid, data, options):
+    if data.operator is None:
+        task = prepare_simple_slf(node_id, fid, data, options)
+        if isinstance(task, FrameConsumer):
+            return run_frame_consumers(data, [task])[0]
+        return task
+
+    result, filename = prepare_slf_output(node_id, fid, data, options)
+    if result is not None:
+        return result
+    if data.operator in REDUCTION_OPERATORS:
+        success, message = write_reduction(data, filename)
+    else:
+        success, message = write_project_mesh(data, filename)
+    return finish_slf_output(node_id, fid, data, filename, success, message)
+
+
+class FrameConsumer:
+    """!
+    @brief A node consuming the selected frames of its input Serafin, possibly in the same frame loop as its siblings
+
+    The frames can also be split into shards, each consumed by a copy of the consumer in its own process,
+    with the partial results merged at the end.
+    """
+    def __init__(self, node_id, fid, data):
+        self.node_id = node_id
+        self.fid = fid
+        self.data = data
+        self.first_frame = None  # the position of the first frame of a shard in the selected frames
+
+    def start(self, input_stream, context):
+        """!
+        @brief Prepare the computation before the frame loop
+        @param input_stream <slf.Serafin.SharedFrameReader>: the input stream shared with the other consumers
+        @param context <contextlib.ExitStack>: the context closing the output files at the end of the frame loop
+        """
+        raise NotImplementedError
+
+    def run_in_frame(self, time_index):
+        raise NotImplementedError
+
+    def finish(self):
+        """!
+        @brief Terminate the computation after the frame loop
+        @return <tuple>: the node result
+        """
+        raise NotImplementedError
+
+    def prepare_shards(self, nb_frames):
+        """!
+        @brief Prepare the output once, before the shards run on ranges of the selected frames
+        @param nb_frames <int>: the number of selected frames
+        """
+        pass
+
+    def partial_result(self):
+        """!
+        @brief Return the partial result of a shard, after the frame loop on its range of frames
+        """
+        raise NotImplementedError
+
+    def finish_shards(self, partials):
+        """!
+        @brief Terminate the computation from the partial results of all shards
+        @param partials <list>: the partial results, in order of frames
+        @return <tuple>: the node result
+        """
+        raise NotImplementedError
+
+
+class SimpleSerafinWriter(FrameConsumer):
+    def __init__(self, node_id, fid, data, filename):
+        super().__init__(node_id, fid, data)
+        self.filename = filename
+        self.output_header = data.default_output_header()
+        self.frame_offsets = None  # the header and frame sizes of the output file, when written by shards
+        self.input_stream = None
+        self.output_stream = None
+        self.plan = None
+
+    def prepare_shards(self, nb_frames):
+        with Serafin.Write(self.filename, self.data.language) as output_stream:
+            output_stream.write_header(self.output_header)
+            self.frame_offsets = output_stream.reserve_frames(self.output_header, nb_frames)
+
+    def start(self, input_stream, context):
+        self.input_stream = input_stream
+        if self.first_frame is None:
+            self.output_stream = context.enter_context(Serafin.Write(self.filename, self.data.language))
+            self.output_stream.write_header(self.output_header)
+        else:
+            self.output_stream = context.enter_context(Serafin.FrameWrite(self.filename, self.data.language,
+                                                                          *self.frame_offsets, self.first_frame))
+        self.plan = CalculationPlan(self.data.equations, self.data.header, self.data.selected_vars,
+                                    self.output_header.np_float_type, self.output_header.is_2d,
+                                    self.data.us_equation)
+
+    def run_in_frame(self, time_index):
+        values = self.plan.run_in_frame(self.input_stream, time_index)
+        self.output_stream.write_entire_frame(self.output_header, self.data.time[time_index], values)
+
+    def finish(self):
+        return finish_slf_output(self.node_id, self.fid, self.data, self.filename, True,
+                                 success_message('Write Serafin', self.data.job_id))
+
+    def partial_result(self):
+        return None  # the frames are written at their place in the output file
+
+    def finish_shards(self, partials):
+        return self.finish()
+
+
+def concatenate_csv(partials):
+    """!
+    @brief Concatenate the CSV data of consecutive ranges of frames, with the same header
+    @param partials <[slf.datatypes.CSVData]>: the CSV data of every range, in order of frames
+    @return <slf.datatypes.CSVData>: the CSV data of all frames
+    """
+    csv_data = partials[0]
+    for other in partials[1:]:
+        csv_data.table.extend(other.table[1:])
+    return csv_data
+
+
+class VolumeConsumer(FrameConsumer):
+    def __init__(self, node_id, fid, data, filename, definitions, polygon_names, polygons,
+                 csv_separator, format_string):
+        super().__init__(node_id, fid, data)
+        self.filename = filename
+        self.definitions = definitions
+        self.polygon_names = polygon_names
+        self.polygons = polygons
+        self.csv_separator = csv_separator
+        self.format_string = format_string
+        self.calculator = None
+        self.csv_data = None
+
+    def start(self, input_stream, context):
+        mesh = TruncatedTriangularPrisms(self.data.header, False)
+        attach_mesh(mesh, self.data)
+
+        self.calculator = MultiVolumeCalculator(self.definitions, input_stream, self.polygon_names, self.polygons, 1)
+        self.calculator.time_indices = self.data.selected_time_indices
+        self.calculator.mesh = mesh
+        self.calculator.construct_weights()
+        self.csv_data = CSVData(self.data.filename, self.calculator.get_csv_header())
+
+    def run_in_frame(self, time_index):
+        self.csv_data.add_row(self.calculator.run_in_frame(time_index, self.format_string))
+
+    def finish(self):
+        self.csv_data.write(self.filename, self.csv_separator)
+        return True, self.node_id, self.fid, None, success_message('Compute Volume', self.data.job_id)
+
+    def partial_result(self):
+        return self.csv_data
+
+    def finish_shards(self, partials):
+        self.csv_data = concatenate_csv(partials)
+        return self.finish()
+
+
+class FluxConsumer(FrameConsumer):
+    def __init__(self, node_id, fid, data, filename, flux_type, var_IDs, section_names, sections,
+                 csv_separator, format_string):
+        super().__init__(node_id, fid, data)
+        self.filename = filename
+        self.flux_type = flux_type
+        self.var_IDs = var_IDs
+        self.section_names = section_names
+        self.sections = sections
+        self.csv_separator = csv_separator
+        self.format_string = format_string
+        self.calculator = None
+        self.frame_fluxes = []  # the time and the flux values of every frame, accumulated at the end
+
+    def _create_calculator(self, input_stream):
+        self.calculator = FluxCalculator(self.flux_type, self.var_IDs, input_stream, self.section_names,
+                                         self.sections, 1, cumulative=True)
+
+    def start(self, input_stream, context):
+        mesh = TriangularVectorField(self.data.header, False)
+        attach_mesh(mesh, self.data)
+
+        self._create_calculator(input_stream)
+        self.calculator.time_indices = self.data.selected_time_indices
+        self.calculator.mesh = mesh
+        self.calculator.construct_intersections()
+
+    def run_in_frame(self, time_index):
+        self.frame_fluxes.append((self.data.time[time_index], self.calculator.fluxes_in_frame(time_index)))
+
+    def finish(self):
+        csv_data = CSVData(self.data.filename, self.calculator.get_csv_header())
+        for time_value, fluxes in self.frame_fluxes:
+            csv_data.add_row(self.calculator.row_in_frame(time_value, fluxes, self.format_string))
+        csv_data.write(self.filename, self.csv_separator)
+        return True, self.node_id, self.fid, None, success_message('Compute Flux', self.data.job_id)
+
+    def partial_result(self):
+        return self.frame_fluxes
+
+    def finish_shards(self, partials):
+        # the time integrals run over all frames, so they are computed only here (without the mesh intersections)
+        with Serafin.Read(self.data.filename, self.data.language) as input_stream:
+            input_stream.header = self.data.header
+            input_stream.time = self.data.time
+            self._create_calculator(input_stream)
+        self.frame_fluxes = [frame for frame_fluxes in partials for frame in frame_fluxes]
+        return self.finish()
+
+
+class PointsConsumer(FrameConsumer):
+    def __init__(self, node_id, fid, data, filename, selected_vars, points, csv_separator, format_string):
+        super().__init__(node_id, fid, data)
+        self.filename = filename
+        self.selected_vars = selected_vars
+        self.points = points
+        self.csv_separator = csv_separator
+        self.format_string = format_string
+        self.input_stream = None
+        self.point_interpolators = []
+        self.nb_inside = 0
+        self.csv_data = None
+
+    def start(self, input_stream, context):
+        self.input_stream = input_stream
+        mesh = MeshInterpolator(self.data.header, False)
+        attach_mesh(mesh, self.data)
+
+        is_inside, point_interpolators = mesh.get_point_interpolators(self.points)
+        self.point_interpolators = [p for i, p in enumerate(point_interpolators) if is_inside[i]]
+        self.nb_inside = sum(map(int, is_inside))
+
+        header = ['time']
+        for index, (x, y) in enumerate(self.points):
+            if is_inside[index]:
+                for var in self.selected_vars:
+                    header.append('Point %d %s (%.4f, %.4f)' % (index+1, var, x, y))
+        self.csv_data = CSVData(self.data.filename, header)
+
+    def run_in_frame(self, time_index):
+        if self.nb_inside == 0:
+            return
+        row = [str(self.data.time[time_index])]
+        var_values = [self.input_stream.read_var_in_frame(time_index, var) for var in self.selected_vars]
+        for (i, j, k), interpolator in self.point_interpolators:
+            for values in var_values:
+                row.append(self.format_string.format(interpolator.dot(values[[i, j, k]])))
+        self.csv_data.add_row(row)
+
+    def finish(self):
+        if self.nb_inside == 0:
+            try:
+                os.remove(self.filename)
+            except PermissionError:
+                pass
+            return False, self.node_id, self.fid, None, fail_message('no point inside the mesh',
+                                                                     'Interpolate on Points', self.data.job_id)
+
+        self.csv_data.write(self.filename, self.csv_separator)
+        return True, self.node_id, self.fid, None, \
+            success_message('Interpolate on Points', self.data.job_id,
+                            '%s point%s inside the mesh' % (self.nb_inside, 's are' if self.nb_inside > 1 else ' is'))
+
+    def partial_result(self):
+        return self.nb_inside, self.csv_data
+
+    def finish_shards(self, partials):
+        self.nb_inside = partials[0][0]
+        self.csv_data = concatenate_csv([csv_data for _, csv_data in partials])
+        return self.finish()
+
+
+def consume_frames(data, consumers, time_indices):
+    """!
+    @brief Run several consumers of the same input Serafin in a single loop over the given frames
+    @param data <slf.datatypes.SerafinData>: the common input data
+    @param consumers <[FrameConsumer]>: the consumers
+    @param time_indices <[int]>: the time indices of the frames
+    """
+    with Serafin.Read(data.filename, data.language) as input_stream:
+        input_stream.header = data.header
+        input_stream.time = data.time
+        shared_stream = Serafin.SharedFrameReader(input_stream)
+
+        with ExitStack() as context:
+            for consumer in consumers:
+                consumer.start(shared_stream, context)
+            for time_index in time_indices:
+                for consumer in consumers:
+                    consumer.run_in_frame(time_index)
+
+
+def run_frame_consumers(data, consumers):
+    """!
+    @brief Run several consumers of the same input Serafin in a single frame loop
+    @param data <slf.datatypes.SerafinData>: the common input data
+    @param consumers <[FrameConsumer]>: the consumers
+    @return <[tuple]>: the node results, in the same order as the consumers
+    """
+    consume_frames(data, consumers, data.selected_time_indices)
+    return [consumer.finish() for consumer in consumers]
+
+
+def can_be_fused(node_name, data):
+    """!
+    @brief Check if a node consumes the frames of its input data, so that it can be fused with its siblings
+    """
+    return node_name in FRAME_CONSUMERS and (node_name != 'Write Serafin' or data.operator is None)
+
+
+def run_fused(data, node_tasks):
+    """!
+    @brief Run sibling nodes consuming the same input data, reading every frame only once
+    @param data <slf.datatypes.SerafinData>: the common input data
+    @param node_tasks <[(str, tuple)]>: the name and the task arguments of every node
+    @return <[tuple]>: the node results, in the same order as the nodes
+    """
+    results = []
+    consumers = []
+    for node_name, args in node_tasks:
+        task = FRAME_CONSUMERS[node_name](*args)
+        if isinstance(task, FrameConsumer):
+            consumers.append(task)
+            results.append(None)
+        else:
+            results.append(task)
+    if consumers:
+        consumer_results = iter(run_frame_consumers(data, consumers))
+        results = [next(consumer_results) if result is None else result for result in results]
+    return results
+
+
+def can_be_sharded(node_name, data):
+    """!
+    @brief Check if a node task can be split into shards running on ranges of the selected frames of its input data
+    """
+    if node_name not in FRAME_CONSUMERS or len(data.selected_time_indices) < 2:
+        return False
+    if node_name != 'Write Serafin' or data.operator is None:
+        return True
+    if data.operator not in REDUCTION_OPERATORS:
+        return False
+    _, specs, nb_arrays = reduction_plan(data)
+    # the partial results of the shards are merged, and the reductions by node chunks are not split further
+    return all(hasattr(calculator_class, 'merge') for calculator_class, _ in specs) and \
+        (MEMORY_BUDGET is None or MEMORY_BUDGET // (8 * nb_arrays) >= data.header.nb_nodes)
+
+
+def plan_shards(node_name, args, nb_shards):
+    """!
+    @brief Split a node task into shards running on contiguous ranges of the selected frames (see can_be_sharded)
+
+    The output options are processed only once, before the shards run.
+    The frames of a Serafin output are written by every shard at their offsets, since they have a constant size.
+    @param node_name <str>: the node name
+    @param args <tuple>: the arguments of the node task
+    @param nb_shards <int>: the maximum number of shards
+    @return <tuple, [(function, tuple)], (function, tuple), str>: the node result if the node is already done \
+            (otherwise None), the shard tasks, the merge task (called with the partial results as last argument) \
+            and the output file (to discard if a shard fails)
+    """
+    node_id, fid, data = args[:3]
+    time_indices = data.selected_time_indices
+    if node_name == 'Write Serafin' and data.operator is not None:
+        result, filename = prepare_slf_output(node_id, fid, data, args[3])
+        if result is not None:
+            return result, [], None, None
+        output_header, specs, _ = reduction_plan(data)
+        with Serafin.Read(data.filename, data.language) as input_stream:
+            input_stream.header = data.header
+            input_stream.time = data.time
+            reduction = operations.TimeRangeReduction(input_stream, specs, time_indices, nb_ranges=nb_shards)
+        return None, [(operations.reduce_time_range, (job,)) for job in reduction.jobs], \
+            (merge_reduction, (node_id, fid, data, filename, output_header)), filename
+
+    task = FRAME_CONSUMERS[node_name](*args)
+    if not isinstance(task, FrameConsumer):
+        return task, [], None, None
+    task.prepare_shards(len(time_indices))
+    bounds = np.linspace(0, len(time_indices), min(nb_shards, len(time_indices))+1).astype(int)
+    return None, [(run_consumer_shard, (task, int(start), time_indices[start:end]))
+                  for start, end in zip(bounds[:-1], bounds[1:])], (task.finish_shards, ()), task.filename
+
+
+def run_consumer_shard(consumer, first_frame, time_indices):
+    """!
+    @brief (Used in sharded tasks) Run a consumer on a range of the selected frames
+    @param consumer <FrameConsumer>: the consumer, with its output already prepared
+    @param first_frame <int>: the position of the range in the selected frames
+    @param time_indices <[int]>: the time indices of the range
+    @return <object>: the partial result of the consumer
+    """
+    consumer.first_frame = first_frame
+    consume_frames(consumer.data, [consumer], time_indices)
+    return consumer.partial_result()
+
+
+def merge_reduction(node_id, fid, data, filename, output_header, partials):
+    """!
+    @brief (Used in sharded tasks) Merge the calculators run on the ranges of frames and write the reduction
+    @param partials <[(int, list)]>: the range index and the calculators of every range, in order of frames
+    @return <tuple>: the node result
+    """
+    calculators = operations.TimeRangeReduction.merge([calculators for _, calculators in partials])
+    values = np.vstack([calculator.finishing_up() for calculator in calculators])
+    success, message = write_reduction_output(data, filename, output_header, values)
+    return finish_slf_output(node_id, fid, data, filename, success, message)
+
+
+def reduction_plan(input_data):
+    """!
+    @brief Prepare the temporal reduction of the node Write Serafin
+    @param input_data <slf.datatypes.SerafinData>: the input data with a reduction operator
+    @return <slf.Serafin.SerafinHeader, [(type, dict)], int>: the output header, the calculator classes with their \
+            arguments (other than the input stream and the time indices) and the number of node arrays in memory
+    """
+    if input_data.operator == operations.SYNCH_MAX:
+        selected_vars = [var for var in input_data.selected_vars if var in input_data.header.var_IDs]
+        output_vars = [(var_ID,) + tuple(input_data.selected_vars_names[var_ID]) for var_ID in selected_vars]
+        specs = [(operations.SynchMaxCalculator, {'selected_vars': output_vars,
+                                                  'ref_var': input_data.metadata['var']})]
+        nb_arrays = 2 * len(selected_vars) + 5
+    elif input_data.operator == operations.ARRIVAL_DURATION:
+        conditions, table, time_unit = input_data.metadata['conditions'], \
+                                       input_data.metadata['table'], input_data.metadata['time unit']
+        unit = bytes(time_unit.upper(), 'utf-8').ljust(16)
+        output_vars = [('', bytes(name, 'utf-8').ljust(16), unit) for row in table for name in (row[1], row[2])]
+        specs = [(operations.MultiArrivalDurationCalculator, {'conditions': conditions})]
+        nb_arrays = 10 * len(conditions)
+    else:
+        selected = [(var, input_data.selected_vars_names[var][0],
+                          input_data.selected_vars_names[var][1]) for var in input_data.selected_vars]
+        scalars, vectors, additional_equations = operations.scalars_vectors(input_data.header.var_IDs,
+                                                                            selected,
+                                                                            input_data.us_equation)
+        if input_data.operator in (operations.MAX, operations.MIN, operations.MEAN):
+            output_vars = scalars + vectors
+            specs = []
+            if scalars:
+                specs.append((operations.ScalarMaxMinMeanCalculator,
+                              {'max_min_type': input_data.operator, 'selected_scalars': scalars,
+                               'additional_equations': additional_equations}))
+            if vectors:
+                specs.append((operations.VectorMaxMinMeanCalculator,
+                              {'max_min_type': input_data.operator, 'selected_vectors': vectors,
+                               'additional_equations': additional_equations}))
+            # accumulators, computed values and temporary arrays
+            nb_arrays = 3 * len(scalars) + 5 * len(vectors) + len(additional_equations)
+        else:
+            variables = scalars + vectors  # the vector components are processed separately
+            if input_data.operator == operations.STD:
+                output_vars = variables
+                specs = [(operations.ScalarStdCalculator, {'selected_scalars': variables,
+                                                           'additional_equations': additional_equations})]
+            elif input_data.operator == operations.PERCENTILE:
+                output_vars = variables
+                specs = [(operations.ScalarPercentileCalculator, {'selected_scalars': variables,
+                                                                  'percentile': input_data.metadata['percentile'],
+                                                                  'additional_equations': additional_equations})]
+            else:
+                output_vars = [(var_ID, var_name, bytes('S', 'utf-8').ljust(16)) for var_ID, var_name, _ in variables]
+                specs = [(operations.ScalarExceedanceCalculator, {'selected_scalars': variables,
+                                                                  'threshold': input_data.metadata['threshold'],
+                                                                  'additional_equations': additional_equations})]
+            # accumulators (ten markers for the percentiles), computed values and temporary arrays
+            nb_arrays = (12 if input_data.operator == operations.PERCENTILE else 4) * len(variables) \
+                + len(additional_equations)
 
-def write_synch_max(input_data, filename):
-    selected_vars = [var for var in input_data.selected_vars if var in input_data.header.var_IDs]
     output_header = input_data.header.copy()
-    output_header.nb_var = len(selected_vars)
+    output_header.nb_var = len(output_vars)
     output_header.var_IDs, output_header.var_names, output_header.var_units = [], [], []
-    for var_ID in selected_vars:
-        var_name, var_unit = input_data.selected_vars_names[var_ID]
+    for var_ID, var_name, var_unit in output_vars:
         output_header.var_IDs.append(var_ID)
         output_header.var_names.append(var_name)
         output_header.var_units.append(var_unit)
     if input_data.to_single:
         output_header.to_single_precision()
+    return output_header, specs, nb_arrays
 
-    with Serafin.Read(input_data.filename, input_data.language) as input_stream:
-        input_stream.header = input_data.header
-        input_stream.time = input_data.time
-
-        calculator = operations.SynchMaxCalculator(input_stream, selected_vars, input_data.selected_time_indicies,
-                                                   input_data.metadata['var'])
-        calculator.run()
-        values = calculator.finishing_up()
-
-        with Serafin.Write(filename, input_data.language) as output_stream:
-            output_stream.write_header(output_header)
-            output_stream.write_entire_frame(output_header, input_data.time[0], values)
-
-    return True, success_message('Write Serafin', input_data.job_id)
 
-
-def write_arrival_duration(input_data, filename):
-    conditions, table, time_unit = input_data.metadata['conditions'], \
-                                   input_data.metadata['table'], input_data.metadata['time unit']
-
-    output_header = input_data.header.copy()
-    output_header.nb_var = 2 * len(conditions)
-    output_header.var_IDs, output_header.var_names, output_header.var_units = [], [], []
-    for row in range(len(table)):
-        a_name = table[row][1]
-        d_name = table[row][2]
-        for name in [a_name, d_name]:
-            output_header.var_IDs.append('')
-            output_header.var_names.append(bytes(name, 'utf-8').ljust(16))
-            output_header.var_units.append(bytes(time_unit.upper(), 'utf-8').ljust(16))
-    if input_data.to_single:
-        output_header.to_single_precision()
+def write_reduction(input_data, filename):
+    output_header, specs, nb_arrays = reduction_plan(input_data)
 
     with Serafin.Read(input_data.filename, input_data.language) as input_stream:
         input_stream.header = input_data.header
         input_stream.time = input_data.time
-        calculators = []
 
-        for i, condition in enumerate(conditions):
-            calculators.append(operations.ArrivalDurationCalculator(input_stream, input_data.selected_time_indices,
-                                                                    condition))
-        for calculator in calculators:
-            calculator.run()
+        def create_calculators(stream):
+            return [calculator_class(input_stream=stream, time_indices=input_data.selected_time_indices, **kwargs)
+                    for calculator_class, kwargs in specs]
+
+        values = operations.run_by_node_chunks(input_stream, create_calculators, nb_arrays, MEMORY_BUDGET)
 
-        values = np.empty((2*len(conditions), input_data.header.nb_nodes))
-        for i, calculator in enumerate(calculators):
-            values[2*i, :] = calculator.arrival
-            values[2*i+1, :] = calculator.duration
+    return write_reduction_output(input_data, filename, output_header, values)
 
+
+def write_reduction_output(input_data, filename, output_header, values):
+    if input_data.operator == operations.ARRIVAL_DURATION:
+        time_unit = input_data.metadata['time unit']
         if time_unit == 'minute':
             values /= 60
         elif time_unit == 'hour':
@@ -575,9 +1033,9 @@ def write_arrival_duration(input_data, filename):
             values *= 100 / (input_data.time[input_data.selected_time_indices[-1]]
                              - input_data.time[input_data.selected_time_indices[0]])
 
-        with Serafin.Write(filename, input_data.language) as resout:
-            resout.write_header(output_header)
-            resout.write_entire_frame(output_header, input_data.time[0], values)
+    with Serafin.Write(filename, input_data.language) as output_stream:
+        output_stream.write_header(output_header)
+        output_stream.write_entire_frame(output_header, input_data.time[0], values)
 
     return True, success_message('Write Serafin', input_data.job_id)
 
@@ -638,13 +1096,7 @@ def write_project_mesh(first_input, filename):
     # map points of A onto mesh B
     mesh = MeshInterpolator(second_input.header, False)
 
-    if second_input.triangles:
-        mesh.index = second_input.index
-        mesh.triangles = second_input.triangles
-    else:
-        construct_mesh(mesh)
-        second_input.index = mesh.index
-        second_input.triangles = mesh.triangles
+    attach_mesh(mesh, second_input)
 
     is_inside, point_interpolators = mesh.get_point_interpolators(list(zip(first_input.header.x,
                                                                            first_input.header.y)))
@@ -679,11 +1131,67 @@ def construct_mesh(mesh):
         mesh.index.insert(i, t.bounds, obj=(i, j, k))
 
 
-def compute_volume(node_id, fid, data, aux_data, options, csv_separator, format_string):
+class MeshArtifactCache:
+    """!
+    @brief The triangles and spatial indexes built by a process, keyed by mesh fingerprint
+
+    The least recently used meshes are evicted when the estimated size of the cache exceeds its memory cap.
+    """
+    TRIANGLE_SIZE = 1024  # estimated size (in bytes) of a triangle polygon and its index entry
+
+    def __init__(self, max_size):
+        """!
+        @param max_size <int>: memory cap (in bytes), None for no limit
+        """
+        self.max_size = max_size
+        self.size = 0
+        self.artifacts = OrderedDict()
+
+    def get(self, key):
+        if key not in self.artifacts:
+            return None
+        self.artifacts.move_to_end(key)
+        return self.artifacts[key][0]
+
+    def put(self, key, artifacts, size):
+        self.artifacts[key] = (artifacts, size)
+        self.size += size
+        while self.max_size is not None and self.size > self.max_size and len(self.artifacts) > 1:
+            _, (_, evicted_size) = self.artifacts.popitem(last=False)
+            self.size -= evicted_size
+
+
+MESH_ARTIFACTS = MeshArtifactCache(MESH_CACHE_SIZE)
+
+
+def attach_mesh(mesh, data):
+    """!
+    @brief Give the triangles and the spatial index of the input mesh, built only once per process for every mesh
+    @param mesh <slf.mesh2D.Mesh2D>: the mesh without index
+    @param data <slf.datatypes.SerafinData>: the input data, which keeps a reference to the built objects
+    """
+    if not data.triangles:
+        key = data.header.mesh_fingerprint()
+        artifacts = MESH_ARTIFACTS.get(key)
+        if artifacts is None:
+            construct_mesh(mesh)
+            artifacts = mesh.index, mesh.triangles
+            MESH_ARTIFACTS.put(key, artifacts, mesh.nb_triangles * MeshArtifactCache.TRIANGLE_SIZE)
+        data.index, data.triangles = artifacts
+    mesh.index = data.index
+    mesh.triangles = data.triangles
+
+
+def prepare_volume(node_id, fid, data, aux_data, options, csv_separator, format_string):
+    """!
+    @brief Process the options of the node Compute Volume
+    @return <tuple or FrameConsumer>: the node result if the node is already done, otherwise the volume consumer
+    """
     if not data.header.is_2d:
         return False, node_id, fid, None, fail_message('the input file is not 2d', 'Compute Volume',
                                                        data.job_id)
-    first_var, second_var, sup_volume, suffix, in_source_folder, dir_path, double_name, overwrite = options
+    first_var, second_var, sup_volume, suffix, in_source_folder, dir_path, \
+        double_name, overwrite, additional_vars = options
 
     # process volume options
     if first_var not in data.selected_vars or first_var not in data.header.var_IDs:
@@ -691,6 +1199,8 @@ def compute_volume(node_id, fid, data, aux_data, options, csv_separator, format_
     if second_var is not None and second_var != '0':
         if second_var not in data.selected_vars or second_var not in data.header.var_IDs:
             return False, node_id, fid, None, fail_message('variable not available', 'Compute Volume', data.job_id)
+    if not all(var in data.selected_vars and var in data.header.var_IDs for var in additional_vars):
+        return False, node_id, fid, None, fail_message('variable not available', 'Compute Volume', data.job_id)
 
     polygons = aux_data.lines
     polygon_names = ['Polygon %d' % (i+1) for i in range(len(polygons))]
@@ -716,39 +1226,24 @@ def compute_volume(node_id, fid, data, aux_data, options, csv_separator, format_
             pass
         return False, node_id, fid, None, fail_message('access denied', 'Compute Volume', data.job_id)
 
-    # prepare the mesh
-    mesh = TruncatedTriangularPrisms(data.header, False)
-
-    if data.triangles:
-        mesh.index = data.index
-        mesh.triangles = data.triangles
-    else:
-        construct_mesh(mesh)
-        data.index = mesh.index
-        data.triangles = mesh.triangles
+    definitions = [(volume_type, var_ID, second_var_ID) for var_ID, second_var_ID
+                   in [(first_var, second_var)] + [(var_ID, None) for var_ID in additional_vars]]
+    return VolumeConsumer(node_id, fid, data, filename, definitions, polygon_names, polygons,
+                          csv_separator, format_string)
 
-    # run the calculator
-    with Serafin.Read(data.filename, data.language) as input_stream:
-        input_stream.header = data.header
-        input_stream.time = data.time
-
-        calculator = VolumeCalculator(volume_type, first_var, second_var, input_stream,
-                                      polygon_names, polygons, 1)
-        calculator.time_indices = data.selected_time_indices
-        calculator.mesh = mesh
-        calculator.construct_weights()
-
-        csv_data = CSVData(data.filename, calculator.get_csv_header())
-
-        result = calculator.run(format_string)
-        for row in result:
-            csv_data.add_row(row)
 
-    csv_data.write(filename, csv_separator)
-    return True, node_id, fid, None, success_message('Compute Volume', data.job_id)
+def compute_volume(node_id, fid, data, aux_data, options, csv_separator, format_string):
+    task = prepare_volume(node_id, fid, data, aux_data, options, csv_separator, format_string)
+    if isinstance(task, FrameConsumer):
+        return run_frame_consumers(data, [task])[0]
+    return task
 
 
-def compute_flux(node_id, fid, data, aux_data, options, csv_separator, format_string):
+def prepare_flux(node_id, fid, data, aux_data, options, csv_separator, format_string):
+    """!
+    @brief Process the options of the node Compute Flux
+    @return <tuple or FrameConsumer>: the node result if the node is already done, otherwise the flux consumer
+    """
     if not data.header.is_2d:
         return False, node_id, fid, None, fail_message('the input file is not 2d', 'Compute Flux',
                                                        data.job_id)
@@ -791,38 +1286,22 @@ def compute_flux(node_id, fid, data, aux_data, options, csv_separator, format_st
             pass
         return False, node_id, fid, None, fail_message('access denied', 'Compute Flux', data.job_id)
 
-    # prepare the mesh
-    mesh = TriangularVectorField(data.header, False)
-
-    if data.triangles:
-        mesh.index = data.index
-        mesh.triangles = data.triangles
-    else:
-        construct_mesh(mesh)
-        data.index = mesh.index
-        data.triangles = mesh.triangles
-
-   # run the calculator
-    with Serafin.Read(data.filename, data.language) as input_stream:
-        input_stream.header = data.header
-        input_stream.time = data.time
-
-        calculator = FluxCalculator(flux_type, var_IDs,
-                                    input_stream, section_names, sections, 1)
-        calculator.time_indices = data.selected_time_indices
-        calculator.mesh = mesh
-        calculator.construct_intersections()
+    return FluxConsumer(node_id, fid, data, filename, flux_type, var_IDs, section_names, sections,
+                        csv_separator, format_string)
 
-        csv_data = CSVData(data.filename, ['time'] + section_names)
-        result = calculator.run(format_string)
-        for row in result:
-            csv_data.add_row(row)
 
-    csv_data.write(filename, csv_separator)
-    return True, node_id, fid, None, success_message('Compute Flux', data.job_id)
+def compute_flux(node_id, fid, data, aux_data, options, csv_separator, format_string):
+    task = prepare_flux(node_id, fid, data, aux_data, options, csv_separator, format_string)
+    if isinstance(task, FrameConsumer):
+        return run_frame_consumers(data, [task])[0]
+    return task
 
 
-def interpolate_points(node_id, fid, data, aux_data, options, csv_separator, format_string):
+def prepare_points(node_id, fid, data, aux_data, options, csv_separator, format_string):
+    """!
+    @brief Process the options of the node Interpolate on Points
+    @return <tuple or FrameConsumer>: the node result if the node is already done, otherwise the points consumer
+    """
     if not data.header.is_2d:
         return False, node_id, fid, None, fail_message('the input file is not 2d', 'Interpolate on Points',
                                                        data.job_id)
@@ -849,61 +1328,14 @@ def interpolate_points(node_id, fid, data, aux_data, options, csv_separator, for
             pass
         return False, node_id, fid, None, fail_message('access denied', 'Interpolate on Points', data.job_id)
 
-    # prepare the mesh
-    mesh = MeshInterpolator(data.header, False)
+    return PointsConsumer(node_id, fid, data, filename, selected_vars, aux_data.points, csv_separator, format_string)
 
-    if data.triangles:
-        mesh.index = data.index
-        mesh.triangles = data.triangles
-    else:
-        construct_mesh(mesh)
-        data.index = mesh.index
-        data.triangles = mesh.triangles
-
-    # process the points
-    points = aux_data.points
-    is_inside, point_interpolators = mesh.get_point_interpolators(points)
-    indices = [i for i in range(len(points)) if is_inside[i]]
-    points = [p for i, p in enumerate(points) if is_inside[i]]
-    point_interpolators = [p for i, p in enumerate(point_interpolators) if is_inside[i]]
-    nb_inside = sum(map(int, is_inside))
-    if nb_inside == 0:
-        try:
-            os.remove(filename)
-        except PermissionError:
-            pass
-
-        return False, node_id, fid, None, fail_message('no point inside the mesh', 'Interpolate on Points', data.job_id)
-
-    # do calculation
-    header = ['time']
-    for index, (x, y) in zip(indices, points):
-        for var in selected_vars:
-            header.append('Point %d %s (%.4f, %.4f)' % (index+1, var, x, y))
-    csv_data = CSVData(data.filename, header)
-
-    nb_selected_vars = len(selected_vars)
 
-    with Serafin.Read(data.filename, data.language) as input_stream:
-        input_stream.header = data.header
-        input_stream.time = data.time
-
-        for index, index_time in enumerate(data.selected_time_indices):
-            row = [str(data.time[index_time])]
-
-            var_values = []
-            for var in selected_vars:
-                var_values.append(input_stream.read_var_in_frame(index_time, var))
-
-            for (i, j, k), interpolator in point_interpolators:
-                for index_var in range(nb_selected_vars):
-                    row.append(format_string.format(interpolator.dot(var_values[index_var][[i, j, k]])))
-            csv_data.add_row(row)
-
-    csv_data.write(filename, csv_separator)
-    return True, node_id, fid, None, \
-                 success_message('Interpolate on Points', data.job_id, 
-                                 '%s point%s inside the mesh' % (nb_inside, 's are' if nb_inside > 1 else ' is'))
+def interpolate_points(node_id, fid, data, aux_data, options, csv_separator, format_string):
+    task = prepare_points(node_id, fid, data, aux_data, options, csv_separator, format_string)
+    if isinstance(task, FrameConsumer):
+        return run_frame_consumers(data, [task])[0]
+    return task
 
 
 def interpolate_lines(node_id, fid, data, aux_data, options, csv_separator, format_string):
@@ -935,13 +1367,7 @@ def interpolate_lines(node_id, fid, data, aux_data, options, csv_separator, form
     # prepare the mesh
     mesh = MeshInterpolator(data.header, False)
 
-    if data.triangles:
-        mesh.index = data.index
-        mesh.triangles = data.triangles
-    else:
-        construct_mesh(mesh)
-        data.index = mesh.index
-        data.triangles = mesh.triangles
+    attach_mesh(mesh, data)
 
     # process the line
     lines = aux_data.lines
@@ -1010,13 +1436,7 @@ def project_lines(node_id, fid, data, aux_data, options, csv_separator, format_s
     # prepare the mesh
     mesh = MeshInterpolator(data.header, False)
 
-    if data.triangles:
-        mesh.index = data.index
-        mesh.triangles = data.triangles
-    else:
-        construct_mesh(mesh)
-        data.index = mesh.index
-        data.triangles = mesh.triangles
+    attach_mesh(mesh, data)
 
     # process the line
     nb_nonempty, indices_nonempty, line_interpolators, _ = mesh.get_line_interpolators(lines)
@@ -1269,10 +1689,166 @@ def write_vtk(node_id, fid, data, options):
     return True, node_id, fid, None, success_message('Write shp', data.job_id)
 
 
+# the nodes writing a single output file reusable from the result cache, with the position of their output options
+# (suffix, in_source_folder, dir_path, double_name, overwrite) and the output extension (None for the input extension)
+OUTPUT_OPTIONS = {'Write Serafin': (0, None), 'Compute Volume': (3, '.csv'), 'Compute Flux': (1, '.csv'),
+                  'Interpolate on Points': (0, '.csv'), 'Interpolate along Lines': (0, '.csv'),
+                  'Project Lines': (0, '.csv')}
+
+
+def output_filename(node_name, data, options):
+    """!
+    @brief Process the output options of a node writing a single output file
+    @return <str, bool>: the output file name and the overwrite option
+    """
+    start, extension = OUTPUT_OPTIONS[node_name]
+    if extension is None:
+        extension = os.path.splitext(data.filename)[1]
+    suffix, in_source_folder, dir_path, double_name, overwrite = options[start:start+5]
+    return process_output_options(data.filename, data.job_id, extension,
+                                  suffix, in_source_folder, dir_path, double_name), overwrite
+
+
+def force_overwrite(node_name, options):
+    """!
+    @brief Set the overwrite option of a node, whose existing output file is not a valid cached result
+    """
+    start, _ = OUTPUT_OPTIONS[node_name]
+    return options[:start+4] + (True,) + options[start+5:]
+
+
+def input_files(data):
+    """!
+    @return <[str]>: the Serafin files read for the data, the operand of a two-input operator included
+    """
+    filenames = [data.filename]
+    if 'operand' in data.metadata:
+        filenames.append(data.metadata['operand'].filename)
+    return filenames
+
+
+def reload_output(node_id, fid, data, node_name, filename):
+    """!
+    @brief Reuse the output file of a node from the result cache, instead of running the node
+    """
+    if node_name != 'Write Serafin':
+        return True, node_id, fid, None, success_message(node_name, data.job_id, 'reuse cached result')
+    new_data = SerafinData(data.job_id, filename, data.language)
+    new_data.read()
+    return True, node_id, fid, new_data, success_message('Write Serafin', data.job_id, 'reuse cached result')
+
+
+# the nodes looping over the selected frames of their input (the other nodes read a single frame or only metadata)
+FRAME_LOOP_NODES = {'Write Serafin', 'Compute Volume', 'Compute Flux', 'Interpolate on Points',
+                    'Interpolate along Lines', 'Project Lines', 'Write vtk'}
+SINGLE_FRAME_NODES = {'Write LandXML', 'Write shp'}
+COST_PER_GEOMETRY = 0.25  # relative cost of every polygon, section, line or point of double input nodes
+
+
+# number of arrays of the size of a variable kept in memory by Write Serafin, for every variable and every operator
+OPERATOR_MEMORY_FACTORS = {None: 2, operations.MAX: 3, operations.MIN: 3, operations.MEAN: 3,
+                           operations.SYNCH_MAX: 3, operations.ARRIVAL_DURATION: 6, operations.STD: 4,
+                           operations.PERCENTILE: 12, operations.EXCEEDANCE: 3}
+PROJECTION_MEMORY_FACTOR = 4  # for the other operators (between two meshes), plus the point interpolators
+POINT_INTERPOLATOR_SIZE = 48  # size (in bytes) of the interpolator of a point (3 indices and 3 weights)
+
+
+def estimate_task(node_name, data, aux_data=None):
+    """!
+    @brief Estimate the relative cost and the peak memory of a node task from the metadata of its input
+    @param node_name <str>: the node name
+    @param data <slf.datatypes.SerafinData or str>: the input data, or the input file name for loading nodes
+    @param aux_data <slf.datatypes.SerafinData or slf.datatypes.PolylineData or slf.datatypes.PointData>:
+           the auxiliary data of double input nodes, or the second input of two-input nodes
+    @return <float, int>: the estimated cost (in number of values to process) and peak memory (in bytes)
+    """
+    if isinstance(data, str):
+        # the loading nodes are cheap, but the larger files have longer downstream tasks
+        try:
+            return os.path.getsize(data) / 4, 0
+        except OSError:
+            return 0, 0
+    if not isinstance(data, SerafinData) or data.header is None:
+        return 1, 0
+
+    header = data.header
+    nb_vars = max(1, len(data.selected_vars))
+    memory = header.nb_nodes * 3 * 8 + header.nb_elements * header.nb_nodes_per_elem * 8
+    cost = header.nb_nodes
+    if node_name in FRAME_LOOP_NODES:
+        cost *= nb_vars * max(1, len(data.selected_time_indices))
+        if node_name == 'Write Serafin':
+            arrays_size = nb_vars * header.nb_nodes * 8
+            if data.operator in OPERATOR_MEMORY_FACTORS:
+                arrays_size *= OPERATOR_MEMORY_FACTORS[data.operator]
+                if MEMORY_BUDGET is not None and data.operator is not None:
+                    arrays_size = min(arrays_size, MEMORY_BUDGET)  # computed by node chunks
+            else:
+                arrays_size = arrays_size * PROJECTION_MEMORY_FACTOR + header.nb_nodes * POINT_INTERPOLATOR_SIZE
+            memory += arrays_size
+        else:
+            memory += 2 * nb_vars * header.nb_nodes * 8 + header.nb_elements * MeshArtifactCache.TRIANGLE_SIZE
+    elif node_name in SINGLE_FRAME_NODES:
+        cost *= nb_vars
+        memory += nb_vars * header.nb_nodes * 8
+
+    if isinstance(aux_data, SerafinData):
+        aux_cost, aux_memory = estimate_task(node_name, aux_data)
+        cost += aux_cost
+        memory += aux_memory
+    elif aux_data is not None:
+        geometries = aux_data.lines if hasattr(aux_data, 'lines') else getattr(aux_data, 'points', [])
+        cost *= 1 + COST_PER_GEOMETRY * len(geometries)
+    return cost, memory
+
+
+def reset_peak_memory():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_memory():
+    """!
+    @brief Return the peak resident set size of the current process (since the last reset, on Linux)
+    @return <int>: the peak memory (in bytes), or None if it is not available
+    """
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_task(func, pickled_args):
+    """!
+    @brief Run a task in a worker process, measuring its peak memory
+    @param pickled_args <bytes>: the pickled arguments of the task (see Workers.pickle_args)
+    @return <tuple, int>: the task result and the peak memory (in bytes) of the worker process during the task
+    """
+    reset_peak_memory()
+    result = func(*pickle.loads(pickled_args))
+    return result, peak_memory()
+
+
+FRAME_CONSUMERS = {'Write Serafin': prepare_simple_slf, 'Compute Volume': prepare_volume, 'Compute Flux': prepare_flux,
+                   'Interpolate on Points': prepare_points}
+
 FUNCTIONS = {'Select Variables': select_variables, 'Add Rouse': add_rouse, 'Select Time': select_time,
              'Select Single Frame': select_single_frame,
              'Select First Frame': select_first_frame, 'Select Last Frame': select_last_frame,
-             'Max': compute_max, 'Min': compute_min, 'Mean': compute_mean,
+             'Max': compute_max, 'Min': compute_min, 'Mean': compute_mean, 'SynchMax': synch_max,
+             'Std': compute_std, 'Percentile': compute_percentile, 'Time Above Threshold': compute_exceedance,
              'Convert to Single Precision': convert_to_single, 'Compute Arrival Duration': arrival_duration,
              'Load 2D Polygons': read_polygons, 'Load 2D Open Polylines': read_polylines, 'Load 2D Points': read_points,
              'Write Serafin': write_slf, 'Compute Volume': compute_volume, 'Compute Flux': compute_flux,
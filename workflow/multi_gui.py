@@ -4,12 +4,15 @@ from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 import sys
 import os
+from concurrent.futures import FIRST_COMPLETED, wait
+from heapq import heappop, heappush
 from time import time
 
-from conf.settings import CSV_SEPARATOR, DIGITS, LANG, NCSIZE, SCENE_SIZE
+from conf.settings import CSV_SEPARATOR, DIGITS, LANG, NCSIZE, RESULT_CACHE_DIR, SCENE_SIZE, WORKERS_MEMORY_BUDGET
 import workflow.multi_func as worker
-from workflow.MultiNode import Box, MultiLink
+from workflow.MultiNode import Box, MultiLink, MultiPort
 from workflow.multi_nodes import *
+from workflow.result_cache import ResultCache, task_key
 from workflow.util import logger
 
 
@@ -29,7 +32,9 @@ NODES = {'Input/Output': {'Load Serafin 2D': MultiLoadSerafin2DNode, 'Load Seraf
          'Operators': {'Max': MultiComputeMaxNode, 'Min': MultiComputeMinNode, 'Mean': MultiComputeMeanNode,
                        'Project B on A': MultiProjectMeshNode, 'A Minus B': MultiMinusNode,
                        'B Minus A': MultiReverseMinusNode, 'Max(A,B)': MultiMaxBetweenNode,
-                       'Min(A,B)': MultiMinBetweenNode, 'SynchMax': MultiSynchMaxNode},
+                       'Min(A,B)': MultiMinBetweenNode, 'SynchMax': MultiSynchMaxNode,
+                       'Std': MultiComputeStdNode, 'Percentile': MultiComputePercentileNode,
+                       'Time Above Threshold': MultiComputeExceedanceNode},
          'Calculations': {'Compute Arrival Duration': MultiArrivalDurationNode,
                           'Compute Volume': MultiComputeVolumeNode, 'Compute Flux': MultiComputeFluxNode,
                           'Interpolate on Points': MultiInterpolateOnPointsNode,
@@ -174,6 +179,7 @@ class MultiScene(QGraphicsScene):
                     index = int(index)
                     node = NODES[category][name](index)
                     node.load(line[5:])
+                    node.saved_options = line[5:]
                     self.add_node(node, float(x), float(y))
 
                 # load edges
@@ -534,7 +540,397 @@ class CmdMessage(QPlainTextEdit):
         logger.info(message)
 
 
+class ShardGroup:
+    """!
+    @brief The shards of a task running in parallel on ranges of frames, and the task merging their partial results
+
+    A planning task prepares the output and splits the task in a worker process, then the shards and the merge task
+    are scheduled like the other tasks.
+    """
+    PLAN, MERGE = -1, -2  # the index of the planning task and of the merge task in the group
+
+    def __init__(self, nb_shards, cost, memory):
+        self.nb_shards = nb_shards  # the maximum number of shards
+        self.cost = cost  # the estimated cost and memory of the whole task
+        self.memory = memory
+        self.merge_fun, self.merge_args = None, None
+        self.filename = None  # the output file, prepared before the shards run
+        self.partials = []
+        self.nb_running = 0
+        self.failure = None  # the node results if a shard failed
+
+    def start(self, merge, filename, nb_shards):
+        self.merge_fun, self.merge_args = merge
+        self.filename = filename
+        self.partials = [None] * nb_shards
+        self.nb_running = nb_shards
+
+    @staticmethod
+    def task_name(index):
+        if index == ShardGroup.PLAN:
+            return 'shard planning'
+        if index == ShardGroup.MERGE:
+            return 'shard merge'
+        return 'shard %d' % (index+1)
+
+
+class MultiScheduler(QThread):
+    """!
+    @brief Run the tasks of the workflow in the worker pool, each as soon as its input data is available
+
+    The scheduler waits for the task futures off the GUI thread, and posts every node result back with a signal.
+    The tasks are admitted against the memory budget of the workers, from their estimated peak memory.
+    When some worker processes would stay idle, a task looping over frames is split into shards on ranges of frames.
+    With a result cache, the nodes writing an output file reuse it if nothing it depends on has changed since.
+    """
+    auxiliary_result = pyqtSignal(bool, int, str)
+    result = pyqtSignal(bool, int, int, str)
+
+    def __init__(self, workers, scene, table, csv_separator, format_string):
+        super().__init__()
+        self.workers = workers
+        self.scene = scene
+        self.table = table
+        self.csv_separator = csv_separator
+        self.format_string = format_string
+        # the nodes (node ID, file ID, job ID), the estimated cost and memory, the start time
+        # and the shard (group and index, None for whole tasks) of every running task
+        self.futures = {}
+        self.ready_tasks = []  # heap of the tasks ready to run, the most costly first
+        self.nb_ready_tasks = 0
+        self.memory_budget = float('inf') if WORKERS_MEMORY_BUDGET is None else WORKERS_MEMORY_BUDGET
+        self.memory_in_use = 0
+        self.result_cache = None if RESULT_CACHE_DIR is None else ResultCache(RESULT_CACHE_DIR)
+        self.chain_keys = {}  # the key of the options of every node and of all its upstream nodes
+        self.output_keys = {}  # the task key and the output file of the running output nodes
+        # the data waiting for the other input of the double input nodes (kept here, off the GUI thread)
+        self.auxiliary_data = {}  # the data of the auxiliary input node connected to every double input node
+        self.pending_data = {}  # the data of every (two inputs node, file ID) waiting for its pair
+        self.reported = set()  # the (node ID, file ID) whose result is already posted
+
+    def run(self):
+        # an exception escaping QThread.run aborts the whole application: the scheduler errors fail the nodes instead
+        try:
+            # first get auxiliary tasks done
+            if not self._run_auxiliary_tasks():
+                return
+
+            self._submit_input_tasks()
+            self._dispatch()
+            while self.futures:
+                done, _ = wait(self.futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._receive_future(future)
+                self._dispatch()
+        except Exception as e:
+            logger.exception('The scheduler failed')
+            # the running tasks are left to finish, their nodes and those of the ready tasks are reported as failed
+            failed_nodes = [node for nodes, _, _, _, _ in self.futures.values() for node in nodes]
+            failed_nodes.extend(node for task in self.ready_tasks for node in task[5])
+            wait(self.futures)
+            self.futures, self.ready_tasks = {}, []
+            self._fail_nodes(failed_nodes, e)
+
+    def _receive_future(self, future):
+        """!
+        @brief Handle the result of a finished task, an error of the scheduler fails the task nodes (or the next ones)
+        """
+        nodes, cost, memory, start_time, shard = self.futures.pop(future)
+        self.memory_in_use -= memory
+        try:
+            results, peak = future.result()
+            node_names = ', '.join(self.scene.nodes[node_id].name() for node_id, _, _ in nodes)
+            logger.debug('%s (%s%s): estimated cost %.0f, duration %.3f s, estimated memory %d MB, '
+                         'peak memory %s MB' % (node_names, nodes[0][2],
+                                                '' if shard is None else ', ' + ShardGroup.task_name(shard[1]),
+                                                cost, time() - start_time, memory // 2**20,
+                                                '?' if peak is None else peak // 2**20))
+            failed = False
+        except Exception as e:
+            results = [(False, node_id, fid, None,
+                        worker.fail_message(repr(e), self.scene.nodes[node_id].name(), job_id))
+                       for node_id, fid, job_id in nodes]
+            failed = True
+        try:
+            if shard is None:
+                self._receive_results(results)
+            else:
+                self._receive_shard(shard, results, failed, nodes)
+        except Exception as e:
+            logger.exception('The scheduler failed to handle a result')
+            self._fail_nodes(nodes, e)
+
+    def _fail_nodes(self, nodes, error):
+        """!
+        @brief Report the failure of the nodes not reported yet, or else of their next nodes which will not run
+        @param nodes <[tuple]>: the nodes (node ID, file ID, job ID) of a task
+        @param error <Exception>: the error of the scheduler
+        """
+        for node_id, fid, job_id in nodes:
+            if (node_id, fid) in self.reported:
+                failed_nodes = [(next_node_id, fid) for next_node_id in self.scene.adj_list[node_id]]
+            else:
+                failed_nodes = [(node_id, fid)]
+            for failed_id, failed_fid in failed_nodes:
+                if (failed_id, failed_fid) not in self.reported:
+                    self._post_result(False, failed_id, failed_fid,
+                                      worker.fail_message(repr(error), self.scene.nodes[failed_id].name(), job_id))
+
+    def _post_result(self, success, node_id, fid, message):
+        self.reported.add((node_id, fid))
+        self.result.emit(success, node_id, fid, message)
+
+    def _receive_results(self, results):
+        # a list of results for fused sibling nodes
+        for success, node_id, fid, data, message in (results if isinstance(results, list) else [results]):
+            output = self.output_keys.pop((node_id, fid), None)
+            if success and output is not None:
+                try:
+                    self.result_cache.record(*output)
+                except OSError as e:
+                    logger.warning('The output of %s is not cached: %s' % (self.scene.nodes[node_id].name(), e))
+            self._post_result(success, node_id, fid, message)
+            if success:
+                self._submit_next_tasks(node_id, fid, data)
+
+    def _receive_shard(self, shard, result, failed, nodes):
+        """!
+        @brief Handle the result of the planning, of a shard or of the merge of a task split into shards
+
+        The shards are submitted once the task is planned, and the merge task once all shards are done.
+        """
+        group, index = shard
+        if index == ShardGroup.PLAN:
+            if failed:
+                self._receive_results(result)
+                return
+            node_result, shards, merge, filename = result
+            if node_result is not None:
+                self._receive_results(node_result)
+                return
+            group.start(merge, filename, len(shards))
+            for shard_index, (fun, args) in enumerate(shards):
+                self._submit(fun, args, nodes, (group.cost / len(shards), group.memory), (group, shard_index))
+            return
+        if index == ShardGroup.MERGE:
+            results = result if isinstance(result, list) else [result]
+            if failed or not all(success for success, _, _, _, _ in results):
+                # the output file is already sized with empty frames, and would be reloaded as an existing file
+                worker.discard_output(group.filename)
+            self._receive_results(result)
+            return
+
+        if failed:
+            group.failure = result
+        else:
+            group.partials[index] = result
+        group.nb_running -= 1
+        if group.nb_running > 0:
+            return
+        if group.failure is not None:
+            worker.discard_output(group.filename)
+            self._receive_results(group.failure)
+            return
+        self._submit(group.merge_fun, group.merge_args + (group.partials,), nodes, (0, group.memory),
+                     (group, ShardGroup.MERGE))
+
+    def _submit(self, fun, args, nodes, estimate, shard=None):
+        cost, memory = estimate
+        # the order of submission breaks the ties
+        heappush(self.ready_tasks, (-cost, self.nb_ready_tasks, memory, fun, args, nodes, shard))
+        self.nb_ready_tasks += 1
+
+    def _dispatch(self):
+        """!
+        @brief Run the most costly ready tasks (longest processing time first) on the idle worker processes
+
+        A task which does not fit in the remaining memory budget waits, unless no other task is running.
+        """
+        waiting_tasks = []
+        while self.ready_tasks and len(self.futures) < self.workers.nb_processes:
+            task = heappop(self.ready_tasks)
+            neg_cost, _, memory, fun, args, nodes, shard = task
+            if self.futures and self.memory_in_use + memory > self.memory_budget:
+                waiting_tasks.append(task)
+                continue
+            try:
+                nb_shards = 1 if shard is not None else self._nb_shards(fun, args, nodes, memory)
+                if nb_shards > 1:
+                    # the output is prepared and the task is split by a worker process, off the scheduler thread
+                    shard = ShardGroup(nb_shards, -neg_cost, memory), ShardGroup.PLAN
+                    fun, args = worker.plan_shards, (self.scene.nodes[nodes[0][0]].name(), args, nb_shards)
+                future = self.workers.submit(fun, args)
+            except Exception as e:
+                logger.exception('The scheduler failed to submit a task')
+                self._fail_nodes(nodes, e)
+                continue
+            self.memory_in_use += memory
+            self.futures[future] = nodes, -neg_cost, memory, time(), shard
+        for task in waiting_tasks:
+            heappush(self.ready_tasks, task)
+
+    def _nb_shards(self, fun, args, nodes, memory):
+        """!
+        @brief Return the number of shards of a task, to use the worker processes which would stay idle otherwise
+        """
+        nb_idle = self.workers.nb_processes - len(self.futures) - len(self.ready_tasks)
+        if nb_idle < 2 or len(nodes) > 1:
+            return 1
+        node_name = self.scene.nodes[nodes[0][0]].name()
+        if fun is not worker.FUNCTIONS[node_name] or not worker.can_be_sharded(node_name, args[2]):
+            return 1
+        if memory > 0 and self.memory_budget != float('inf'):
+            # every shard holds the arrays of a whole task
+            nb_idle = min(nb_idle, int((self.memory_budget - self.memory_in_use) // memory))
+        return max(1, nb_idle)
+
+    def _chain_key(self, node_id):
+        if node_id not in self.chain_keys:
+            node = self.scene.nodes[node_id]
+            parent_keys = [self._chain_key(port.mother.parentItem().index()) for port in node.ports
+                           if port.type == MultiPort.INPUT and port.mother is not None]
+            self.chain_keys[node_id] = task_key(node.name(), node.saved_options, parent_keys)
+        return self.chain_keys[node_id]
+
+    def _lookup_output(self, node_id, fid, data):
+        """!
+        @brief Reuse the output file of a node from the result cache if it is still valid
+        @return <tuple>: the options to run the node with, None if the cached output file is reused
+        """
+        node = self.scene.nodes[node_id]
+        filename, overwrite = worker.output_filename(node.name(), data, node.options)
+        key = task_key(node.name(), [self.scene.language, self.csv_separator, self.format_string, data.job_id],
+                       [self._chain_key(node_id)], worker.input_files(data))
+        try:
+            is_valid = not overwrite and self.result_cache.is_valid(key, filename)
+        except OSError as e:
+            logger.warning('The result cache of %s is not readable: %s' % (node.name(), e))
+            is_valid = False
+        if is_valid:
+            self._submit(worker.reload_output, (node_id, fid, data, node.name(), filename),
+                         [(node_id, fid, data.job_id)], (0, 0))
+            return None
+        self.output_keys[node_id, fid] = key, filename
+        # an existing output file written from other inputs is never reused
+        return worker.force_overwrite(node.name(), node.options)
+
+    def _run_auxiliary_tasks(self):
+        # auxiliary input tasks for N-1 type of double input nodes
+        aux_futures = []
+        for node_id in self.scene.auxiliary_input_nodes:
+            fun = worker.FUNCTIONS[self.scene.nodes[node_id].name()]
+            if self.scene.nodes[node_id].name() == 'Load Reference Serafin':
+                args = (node_id, self.scene.nodes[node_id].options[0], self.scene.language)
+            else:
+                args = (node_id, self.scene.nodes[node_id].options[0])
+            aux_futures.append((node_id, self.workers.submit(fun, args)))
+
+        all_success = True
+        for node_id, future in aux_futures:
+            try:
+                (success, node_id, data, message), _ = future.result()
+            except Exception as e:
+                node = self.scene.nodes[node_id]
+                success, data, message = False, None, worker.fail_message(repr(e), node.name(), node.options[0])
+            self.auxiliary_result.emit(success, node_id, message)
+            if not success:
+                all_success = False
+                continue
+
+            # using the fact that auxiliary input nodes are always directly connected to double input nodes
+            for next_node_id in self.scene.adj_list[node_id]:
+                self.auxiliary_data[next_node_id] = data
+
+        return all_success
+
+    def _submit_input_tasks(self):
+        for node_id in self.scene.ordered_input_indices:
+            node_name = self.scene.nodes[node_id].name()
+            paths, name, job_ids = self.scene.inputs[node_id]
+            for path, job_id, fid in zip(paths, job_ids, self.table.input_columns[node_id]):
+                filename = os.path.join(path, name)
+                try:
+                    estimate = worker.estimate_task(node_name, filename)
+                except Exception as e:
+                    logger.exception('The scheduler failed to prepare %s' % node_name)
+                    self._fail_nodes([(node_id, fid, job_id)], e)
+                    continue
+                self._submit(worker.FUNCTIONS[node_name], (node_id, fid, filename, self.scene.language, job_id),
+                             [(node_id, fid, job_id)], estimate)
+
+    def _submit_double_input_task(self, fun, node, node_id, fid, data):
+        if node_id in self.auxiliary_data:
+            auxiliary_data = self.auxiliary_data[node_id]
+            self._submit(fun, (node_id, fid, auxiliary_data, data, True), [(node_id, fid, data.job_id)],
+                         worker.estimate_task(node.name(), data, auxiliary_data))
+        elif fid in node.first_ids:
+            pair_index = node.first_ids.index(fid)
+            second_id = node.second_ids[pair_index]
+            if (node_id, second_id) in self.pending_data:
+                second_data = self.pending_data.pop((node_id, second_id))
+                self._submit(fun, (node_id, fid, data, second_data, False), [(node_id, fid, data.job_id)],
+                             worker.estimate_task(node.name(), data, second_data))
+            else:
+                self.pending_data[node_id, fid] = data
+        else:
+            pair_index = node.second_ids.index(fid)
+            first_id = node.first_ids[pair_index]
+            if (node_id, first_id) in self.pending_data:
+                first_data = self.pending_data.pop((node_id, first_id))
+                self._submit(fun, (node_id, first_id, first_data, data, False), [(node_id, first_id, data.job_id)],
+                             worker.estimate_task(node.name(), first_data, data))
+            else:
+                self.pending_data[node_id, fid] = data
+
+    def _submit_next_tasks(self, node_id, fid, data):
+        current_node = self.scene.nodes[node_id]
+        fused_tasks, fused_nodes, fused_cost, fused_memory = [], [], 0, 0
+        for next_node_id in self.scene.adj_list[node_id]:
+            next_node = self.scene.nodes[next_node_id]
+            fun = worker.FUNCTIONS[next_node.name()]
+            try:
+                options = next_node.options
+                if self.result_cache is not None and next_node.name() in worker.OUTPUT_OPTIONS:
+                    options = self._lookup_output(next_node_id, fid, data)
+                    if options is None:
+                        continue
+                if next_node.double_input:
+                    auxiliary_data = self.auxiliary_data.get(next_node_id)
+                    args = (next_node_id, fid, data, auxiliary_data, options, self.csv_separator,
+                            self.format_string)
+                    estimate = worker.estimate_task(next_node.name(), data, auxiliary_data)
+                elif next_node.two_in_one_out:
+                    if current_node.second_parent:
+                        self._submit_double_input_task(fun, next_node, next_node_id, 1000+fid, data)
+                    else:
+                        self._submit_double_input_task(fun, next_node, next_node_id, fid, data)
+                    continue
+                else:
+                    args = (next_node_id, fid, data, options)
+                    estimate = worker.estimate_task(next_node.name(), data)
+            except Exception as e:
+                logger.exception('The scheduler failed to prepare %s' % next_node.name())
+                self._fail_nodes([(next_node_id, fid, data.job_id)], e)
+                continue
+
+            # the siblings reading the frames of the same data are fused in a single frame loop
+            if worker.can_be_fused(next_node.name(), data):
+                fused_tasks.append((next_node.name(), args))
+                fused_nodes.append((next_node_id, fid, data.job_id))
+                fused_cost += estimate[0]
+                fused_memory += estimate[1]
+            else:
+                self._submit(fun, args, [(next_node_id, fid, data.job_id)], estimate)
+        if len(fused_tasks) > 1:
+            self._submit(worker.run_fused, (data, fused_tasks), fused_nodes, (fused_cost, fused_memory))
+        elif fused_tasks:
+            node_name, args = fused_tasks[0]
+            self._submit(worker.FUNCTIONS[node_name], args, fused_nodes, (fused_cost, fused_memory))
+
+
 class MultiWidget(QWidget):
+    run_finished = pyqtSignal()
+
     def __init__(self, parent=None, project_path=None, ncsize=NCSIZE):
         super().__init__()
         self.parent = parent
@@ -584,10 +980,11 @@ class MultiWidget(QWidget):
 
         self.ncsize = ncsize
         self.worker = worker.Workers(self.ncsize)
+        self.scheduler = None
+        self.start_time = None
 
         if project_path is not None:
             self.scene.load(project_path)
-            self.run()
 
     def init_toolbar(self):
         for act in [self.save_act, self.run_act]:
@@ -607,141 +1004,47 @@ class MultiWidget(QWidget):
         QMessageBox.information(None, 'Success', 'Project saved.', QMessageBox.Ok)
 
     def run(self):
+        """!
+        @brief Start running the project in the background
+        @return <bool>: True if the run is started
+        """
         logger.debug('Start running project')
-        start_time = time()
-
         if not self.scene.all_configured():
             QMessageBox.critical(None, 'Error', 'Configure all nodes first!', QMessageBox.Ok)
-            return
+            return False
 
         self.scene.prepare_to_run()
         if self.parent: self.parent.save()
         self.setEnabled(False)
+        self.start_time = time()
         csv_separator = self.scene.csv_separator
         format_string = '{0:.%df}' % self.scene.digits
 
-        # first get auxiliary tasks done
-        success = self._prepare_auxiliary_tasks()
-        if not success:
-            self.worker.stop()
-            self.message_box.appendPlainText('Done!')
-            self.setEnabled(True)
-            self.worker = worker.Workers(self.ncsize)
-            return
-
-        # prepare slf input tasks
-        nb_tasks = self._prepare_input_tasks()
-
-        while not self.worker.stopped:
-            nb_tasks = self._listen(nb_tasks, csv_separator, format_string)
-            if nb_tasks == 0:
-                self.worker.stop()
+        self.worker.start()
+        self.scheduler = MultiScheduler(self.worker, self.scene, self.table, csv_separator, format_string)
+        self.scheduler.auxiliary_result.connect(self._receive_auxiliary)
+        self.scheduler.result.connect(self._receive)
+        self.scheduler.finished.connect(self._finish)
+        self.scheduler.start()
+        return True
 
+    def _finish(self):
+        self.scheduler = None
         self.message_box.appendPlainText('Done!')
         self.setEnabled(True)
-        self.worker = worker.Workers(self.ncsize)
-
-        logger.debug('Execution time %f s' % (time() - start_time))
+        logger.debug('Execution time %f s' % (time() - self.start_time))
+        self.run_finished.emit()
 
-    def _prepare_auxiliary_tasks(self):
-        # auxiliary input tasks for N-1 type of double input nodes
-        aux_tasks = []
-        for node_id in self.scene.auxiliary_input_nodes:
-            fun = worker.FUNCTIONS[self.scene.nodes[node_id].name()]
-            if self.scene.nodes[node_id].name() == 'Load Reference Serafin':
-                aux_tasks.append((fun, (node_id, self.scene.nodes[node_id].options[0], self.scene.language)))
-            else:
-                aux_tasks.append((fun, (node_id, self.scene.nodes[node_id].options[0])))
-
-        all_success = True
-        if aux_tasks:
-            self.worker.add_tasks(aux_tasks)
-            self.worker.start()
-            for i in range(len(aux_tasks)):
-                success, node_id, data, message = self.worker.get_result()
-                self.message_box.appendPlainText(message)
-
-                if not success:
-                    self.scene.nodes[node_id].state = MultiNode.FAIL
-                    all_success = False
-                    continue
-
-                self.scene.nodes[node_id].state = MultiNode.SUCCESS
-                # using the fact that auxiliary input nodes are always directly connected to double input nodes
-                next_nodes = self.scene.adj_list[node_id]
-                for next_node_id in next_nodes:
-                    next_node = self.scene.nodes[next_node_id]
-                    next_node.set_auxiliary_data(data)
-
-        return all_success
-
-    def _prepare_input_tasks(self):
-        slf_tasks = []
-        for node_id in self.scene.ordered_input_indices:
-            fun = worker.FUNCTIONS[self.scene.nodes[node_id].name()]
-            paths, name, job_ids = self.view.scene().inputs[node_id]
-            for path, job_id, fid in zip(paths, job_ids, self.table.input_columns[node_id]):
-                slf_tasks.append((fun, (node_id, fid, os.path.join(path, name),
-                                        self.scene.language, job_id)))
-        self.worker.add_tasks(slf_tasks)
-        if not self.worker.started:
-            self.worker.start()
-        return len(slf_tasks)
-
-    def _get_double_input_task(self, fun, node, node_id, fid, data):
-        if node.has_auxiliary:
-            self.worker.add_task((fun, (node_id, fid, node.auxiliary_data, data, True)))
-            return True
-        if fid in node.first_ids:
-            pair_index = node.first_ids.index(fid)
-            second_id = node.second_ids[pair_index]
-            if second_id in node.pending_data:
-                self.worker.add_task((fun, (node_id, fid,
-                                      data, node.pending_data[second_id], False)))
-                return True
-            else:
-                node.pending_data[fid] = data
-                return False
-        else:
-            pair_index = node.second_ids.index(fid)
-            first_id = node.first_ids[pair_index]
-            if first_id in node.pending_data:
-                self.worker.add_task((fun, (node_id, first_id,
-                                            node.pending_data[first_id], data, False)))
-                return True
-            else:
-                node.pending_data[fid] = data
-                return False
+    def _receive_auxiliary(self, success, node_id, message):
+        self.message_box.appendPlainText(message)
+        self.scene.nodes[node_id].state = MultiNode.SUCCESS if success else MultiNode.FAIL
 
-    def _listen(self, nb_tasks, csv_separator, format_string):
-        # get one task result
-        success, node_id, fid, data, message = self.worker.get_result()
-        nb_tasks -= 1
+    def _receive(self, success, node_id, fid, message):
         self.message_box.appendPlainText(message)
         current_node = self.scene.nodes[node_id]
         self.table.receive_result(success, node_id, fid)
-
-        # enqueue tasks from child nodes
         if success:
             current_node.nb_success += 1
-            next_nodes = self.scene.adj_list[node_id]
-            for next_node_id in next_nodes:
-                next_node = self.scene.nodes[next_node_id]
-                fun = worker.FUNCTIONS[next_node.name()]
-                if next_node.double_input:
-                    self.worker.add_task((fun, (next_node_id, fid, data, next_node.auxiliary_data,
-                                                next_node.options, csv_separator, format_string)))
-                    nb_tasks += 1
-                elif next_node.two_in_one_out:
-                    if current_node.second_parent:
-                        new_task_available = self._get_double_input_task(fun, next_node, next_node_id, 1000+fid, data)
-                    else:
-                        new_task_available = self._get_double_input_task(fun, next_node, next_node_id, fid, data)
-                    if new_task_available:
-                        nb_tasks += 1
-                else:
-                    self.worker.add_task((fun, (next_node_id, fid, data, next_node.options)))
-                    nb_tasks += 1
         else:
             current_node.nb_fail += 1
 
@@ -754,9 +1057,6 @@ class MultiWidget(QWidget):
             else:
                 current_node.state = MultiNode.PARTIAL_FAIL
             current_node.update()
-        QApplication.processEvents()
-
-        return nb_tasks
 
 
 if __name__ == '__main__':
@@ -776,3 +1076,7 @@ if __name__ == '__main__':
     QApp = QCoreApplication.instance()
     QApp = QApplication(sys.argv)
     cmd = MultiWidget(project_path=args.workspace, ncsize=args.ncsize)
+    cmd.run_finished.connect(QApp.quit)
+    if cmd.run():
+        QApp.exec_()
+    cmd.worker.shutdown()
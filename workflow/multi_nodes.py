@@ -234,7 +234,9 @@ class MultiComputeVolumeNode(MultiDoubleInputNode):
         if not success:
             self.state = MultiNode.NOT_CONFIGURED
             return
-        self.options = (first_var, second_var, sup_volume, suffix, in_source_folder, dir_path, double_name, overwrite)
+        additional_vars = options[8].split(',') if len(options) > 8 and options[8] else []
+        self.options = (first_var, second_var, sup_volume, suffix, in_source_folder, dir_path, double_name, overwrite,
+                        additional_vars)
 
 
 class MultiComputeFluxNode(MultiDoubleInputNode):
@@ -321,6 +323,39 @@ class MultiSynchMaxNode(MultiOneInOneOutNode):
         self.options = (options[0],)
 
 
+class MultiComputeStdNode(MultiOneInOneOutNode):
+    def __init__(self, index):
+        super().__init__(index)
+        self.category = 'Operators'
+        self.label = 'Std'
+
+
+class MultiComputePercentileNode(MultiOneInOneOutNode):
+    def __init__(self, index):
+        super().__init__(index)
+        self.category = 'Operators'
+        self.label = 'Percentile'
+
+    def load(self, options):
+        if not options[0] or not 0 <= float(options[0]) <= 100:
+            self.state = MultiNode.NOT_CONFIGURED
+            return
+        self.options = (float(options[0]),)
+
+
+class MultiComputeExceedanceNode(MultiOneInOneOutNode):
+    def __init__(self, index):
+        super().__init__(index)
+        self.category = 'Operators'
+        self.label = 'Time\nAbove\nThreshold'
+
+    def load(self, options):
+        if not options[0]:
+            self.state = MultiNode.NOT_CONFIGURED
+            return
+        self.options = (float(options[0]),)
+
+
 class MultiSelectFirstFrameNode(MultiOneInOneOutNode):
     def __init__(self, index):
         super().__init__(index)
@@ -8,7 +8,7 @@ from slf import Serafin
 from slf.datatypes import CSVData
 from slf.flux import TriangularVectorField, FluxCalculator
 from slf.interpolation import MeshInterpolator
-from slf.volume import TruncatedTriangularPrisms, VolumeCalculator
+from slf.volume import MultiVolumeCalculator, TruncatedTriangularPrisms, VolumeCalculator
 from workflow.Node import Node, OneInOneOutNode, TwoInOneOutNode, DoubleInputNode
 from workflow.util import OutputOptionPanel, process_output_options, validate_output_options
 
@@ -311,11 +311,13 @@ class ComputeVolumeNode(TwoInOneOutNode):
         self.first_var = None
         self.second_var = None
         self.sup_volume = False
+        self.additional_vars = []
         self.new_options = tuple()
 
         self.first_var_box = None
         self.second_var_box = None
         self.sup_volume_box = None
+        self.additional_var_list = None
 
         self.suffix = '_volume'
         self.in_source_folder = True
@@ -333,6 +335,8 @@ class ComputeVolumeNode(TwoInOneOutNode):
         self.second_var_box.setMaximumWidth(300)
 
         self.sup_volume_box = QCheckBox('Compute positive and negative volumes (slow)', None)
+        self.additional_var_list = QListWidget()
+        self.additional_var_list.setMaximumWidth(300)
 
         self.second_var_box.addItem('0')
         self.second_var_box.addItem('Initial values of the first variable')
@@ -343,6 +347,10 @@ class ComputeVolumeNode(TwoInOneOutNode):
                 continue
             self.first_var_box.addItem(var_ID + ' (%s)' % var_name.decode('utf-8').strip())
             self.second_var_box.addItem(var_ID + ' (%s)' % var_name.decode('utf-8').strip())
+            item = QListWidgetItem(var_ID + ' (%s)' % var_name.decode('utf-8').strip())
+            item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
+            item.setCheckState(Qt.Checked if var_ID in self.additional_vars else Qt.Unchecked)
+            self.additional_var_list.addItem(item)
         if self.first_var is not None:
             self.first_var_box.setCurrentIndex(available_vars.index(self.first_var))
         if self.second_var is not None:
@@ -361,6 +369,8 @@ class ComputeVolumeNode(TwoInOneOutNode):
         glayout.addWidget(self.second_var_box, 2, 2)
         glayout.addWidget(QLabel('     Positive / negative volumes'), 3, 1)
         glayout.addWidget(self.sup_volume_box, 3, 2)
+        glayout.addWidget(QLabel('     Additional variables (computed in the same pass)'), 4, 1)
+        glayout.addWidget(self.additional_var_list, 4, 2)
         hlayout.addLayout(glayout)
         hlayout.addWidget(self.output_panel)
         option_panel.setLayout(hlayout)
@@ -377,7 +387,14 @@ class ComputeVolumeNode(TwoInOneOutNode):
         else:
             second_var = VolumeCalculator.INIT_VALUE
         sup_volume = self.sup_volume_box.isChecked()
-        self.new_options = (first_var, second_var, sup_volume)
+        additional_vars = []
+        for i in range(self.additional_var_list.count()):
+            item = self.additional_var_list.item(i)
+            if item.checkState() == Qt.Checked:
+                var_ID = item.text().split('(')[0][:-1]
+                if var_ID != first_var:
+                    additional_vars.append(var_ID)
+        self.new_options = (first_var, second_var, sup_volume, additional_vars)
 
     def _reset(self):
         self.in_data = self.first_in_port.mother.parentItem().data
@@ -398,6 +415,9 @@ class ComputeVolumeNode(TwoInOneOutNode):
             if self.second_var not in available_vars:
                 self.second_var = None
                 self.state = Node.NOT_CONFIGURED
+        if not all(var_ID in available_vars for var_ID in self.additional_vars):
+            self.additional_vars = [var_ID for var_ID in self.additional_vars if var_ID in available_vars]
+            self.state = Node.NOT_CONFIGURED
         self.reconfigure_downward()
         self.update()
 
@@ -462,7 +482,7 @@ class ComputeVolumeNode(TwoInOneOutNode):
         self.output_panel = OutputOptionPanel(old_options)
 
         if super().configure(self.output_panel.check):
-            self.first_var, self.second_var, self.sup_volume = self.new_options
+            self.first_var, self.second_var, self.sup_volume, self.additional_vars = self.new_options
             self.suffix, self.in_source_folder, self.dir_path, \
             self.double_name, self.overwrite = self.output_panel.get_options()
             self.reconfigure_downward()
@@ -474,11 +494,14 @@ class ComputeVolumeNode(TwoInOneOutNode):
                          str(self.pos().x()), str(self.pos().y()),
                          first, second, str(int(self.sup_volume)), self.suffix,
                          str(int(self.in_source_folder)), self.dir_path,
-                         str(int(self.double_name)), str(int(self.overwrite))])
+                         str(int(self.double_name)), str(int(self.overwrite)),
+                         ','.join(self.additional_vars)])
 
     def load(self, options):
         first, second, sup = options[0:3]
         success, (suffix, in_source_folder, dir_path, double_name, overwrite) = validate_output_options(options[3:])
+        if len(options) > 8 and options[8]:
+            self.additional_vars = options[8].split(',')
         if success:
             self.state = Node.READY
             self.suffix, self.in_source_folder, self.dir_path, self.double_name, self.overwrite = \
@@ -516,8 +539,9 @@ class ComputeVolumeNode(TwoInOneOutNode):
             input_stream.header = self.in_data.header
             input_stream.time = self.in_data.time
 
-            calculator = VolumeCalculator(volume_type, self.first_var, self.second_var, input_stream,
-                                          polygon_names, polygons, 1)
+            definitions = [(volume_type, var_ID, second_var_ID) for var_ID, second_var_ID
+                           in [(self.first_var, self.second_var)] + [(var_ID, None) for var_ID in self.additional_vars]]
+            calculator = MultiVolumeCalculator(definitions, input_stream, polygon_names, polygons, 1)
             calculator.time_indices = self.in_data.selected_time_indices
             calculator.mesh = mesh
             calculator.construct_weights()
@@ -527,17 +551,7 @@ class ComputeVolumeNode(TwoInOneOutNode):
                                   'start time': self.in_data.start_time, 'language': self.in_data.language}
 
             for i, time_index in enumerate(calculator.time_indices):
-                i_result = [str(calculator.input_stream.time[time_index])]
-                values = calculator.read_values_in_frame(time_index)
-
-                for j in range(len(calculator.polygons)):
-                    weight = calculator.weights[j]
-                    volume = calculator.volume_in_frame_in_polygon(weight, values, calculator.polygons[j])
-                    if calculator.volume_type == VolumeCalculator.POSITIVE:
-                        for v in volume:
-                            i_result.append(format_string.format(v))
-                    else:
-                        i_result.append(format_string.format(volume))
+                i_result = calculator.run_in_frame(time_index, format_string)
                 self.data.add_row(i_result)
 
                 self.progress_bar.setValue(100 * (i+1) / len(calculator.time_indices))
@@ -553,6 +567,8 @@ class ComputeVolumeNode(TwoInOneOutNode):
             for name in polygon_names:
                 headers.append(name + ' POSITIVE')
                 headers.append(name + ' NEGATIVE')
+        for var_ID in self.additional_vars:
+            headers.extend('%s %s' % (var_ID, name) for name in polygon_names)
         if not all(h in self.data.table[0] for h in headers):
             return False
         return True
@@ -566,22 +582,21 @@ class ComputeVolumeNode(TwoInOneOutNode):
         self.in_data = self.first_in_port.mother.parentItem().data
         filename = process_output_options(self.in_data.filename, self.in_data.job_id, '.csv',
                                           self.suffix, self.in_source_folder, self.dir_path, self.double_name)
-        if not self.overwrite:
-            if os.path.exists(filename):
-                try:
-                    with open(filename, 'r') as f:
-                        pass
-                except PermissionError:
-                    self.fail('Access denied when reloading existing file.')
-                self.data = CSVData(self.in_data.filename, None, filename, self.scene().csv_separator)
-                if not self.is_valid_csv():
-                    self.data = None
-                    self.fail('The existing file is not valid.')
-                    return 
-                self.data.metadata = {'var': self.first_var, 'second var': self.second_var,
-                                      'start time': self.in_data.start_time, 'language': self.in_data.language}
-                self.success('Reload existing file.')
-                return
+        if self.reuse_output(filename):
+            try:
+                with open(filename, 'r') as f:
+                    pass
+            except PermissionError:
+                self.fail('Access denied when reloading existing file.')
+            self.data = CSVData(self.in_data.filename, None, filename, self.scene().csv_separator)
+            if not self.is_valid_csv():
+                self.data = None
+                self.fail('The existing file is not valid.')
+                return 
+            self.data.metadata = {'var': self.first_var, 'second var': self.second_var,
+                                  'start time': self.in_data.start_time, 'language': self.in_data.language}
+            self.success('Reload existing file.')
+            return
         try:
             with open(filename, 'w') as f:
                 pass
@@ -591,6 +606,7 @@ class ComputeVolumeNode(TwoInOneOutNode):
 
         self._run_volume()
         self.data.write(filename, self.scene().csv_separator)
+        self.record_output(filename)
         self.success('Output saved to %s' % filename)
 
 
@@ -828,26 +844,19 @@ class ComputeFluxNode(TwoInOneOutNode):
             input_stream.header = self.in_data.header
             input_stream.time = self.in_data.time
 
-            calculator = FluxCalculator(flux_type, var_IDs, input_stream, section_names, sections, 1)
+            calculator = FluxCalculator(flux_type, var_IDs, input_stream, section_names, sections, 1,
+                                        cumulative=True)
             calculator.time_indices = self.in_data.selected_time_indices
             calculator.mesh = mesh
             calculator.construct_intersections()
 
-            self.data = CSVData(self.in_data.filename, ['time'] + section_names)
+            self.data = CSVData(self.in_data.filename, calculator.get_csv_header())
             self.data.metadata = {'flux title': self.flux_options,
                                   'language': self.in_data.language, 'start time': self.in_data.start_time,
                                   'var IDs': var_IDs}
 
             for i, time_index in enumerate(calculator.time_indices):
-                i_result = [str(calculator.input_stream.time[time_index])]
-                values = []
-                for var_ID in calculator.var_IDs:
-                    values.append(calculator.input_stream.read_var_in_frame(time_index, var_ID))
-
-                for j in range(len(calculator.sections)):
-                    intersections = calculator.intersections[j]
-                    flux = calculator.flux_in_frame(intersections, values)
-                    i_result.append(format_string.format(flux))
+                i_result = calculator.run_in_frame(time_index, format_string)
                 self.data.add_row(i_result)
 
                 self.progress_bar.setValue(100 * (i+1) / len(calculator.time_indices))
@@ -872,23 +881,22 @@ class ComputeFluxNode(TwoInOneOutNode):
         self.in_data = self.first_in_port.mother.parentItem().data
         filename = process_output_options(self.in_data.filename, self.in_data.job_id, '.csv',
                                           self.suffix, self.in_source_folder, self.dir_path, self.double_name)
-        if not self.overwrite:
-            if os.path.exists(filename):
-                try:
-                    with open(filename, 'r') as f:
-                        pass
-                except PermissionError:
-                    self.fail('Access denied when reloading existing file.')
-                self.data = CSVData(self.in_data.filename, None, filename, self.scene().csv_separator)
-                if not self.is_valid_csv():
-                    self.data = None
-                    self.fail('The existing file is not valid.')
-                    return 
-                self.data.metadata = {'flux title': self.flux_options,
-                                      'language': self.in_data.language, 'start time': self.in_data.start_time,
-                                      'var IDs': list(self.flux_options.split(':')[1].split('(')[1][:-1].split(', '))}
-                self.success('Reload existing file.')
-                return
+        if self.reuse_output(filename):
+            try:
+                with open(filename, 'r') as f:
+                    pass
+            except PermissionError:
+                self.fail('Access denied when reloading existing file.')
+            self.data = CSVData(self.in_data.filename, None, filename, self.scene().csv_separator)
+            if not self.is_valid_csv():
+                self.data = None
+                self.fail('The existing file is not valid.')
+                return 
+            self.data.metadata = {'flux title': self.flux_options,
+                                  'language': self.in_data.language, 'start time': self.in_data.start_time,
+                                  'var IDs': list(self.flux_options.split(':')[1].split('(')[1][:-1].split(', '))}
+            self.success('Reload existing file.')
+            return
         try:
             with open(filename, 'w') as f:
                 pass
@@ -898,6 +906,7 @@ class ComputeFluxNode(TwoInOneOutNode):
         
         self._run_flux()
         self.data.write(filename, self.scene().csv_separator)
+        self.record_output(filename)
         self.success('Output saved to %s' % filename)
 
 
@@ -1042,24 +1051,23 @@ class InterpolateOnPointsNode(TwoInOneOutNode):
         filename = process_output_options(self.in_data.filename, self.in_data.job_id, '.csv',
                                           self.suffix, self.in_source_folder, self.dir_path, self.double_name)
 
-        if not self.overwrite:
-            if os.path.exists(filename):
-                try:
-                    with open(filename, 'r') as f:
-                        pass
-                except PermissionError:
-                    self.fail('Access denied when reloading existing file.')
-
-                self.data = CSVData(self.in_data.filename, None, filename, self.scene().csv_separator)
-                points = self.second_in_port.mother.parentItem().data
-                if not self.is_valid_csv(points.points, selected_vars):
-                    self.data = None
-                    self.fail('The existing file is not valid.')
-                    return 
-                self.data.metadata = {'start time': self.in_data.start_time, 'var IDs': selected_vars,
-                                      'language': self.in_data.language, 'points': points}
-                self.success('Reload existing file.')
-                return
+        if self.reuse_output(filename):
+            try:
+                with open(filename, 'r') as f:
+                    pass
+            except PermissionError:
+                self.fail('Access denied when reloading existing file.')
+
+            self.data = CSVData(self.in_data.filename, None, filename, self.scene().csv_separator)
+            points = self.second_in_port.mother.parentItem().data
+            if not self.is_valid_csv(points.points, selected_vars):
+                self.data = None
+                self.fail('The existing file is not valid.')
+                return 
+            self.data.metadata = {'start time': self.in_data.start_time, 'var IDs': selected_vars,
+                                  'language': self.in_data.language, 'points': points}
+            self.success('Reload existing file.')
+            return
 
         points, point_interpolators, indices_inside, nb_inside = self._prepare_points()
         if nb_inside == 0:
@@ -1074,6 +1082,7 @@ class InterpolateOnPointsNode(TwoInOneOutNode):
 
         self._run_interpolate(points, point_interpolators, indices_inside, selected_vars)
         self.data.write(filename, self.scene().csv_separator)
+        self.record_output(filename)
         self.success('Output saved to {}\n{} point{} inside the mesh.'.format(filename, nb_inside,
                                                                               's are' if nb_inside > 1 else ' is'))
 
@@ -1176,10 +1185,9 @@ class InterpolateAlongLinesNode(DoubleInputNode):
         filename = process_output_options(self.in_data.filename, self.in_data.job_id, '.csv',
                                           self.suffix, self.in_source_folder, self.dir_path, self.double_name)
 
-        if not self.overwrite:
-            if os.path.exists(filename):
-                self.success('File already exists.')
-                return
+        if self.reuse_output(filename):
+            self.success('File already exists.')
+            return
         try:
             with open(filename, 'w') as f:
                 pass
@@ -1190,6 +1198,7 @@ class InterpolateAlongLinesNode(DoubleInputNode):
         success, message = self._run_interpolate(selected_vars)
         if success:
             self.data.write(filename, self.scene().csv_separator)
+            self.record_output(filename)
             self.success('Output saved to %s\n' % filename + message)
         else:
             try:
@@ -1334,10 +1343,9 @@ class ProjectLinesNode(DoubleInputNode):
         filename = process_output_options(input_data.filename, input_data.job_id, '.csv',
                                           self.suffix, self.in_source_folder, self.dir_path, self.double_name)
 
-        if not self.overwrite:
-            if os.path.exists(filename):
-                self.success('File already exists.')
-                return
+        if self.reuse_output(filename):
+            self.success('File already exists.')
+            return
         try:
             with open(filename, 'w') as f:
                 pass
@@ -1393,6 +1401,7 @@ class ProjectLinesNode(DoubleInputNode):
                 QApplication.processEvents()
 
         self.data.write(filename, self.scene().csv_separator)
+        self.record_output(filename)
         self.success('Output saved to %s\n{} line{} the mesh continuously.'.format(filename, nb_nonempty,
                                                                                    's intersect' if nb_nonempty > 1
                                                                                    else ' intersects'))
@@ -1,16 +1,15 @@
-import numpy as np
 import os
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 import struct
 
-from conf.settings import SERAFIN_EXT
+from conf.settings import NCSIZE, SERAFIN_EXT
 from geom import BlueKenue, Shapefile
 from slf.datatypes import SerafinData, PointData, PolylineData
 from slf.interpolation import MeshInterpolator
 import slf.misc as operations
 from slf import Serafin
-from slf.variables import do_calculations_in_frame
+from slf.variables import CalculationPlan
 from workflow.Node import Node, SingleInputNode, SingleOutputNode, OneInOneOutNode
 from workflow.util import LoadSerafinDialog, logger, OutputOptionPanel, GeomOutputOptionPanel, VtkOutputOptionPanel, \
                           process_output_options, process_geom_output_options, process_vtk_output_options, \
@@ -57,6 +56,9 @@ class LoadSerafin2DNode(SingleOutputNode):
             return
         self.state = Node.READY
 
+    def input_files(self):
+        return [os.path.join(self.dir_path, self.slf_name)]
+
     def run(self):
         if self.state == Node.SUCCESS:
             return
@@ -132,10 +134,10 @@ class WriteSerafinNode(OneInOneOutNode):
             input_stream.time = input_data.time
             with Serafin.Write(self.filename, input_data.language) as output_stream:
                 output_stream.write_header(output_header)
+                plan = CalculationPlan(input_data.equations, input_data.header, input_data.selected_vars,
+                                       output_header.np_float_type, output_header.is_2d, input_data.us_equation)
                 for i, time_index in enumerate(input_data.selected_time_indices):
-                    values = do_calculations_in_frame(input_data.equations, input_stream, time_index,
-                                                      input_data.selected_vars, output_header.np_float_type,
-                                                      is_2d=output_header.is_2d, us_equation=input_data.us_equation)
+                    values = plan.run_in_frame(input_stream, time_index)
                     output_stream.write_entire_frame(output_header, input_data.time[time_index], values)
 
                     self.progress_bar.setValue(100 * (i+1) / len(input_data.selected_time_indices))
@@ -143,6 +145,13 @@ class WriteSerafinNode(OneInOneOutNode):
         self.success('Output saved to {}.'.format(self.filename))
         return True
 
+    def _run_reduction(self, input_stream, specs, time_indices):
+        reduction = operations.TimeRangeReduction(input_stream, specs, time_indices, NCSIZE)
+        for i, _ in enumerate(reduction.run()):
+            self.progress_bar.setValue(100 * (i+1) / reduction.nb_ranges)
+            QApplication.processEvents()
+        return reduction.finishing_up()
+
     def _run_max_min_mean(self, input_data):
         selected = [(var, input_data.selected_vars_names[var][0],
                           input_data.selected_vars_names[var][1]) for var in input_data.selected_vars]
@@ -162,34 +171,58 @@ class WriteSerafinNode(OneInOneOutNode):
         with Serafin.Read(input_data.filename, input_data.language) as input_stream:
             input_stream.header = input_data.header
             input_stream.time = input_data.time
-            has_scalar, has_vector = False, False
-            scalar_calculator, vector_calculator = None, None
+            specs = []
             if scalars:
-                has_scalar = True
-                scalar_calculator = operations.ScalarMaxMinMeanCalculator(input_data.operator, input_stream,
-                                                                          scalars, input_data.selected_time_indices,
-                                                                          additional_equations)
+                specs.append((operations.ScalarMaxMinMeanCalculator,
+                              {'max_min_type': input_data.operator, 'selected_scalars': scalars,
+                               'additional_equations': additional_equations}))
             if vectors:
-                has_vector = True
-                vector_calculator = operations.VectorMaxMinMeanCalculator(input_data.operator, input_stream,
-                                                                          vectors, input_data.selected_time_indices,
-                                                                          additional_equations)
-            for i, time_index in enumerate(input_data.selected_time_indices):
-
-                if has_scalar:
-                    scalar_calculator.max_min_mean_in_frame(time_index)
-                if has_vector:
-                    vector_calculator.max_min_mean_in_frame(time_index)
-
-                self.progress_bar.setValue(100 * (i+1) / len(input_data.selected_time_indices))
-                QApplication.processEvents()
-
-            if has_scalar and not has_vector:
-                values = scalar_calculator.finishing_up()
-            elif not has_scalar and has_vector:
-                values = vector_calculator.finishing_up()
+                specs.append((operations.VectorMaxMinMeanCalculator,
+                              {'max_min_type': input_data.operator, 'selected_vectors': vectors,
+                               'additional_equations': additional_equations}))
+            values = self._run_reduction(input_stream, specs, input_data.selected_time_indices)
+
+            with Serafin.Write(self.filename, input_data.language) as output_stream:
+                output_stream.write_header(output_header)
+                output_stream.write_entire_frame(output_header, input_data.time[0], values)
+        self.success('Output saved to {}.'.format(self.filename))
+        return True
+
+    def _run_statistics(self, input_data):
+        selected = [(var, input_data.selected_vars_names[var][0],
+                          input_data.selected_vars_names[var][1]) for var in input_data.selected_vars]
+        scalars, vectors, additional_equations = operations.scalars_vectors(input_data.header.var_IDs,
+                                                                            selected,
+                                                                            input_data.us_equation)
+        variables = scalars + vectors  # the vector components are processed separately
+        output_header = input_data.header.copy()
+        output_header.nb_var = len(variables)
+        output_header.var_IDs, output_header.var_names, output_header.var_units = [], [], []
+        for var_ID, var_name, var_unit in variables:
+            output_header.var_IDs.append(var_ID)
+            output_header.var_names.append(var_name)
+            if input_data.operator == operations.EXCEEDANCE:
+                output_header.var_units.append(bytes('S', 'utf-8').ljust(16))
             else:
-                values = np.vstack((scalar_calculator.finishing_up(), vector_calculator.finishing_up()))
+                output_header.var_units.append(var_unit)
+        if input_data.to_single:
+            output_header.to_single_precision()
+
+        with Serafin.Read(input_data.filename, input_data.language) as input_stream:
+            input_stream.header = input_data.header
+            input_stream.time = input_data.time
+            if input_data.operator == operations.STD:
+                specs = [(operations.ScalarStdCalculator, {'selected_scalars': variables,
+                                                           'additional_equations': additional_equations})]
+            elif input_data.operator == operations.PERCENTILE:
+                specs = [(operations.ScalarPercentileCalculator, {'selected_scalars': variables,
+                                                                  'percentile': input_data.metadata['percentile'],
+                                                                  'additional_equations': additional_equations})]
+            else:
+                specs = [(operations.ScalarExceedanceCalculator, {'selected_scalars': variables,
+                                                                  'threshold': input_data.metadata['threshold'],
+                                                                  'additional_equations': additional_equations})]
+            values = self._run_reduction(input_stream, specs, input_data.selected_time_indices)
 
             with Serafin.Write(self.filename, input_data.language) as output_stream:
                 output_stream.write_header(output_header)
@@ -210,21 +243,12 @@ class WriteSerafinNode(OneInOneOutNode):
         if input_data.to_single:
             output_header.to_single_precision()
 
-        nb_frames = len(input_data.selected_time_indicies)
         with Serafin.Read(input_data.filename, input_data.language) as input_stream:
             input_stream.header = input_data.header
             input_stream.time = input_data.time
-
-            calculator = operations.SynchMaxCalculator(input_stream, selected_vars, input_data.selected_time_indicies,
-                                                       input_data.metadata['var'])
-
-            for i, time_index in enumerate(input_data.selected_time_indicies[1:]):
-                calculator.synch_max_in_frame(time_index)
-
-                self.progress_bar.setValue(100 * (i+1) / nb_frames)
-                QApplication.processEvents()
-
-            values = calculator.finishing_up()
+            specs = [(operations.SynchMaxCalculator, {'selected_vars': selected_vars,
+                                                      'ref_var': input_data.metadata['var']})]
+            values = self._run_reduction(input_stream, specs, input_data.selected_time_indices)
             with Serafin.Write(self.filename, input_data.language) as output_stream:
                 output_stream.write_header(output_header)
                 output_stream.write_entire_frame(output_header, input_data.time[0], values)
@@ -251,22 +275,8 @@ class WriteSerafinNode(OneInOneOutNode):
         with Serafin.Read(input_data.filename, input_data.language) as input_stream:
             input_stream.header = input_data.header
             input_stream.time = input_data.time
-            calculators = []
-
-            for i, condition in enumerate(conditions):
-                calculators.append(operations.ArrivalDurationCalculator(input_stream, input_data.selected_time_indices,
-                                                                        condition))
-            for i, index in enumerate(input_data.selected_time_indices[1:]):
-                for calculator in calculators:
-                    calculator.arrival_duration_in_frame(index)
-
-                self.progress_bar.setValue(100 * (i+1) / len(input_data.selected_time_indices))
-                QApplication.processEvents()
-
-            values = np.empty((2*len(conditions), input_data.header.nb_nodes))
-            for i, calculator in enumerate(calculators):
-                values[2*i, :] = calculator.arrival
-                values[2*i+1, :] = calculator.duration
+            specs = [(operations.MultiArrivalDurationCalculator, {'conditions': conditions})]
+            values = self._run_reduction(input_stream, specs, input_data.selected_time_indices)
 
             if time_unit == 'minute':
                 values /= 60
@@ -383,23 +393,22 @@ class WriteSerafinNode(OneInOneOutNode):
         self.filename = process_output_options(input_data.filename, input_data.job_id,
                                                os.path.splitext(input_data.filename)[1],
                                                self.suffix, self.in_source_folder, self.dir_path, self.double_name)
-        if not self.overwrite:
-            if os.path.exists(self.filename):
-                try:
-                    with open(self.filename, 'r') as f:
-                        pass
-                except PermissionError:
-                    self.fail('Access denied when reloading existing file.')
-                    return
+        if self.reuse_output(self.filename):
+            try:
+                with open(self.filename, 'r') as f:
+                    pass
+            except PermissionError:
+                self.fail('Access denied when reloading existing file.')
+                return
 
-                try:
-                    self.data = SerafinData(input_data.job_id, self.filename, input_data.language)
-                    self.data.read()
-                except (Serafin.SerafinRequestError, Serafin.SerafinValidationError) as e:
-                    self.fail(e.message)
-                    return
-                self.success('Reload existing file.')
+            try:
+                self.data = SerafinData(input_data.job_id, self.filename, input_data.language)
+                self.data.read()
+            except (Serafin.SerafinRequestError, Serafin.SerafinValidationError) as e:
+                self.fail(e.message)
                 return
+            self.success('Reload existing file.')
+            return
 
         try:
             with open(self.filename, 'w') as f:
@@ -421,12 +430,15 @@ class WriteSerafinNode(OneInOneOutNode):
                 success = self._run_project_mesh(input_data)
             elif input_data.operator == operations.SYNCH_MAX:
                 success = self._run_synch_max(input_data)
+            elif input_data.operator in (operations.STD, operations.PERCENTILE, operations.EXCEEDANCE):
+                success = self._run_statistics(input_data)
             else:
                 success = self._run_arrival_duration(input_data)
 
             if success:  # reload the output file
                 self.data = SerafinData(input_data.job_id, self.filename, input_data.language)
                 self.data.read()
+                self.record_output(self.filename)
         except (Serafin.SerafinRequestError, Serafin.SerafinValidationError) as e:
             self.fail(e.message)
             return
@@ -809,6 +821,9 @@ class LoadSerafin3DNode(SingleOutputNode):
             return
         self.state = Node.READY
 
+    def input_files(self):
+        return [os.path.join(self.dir_path, self.slf_name)]
+
     def run(self):
         if self.state == Node.SUCCESS:
             return
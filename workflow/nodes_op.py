@@ -1144,6 +1144,132 @@ class ComputeMeanNode(UnaryOperatorNode):
         self.success()
 
 
+class ComputeStdNode(UnaryOperatorNode):
+    def __init__(self, index):
+        super().__init__(index)
+        self.category = 'Operators'
+        self.label = 'Std'
+
+    def run(self):
+        success = super().run_upward()
+        if not success:
+            self.fail('input failed.')
+            return
+        input_data = self.in_port.mother.parentItem().data
+        if not input_data.header.is_2d:
+            self.fail('the input file is not 2D')
+            return
+        if len(input_data.selected_time_indices) == 1:
+            self.fail('the input data must have more than one frame')
+            return
+
+        self.data = input_data.copy()
+        self.data.operator = operations.STD
+        self.success()
+
+
+class ParametricOperatorNode(OneInOneOutNode):
+    """!
+    Temporal statistic with a single numerical parameter
+    """
+    def __init__(self, index, operator, parameter_name, parameter_label):
+        super().__init__(index)
+        self.category = 'Operators'
+        self.out_port.data_type = ('slf out',)
+        self.in_port.data_type = ('slf',)
+        self.data = None
+
+        self.operator = operator
+        self.parameter_name = parameter_name
+        self.parameter_label = parameter_label
+        self.parameter = None
+        self.parameter_box = None
+
+    def is_valid(self, value):
+        return True
+
+    def get_option_panel(self):
+        self.parameter_box = QLineEdit()
+        self.parameter_box.setFixedHeight(30)
+        if self.parameter is not None:
+            self.parameter_box.setText(str(self.parameter))
+
+        option_panel = QWidget()
+        layout = QVBoxLayout()
+        layout.addSpacerItem(QSpacerItem(10, 10))
+        hlayout = QHBoxLayout()
+        hlayout.addWidget(QLabel(self.parameter_label))
+        hlayout.addWidget(self.parameter_box)
+        layout.addLayout(hlayout)
+        option_panel.setLayout(layout)
+        return option_panel
+
+    def _check(self):
+        try:
+            value = float(self.parameter_box.text())
+        except ValueError:
+            QMessageBox.critical(None, 'Error', 'The %s must be a number.' % self.parameter_name, QMessageBox.Ok)
+            return 1
+        if not self.is_valid(value):
+            QMessageBox.critical(None, 'Error', 'Invalid %s.' % self.parameter_name, QMessageBox.Ok)
+            return 1
+        self.parameter = value
+        return 2
+
+    def reconfigure(self):
+        super().reconfigure()
+        self.reconfigure_downward()
+
+    def configure(self, check=None):
+        if super().configure(self._check):
+            self.reconfigure_downward()
+
+    def save(self):
+        return '|'.join([self.category, self.name(), str(self.index()),
+                         str(self.pos().x()), str(self.pos().y()),
+                         '' if self.parameter is None else str(self.parameter)])
+
+    def load(self, options):
+        if options[0]:
+            value = float(options[0])
+            if self.is_valid(value):
+                self.parameter = value
+                self.state = Node.READY
+
+    def run(self):
+        success = super().run_upward()
+        if not success:
+            self.fail('input failed.')
+            return
+        input_data = self.in_port.mother.parentItem().data
+        if not input_data.header.is_2d:
+            self.fail('the input file is not 2D')
+            return
+        if len(input_data.selected_time_indices) == 1:
+            self.fail('the input data must have more than one frame')
+            return
+
+        self.data = input_data.copy()
+        self.data.operator = self.operator
+        self.data.metadata = {self.parameter_name: self.parameter}
+        self.success()
+
+
+class ComputePercentileNode(ParametricOperatorNode):
+    def __init__(self, index):
+        super().__init__(index, operations.PERCENTILE, 'percentile', 'Percentile (between 0 and 100)')
+        self.label = 'Percentile'
+
+    def is_valid(self, value):
+        return 0 <= value <= 100
+
+
+class ComputeExceedanceNode(ParametricOperatorNode):
+    def __init__(self, index):
+        super().__init__(index, operations.EXCEEDANCE, 'threshold', 'Threshold')
+        self.label = 'Time\nAbove\nThreshold'
+
+
 class MinusNode(BinaryOperatorNode):
     def __init__(self, index):
         super().__init__(index, operations.DIFF)
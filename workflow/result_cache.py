@@ -0,0 +1,89 @@
+"""!
+Content-addressed cache of the output files written by the workflow tasks
+"""
+
+import hashlib
+import json
+import os
+
+
+def file_identity(filename):
+    """!
+    @brief Identify a file by its absolute path, its size and its modification time
+    @param filename <str>: path of the file
+    @return <[str, int, int]>: the identity of the file, None if the file does not exist
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+
+def task_key(node_name, options, parent_keys=(), filenames=()):
+    """!
+    @brief Hash everything the result of a node depends on
+
+    The option values naming an existing file (polygons, transformations, ...) are keyed by the identity of the file.
+    @param node_name <str>: name of the node
+    @param options <[str]>: options of the node, as saved in the project file
+    @param parent_keys <[str]>: keys of the upstream nodes, in the order of the input ports
+    @param filenames <[str]>: input files read by the node
+    @return <str>: the key of the node result
+    """
+    options = [str(option) for option in options]
+    identities = [file_identity(filename) for filename in filenames]
+    identities.extend(file_identity(option) for option in options if option and os.path.isfile(option))
+    content = json.dumps([node_name, options, list(parent_keys), identities])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """!
+    @brief Records of the output files written by the workflow tasks, keyed by the hash of the task inputs
+
+    Every record holds the identity of the output file when it was written. The outputs are not copied: a record
+    is valid as long as its output file is unchanged, so that editing a node only invalidates the downstream tasks.
+    """
+    def __init__(self, directory):
+        """!
+        @param directory <str>: directory of the records, created if needed
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _record_path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def is_valid(self, key, filename):
+        """!
+        @brief Check if the output file is recorded under the key and unchanged since
+        @param key <str>: the key of the task
+        @param filename <str>: the output file of the task
+        @return <bool>: True if the output file can be reused
+        """
+        try:
+            with open(self._record_path(key), 'r') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return False
+        identity = file_identity(filename)
+        return identity is not None and record == identity
+
+    def record(self, key, filename):
+        """!
+        @brief Record the output file just written by a task
+        @param key <str>: the key of the task
+        @param filename <str>: the output file of the task
+        """
+        identity = file_identity(filename)
+        if identity is None:
+            return
+        path = self._record_path(key)
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump(identity, f)
+            os.replace(temp_path, path)  # never leave a partial record
+        except OSError:
+            pass
@@ -19,6 +19,7 @@ from conf.settings import COLOR_SYLES, DEFAULT_COLOR_STYLE, FIG_OUT_DPI, FIG_SIZ
 from gui.util import FluxPlotViewer, MapCanvas, PointLabelEditor, PointPlotViewer, PlotViewer, \
     read_csv, SimpleTimeDateSelection, TemporalPlotViewer, VolumePlotViewer
 from slf.datatypes import SerafinData
+from slf.flux import FluxCalculator
 from slf.interpolation import MeshInterpolator
 from slf import Serafin
 
@@ -799,7 +800,7 @@ class SimpleFluxPlotViewer(FluxPlotViewer):
         self.str_datetime = list(map(lambda x: x.strftime('%Y/%m/%d\n%H:%M'), self.datetime))
         self.str_datetime_bis = list(map(lambda x: x.strftime('%d/%m/%y\n%H:%M'), self.datetime))
 
-        self.columns = list(self.data)[1:]
+        self.columns = FluxCalculator.section_columns(header)
         self.column_labels = {x: x for x in self.columns}
         self.column_colors = {x: None for x in self.columns}
         for i in range(min(len(self.columns), len(self.defaultColors))):